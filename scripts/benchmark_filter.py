@@ -0,0 +1,123 @@
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from Dataset import Dataset  # noqa: E402
+from GridIndex import GridIndex  # noqa: E402
+
+SOURCES = ["NASA7", "NASA6", "NASA_VIIRS", "NOAA", "UMD", "AFFES"]
+FUELS = ["C1", "C2", "C3", "C4", "C7", "D1", "M1", "M2", "O1a", "O1b", "S1", "non-fuel", "water"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare Dataset.filter with the plain boolean mask chain")
+    parser.add_argument("--rows", type=int, default=5_000_000, help="Number of synthetic hotspots")
+    parser.add_argument("--days", type=int, default=365, help="Number of days covered")
+    parser.add_argument("--repeat", type=int, default=20, help="Number of random queries")
+    return parser.parse_args()
+
+
+def synthetic_hotspots(rows: int, days: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2023-04-01T00:00:00", "s")
+    return pd.DataFrame({
+        "lat": rng.uniform(42, 68, rows),
+        "lon": rng.uniform(-140, -55, rows),
+        "rep_date": start + rng.integers(0, days * 86400, rows).astype("timedelta64[s]"),
+        "source": pd.Categorical(rng.choice(SOURCES, rows)),
+        "fuel": pd.Categorical(rng.choice(FUELS, rows)),
+        "estarea": rng.gamma(1, 0.5, rows).astype("float32"),
+        "fwi": rng.gamma(2, 5, rows).astype("float32"),
+    })
+
+
+def mask_chain_filter(df: pd.DataFrame, min_date, max_date, sources, fuels, bounds=None) -> pd.DataFrame:
+    """
+    Dataset.filter before the sorted date index and the grid index
+    """
+    df = df[df["rep_date"] >= min_date]
+    df = df[df["rep_date"] <= max_date]
+    df = df[df["source"].isin(sources)]
+    df = df[df["fuel"].isin(fuels)]
+    if bounds is not None:
+        min_lat, max_lat, min_lon, max_lon = bounds
+        df = df[df["lat"].between(min_lat, max_lat) & df["lon"].between(min_lon, max_lon)]
+    return df
+
+
+def timed(fn, *args) -> tuple[float, int]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, len(result)
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(1)
+
+    print(f"Generating {args.rows:,} hotspots over {args.days} days...")
+    df = synthetic_hotspots(args.rows, args.days)
+    start = time.perf_counter()
+    dataset = Dataset.from_df(df)
+    print(f"Sorting and indexing: {time.perf_counter() - start:.3f}s")
+
+    lat, lon = dataset.df["lat"].to_numpy(), dataset.df["lon"].to_numpy()
+    start = time.perf_counter()
+    GridIndex(lat, lon)
+    print(f"Grid index: {time.perf_counter() - start:.3f}s, "
+          f"{dataset.grid_index.nbytes / 2**20:.1f} MB "
+          f"({dataset.grid_index.nbytes / dataset.df.memory_usage(deep=True).sum():.1%} of the data)")
+
+    queries = []
+    for i in range(args.repeat):
+        lo, hi = sorted(rng.integers(0, args.days, 2))
+        min_date = datetime(2023, 4, 1) + timedelta(days=int(lo))
+        max_date = datetime(2023, 4, 1) + timedelta(days=int(hi))
+        # alternate between the default (everything checked) and a partial selection
+        if i % 2 == 0:
+            sources, fuels = dataset.source_types, dataset.fuel_types
+        else:
+            sources = list(rng.choice(SOURCES, 3, replace=False))
+            fuels = list(rng.choice(FUELS, 6, replace=False))
+        queries.append((min_date, max_date, sources, fuels, None))
+
+    # the same queries limited to a province sized viewport
+    bounds = [49.0, 60.0, -120.0, -110.0]
+    run(df, dataset, queries, "date and categories")
+    run(df, dataset, [query[:4] + (bounds,) for query in queries], "with viewport bounds")
+
+    # a single day at country zoom: the maps send their bounds after every relayout, and the
+    # cells under the view hold many more rows than the day
+    country = [30.0, 75.0, -150.0, -45.0]
+    days = [query[0].replace(hour=0) for query in queries]
+    run(df, dataset, [(day, day + timedelta(days=1) - timedelta(microseconds=1)) + query[2:4] + (bounds,)
+                      for day, query in zip(days, queries)], "one day")
+    run(df, dataset, [(day, day + timedelta(days=1) - timedelta(microseconds=1)) + query[2:4] + (country,)
+                      for day, query in zip(days, queries)], "one day with country bounds")
+
+
+def run(df: pd.DataFrame, dataset: Dataset, queries: list, title: str):
+    totals = {"mask chain": 0.0, "Dataset.filter": 0.0}
+    for query in queries:
+        t, n_mask = timed(mask_chain_filter, df, *query)
+        totals["mask chain"] += t
+        min_date, max_date, sources, fuels, bounds = query
+        t, n_index = timed(lambda: dataset.filter(min_date=min_date, max_date=max_date, sources=sources, fuels=fuels,
+                                                  bounds=bounds))
+        totals["Dataset.filter"] += t
+        assert n_mask == n_index, f"row count mismatch: {n_mask} != {n_index}"
+
+    print(f"{title}:")
+    for name, total in totals.items():
+        print(f"{name:>15}: {total / len(queries) * 1000:8.2f} ms/query")
+    print(f"{'speedup':>15}: {totals['mask chain'] / totals['Dataset.filter']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
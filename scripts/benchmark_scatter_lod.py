@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import plotly.express as px
+from plotly.utils import PlotlyJSONEncoder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from benchmark_filter import synthetic_hotspots  # noqa: E402
+from Dataset import Dataset  # noqa: E402
+from Selection import Selection  # noqa: E402
+from components.scatter_mapbox import NORTH_AMERICA_MAPBOX_SETTINGS, scatter_figure  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare scatter mapbox level-of-detail rendering with plotting every point")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of synthetic hotspots")
+    parser.add_argument("--days", type=int, default=180, help="Number of days covered")
+    return parser.parse_args()
+
+
+def full_resolution_figure(dataset: Dataset, value_col: str, color_col: str, date_range: list[int]):
+    """
+    scatter_mapbox.update before level of detail
+    """
+    min_date = datetime.fromordinal(date_range[0])
+    max_date = datetime.fromordinal(date_range[1])
+    df = dataset.filter(min_date=min_date, max_date=max_date)
+    return px.scatter_mapbox(df, lat="lat", lon="lon", size=value_col, size_max=20, color=color_col,
+                             **NORTH_AMERICA_MAPBOX_SETTINGS,
+                             mapbox_style="open-street-map")
+
+
+def measure(name: str, build):
+    start = time.perf_counter()
+    fig = build()
+    payload = json.dumps(fig, cls=PlotlyJSONEncoder)
+    elapsed = time.perf_counter() - start
+    points = sum(len(trace.lat) for trace in fig.data)
+    print(f"{name:>28}: {elapsed * 1000:9.1f} ms {len(payload) / 2**20:9.2f} MB {points:>10,} points")
+
+
+def main():
+    args = parse_args()
+    dataset = Dataset.from_df(synthetic_hotspots(args.rows, args.days))
+    date_range = [dataset.min_date.toordinal(), dataset.max_date.toordinal()]
+
+    measure("full resolution", lambda: full_resolution_figure(dataset, "estarea", "fuel", date_range))
+    views = {
+        "lod, country (zoom 3)": {"zoom": 3, "bounds": None},
+        "lod, province (zoom 6)": {"zoom": 6, "bounds": [49, 54, -115, -105]},
+        "lod, fire (zoom 10)": {"zoom": 10, "bounds": [50.6, 50.9, -110.4, -110.0]},
+    }
+    for name, view in views.items():
+        filters = {"date_range": date_range, "sources": dataset.source_types, "fuels": dataset.fuel_types, "bounds": None}
+        measure(name, lambda: scatter_figure(dataset, Selection(dataset, filters), "estarea", "fuel", view))
+
+
+if __name__ == "__main__":
+    main()
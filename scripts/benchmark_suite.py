@@ -0,0 +1,230 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from app import create_app, parse_args as parse_app_args  # noqa: E402
+from DashClient import DashClient  # noqa: E402
+from Dataset import Dataset  # noqa: E402
+from FigureCache import figure_cache  # noqa: E402
+from FrameCache import frame_cache  # noqa: E402
+from JobManager import job_manager  # noqa: E402
+from Selection import selection_cache  # noqa: E402
+from TileStore import TILES_SUFFIX, TileStore  # noqa: E402
+
+from build_tiles import build_dataset_tiles  # noqa: E402
+from combine_csv import combine_csv  # noqa: E402
+from generate_cwfis import generate_cwfis  # noqa: E402
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FROM_DATE = datetime.date(2023, 5, 1)
+# a province sized viewport
+BOUNDS = [49.0, 60.0, -120.0, -110.0]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time loading, filtering and every component update on "
+                                                 "generated datasets of increasing size")
+    parser.add_argument("--scales", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000],
+                        help="Dataset sizes (rows)")
+    parser.add_argument("--days", type=int, default=120, help="Days the rows are spread over")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated data")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each benchmark")
+    parser.add_argument("--data-dir", type=str, default=os.path.join(ROOT_DIR, "benchmark-data"),
+                        help="Generated datasets are kept here and reused by later runs")
+    parser.add_argument("--processes", type=int, default=0, help="Processes generating and combining the data")
+    parser.add_argument("--no-csv", action="store_true", help="Skip loading the combined csv file")
+    parser.add_argument("--no-tiles", action="store_true", help="Time the heatmap without its precomputed tiles")
+    parser.add_argument("--output", type=str, default=None, help="Write the results to this json file")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Results json file of an earlier run (e.g. the previous commit) to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Report a benchmark as a regression when its median is this much slower")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="... and at least this many milliseconds slower, below it timings are mostly noise")
+    return parser.parse_args()
+
+
+def prepare_data(data_dir: str, rows: int, days: int, seed: int, processes: int) -> tuple[str, str]:
+    """
+    Generate the daily files of one scale and combine them into a csv file and a column store
+    with its heatmap tiles, unless an earlier run did. Returns (csv path, column store path).
+    """
+    scale_dir = os.path.join(data_dir, f"cwfis-{rows}-{days}d-seed{seed}")
+    daily_dir = os.path.join(scale_dir, "daily")
+    csv_path = os.path.join(scale_dir, "hotspots.csv")
+    store_path = os.path.join(scale_dir, "hotspots.store")
+    done_path = os.path.join(scale_dir, "complete")
+    if os.path.exists(done_path):
+        # data of runs from before the tiles
+        if not TileStore.exists(store_path + TILES_SUFFIX):
+            build_dataset_tiles(store_path)
+        return csv_path, store_path
+
+    shutil.rmtree(scale_dir, ignore_errors=True)
+    print(f"Generating {rows:,} hotspots over {days} days in '{scale_dir}'...")
+    generate_cwfis(daily_dir, FROM_DATE, days, rows // days, seed=seed, processes=processes)
+    combine_csv(daily_dir, csv_path, processes)
+    combine_csv(daily_dir, store_path, processes)
+    build_dataset_tiles(store_path)
+    with open(done_path, "w") as f:
+        f.write(datetime.datetime.now().isoformat())
+    return csv_path, store_path
+
+
+def measure(fn, repeat: int, setup=None, warmup: bool = False) -> list[float]:
+    if warmup:
+        # not timed, e.g. first use imports and caches plotly's templates
+        if setup is not None:
+            setup()
+        fn()
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def clear_caches():
+    figure_cache.clear()
+    selection_cache.clear()
+    frame_cache.clear()
+    job_manager.clear()
+
+
+def load_benchmarks(csv_path: str, store_path: str, repeat: int, no_csv: bool) -> dict[str, list[float]]:
+    results = {"load/store": measure(lambda: Dataset(store_path), repeat)}
+    if not no_csv:
+        cache_path = csv_path + ".cache"
+        results["load/csv_build_cache"] = measure(lambda: Dataset(csv_path), repeat,
+                                                  setup=lambda: shutil.rmtree(cache_path, ignore_errors=True))
+        results["load/csv_cached"] = measure(lambda: Dataset(csv_path), repeat)
+    return results
+
+
+def filter_benchmarks(dataset: Dataset, repeat: int) -> dict[str, list[float]]:
+    rep_date = dataset.df["rep_date"]
+    max_date = rep_date.iloc[-1]
+    week_start = max_date.normalize() - pd.Timedelta(days=6)
+    sources, fuels = dataset.source_types, dataset.fuel_types
+    queries = {
+        "all": dict(min_date=rep_date.iloc[0], max_date=max_date, sources=sources, fuels=fuels),
+        "week": dict(min_date=week_start, max_date=max_date, sources=sources, fuels=fuels),
+        "week_categories": dict(min_date=week_start, max_date=max_date, sources=sources[:len(sources) // 2],
+                                fuels=fuels[:len(fuels) // 2]),
+        "week_bounds": dict(min_date=week_start, max_date=max_date, sources=sources, fuels=fuels, bounds=BOUNDS),
+    }
+    return {f"filter/{name}": measure(lambda: dataset.filter(**query), repeat, warmup=True)
+            for name, query in queries.items()}
+
+
+def component_benchmarks(store_path: str, repeat: int, no_tiles: bool) -> dict[str, list[float]]:
+    """
+    Every figure callback, for all of the data and for its last week, each run starting
+    with empty caches (the figure cache is disabled) so nothing is shared between components
+    """
+    app_args = ["-f", store_path, "--figure-cache-mb", "0", "--no-warmup"] + (["--no-tiles"] if no_tiles else [])
+    app, _ = create_app(parse_app_args(app_args))
+    client = DashClient(app)
+    slider_min, slider_max = (client.value("filter-date-range-slider", prop) for prop in ("min", "max"))
+
+    results = {}
+    for scenario, date_range in [("all", [slider_min, slider_max]), ("week", [slider_max - 6, slider_max])]:
+        values = {"filter-date-range-slider.value": date_range}
+        state = client.call("filter-state.data", values)["filter-state"]["data"]
+        values["filter-state.data"] = state
+        for dependency in client.dependencies:
+            output = dependency["output"]
+            if not output.endswith(".figure"):
+                continue
+            name = output.rsplit(".", 1)[0]
+            results[f"component/{name}/{scenario}"] = measure(lambda: client.call(output, values), repeat,
+                                                              setup=clear_caches, warmup=True)
+    clear_caches()
+    return results
+
+
+def git_commit() -> dict:
+    def git(*args) -> str:
+        return subprocess.run(["git", *args], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+def summary(times: list[float]) -> dict:
+    return {"median_s": statistics.median(times), "min_s": min(times), "runs_s": times}
+
+
+def compare(results: list[dict], baseline_path: str, threshold: float, min_delta: float) -> bool:
+    """
+    Print the change of every benchmark against the baseline, returns whether any regressed
+    """
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    before = {(item["scale"], item["name"]): item for item in baseline["results"]}
+    print(f"\nCompared with {baseline['meta']['git'].get('commit')} ({baseline_path}):")
+    regressed = False
+    for item in results:
+        old = before.get((item["scale"], item["name"]))
+        if old is None:
+            continue
+        ratio = item["median_s"] / old["median_s"]
+        slower = ratio > 1 + threshold and item["median_s"] - old["median_s"] > min_delta
+        flag = "  REGRESSION" if slower else ""
+        regressed |= bool(flag)
+        print(f"{item['scale']:>12,} {item['name']:<45} {old['median_s'] * 1000:10.2f} ms -> "
+              f"{item['median_s'] * 1000:10.2f} ms  {ratio:6.2f}x{flag}")
+    return regressed
+
+
+def main():
+    args = parse_args()
+    results = []
+    for rows in args.scales:
+        csv_path, store_path = prepare_data(args.data_dir, rows, args.days, args.seed, args.processes)
+        print(f"\n{rows:,} rows:")
+        timings = load_benchmarks(csv_path, store_path, args.repeat, args.no_csv)
+        dataset = Dataset(store_path)
+        timings.update(filter_benchmarks(dataset, args.repeat))
+        del dataset
+        timings.update(component_benchmarks(store_path, args.repeat, args.no_tiles))
+        for name, times in timings.items():
+            item = {"scale": rows, "name": name, **summary(times)}
+            results.append(item)
+            print(f"{name:<45} median {item['median_s'] * 1000:10.2f} ms, min {item['min_s'] * 1000:10.2f} ms")
+
+    meta = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git": git_commit(),
+        "args": vars(args),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"\nResults written to '{args.output}'")
+    if args.compare is not None and compare(results, args.compare, args.threshold, args.min_delta_ms / 1000):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from Dataset import Dataset  # noqa: E402
+from TileStore import DEFAULT_ZOOMS, TILES_SUFFIX, build_tiles  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precompute the heatmap tiles of a hotspots csv file or column store, "
+                                                 "the app serves the heatmap from them when they match the data")
+    parser.add_argument("hotspots_file_path", type=str, help="Hotspots csv file or column store directory")
+    parser.add_argument("--zooms", type=int, nargs="+", default=DEFAULT_ZOOMS, help="Map zoom levels to precompute")
+    return parser.parse_args()
+
+
+def build_dataset_tiles(hotspots_file_path: str, zooms: list[int] | None = None):
+    """
+    Write the tile store of a dataset next to it, at `<hotspots_file_path>.tiles`
+    """
+    path = hotspots_file_path.rstrip("/\\") + TILES_SUFFIX
+    start = time.perf_counter()
+    store = build_tiles(Dataset(hotspots_file_path), path, zooms)
+    size = sum(entry.stat().st_size for entry in os.scandir(path))
+    records = ", ".join(f"z{zoom}: {store.meta['num_records'][str(zoom)]:,}" for zoom in store.zooms)
+    print(f"Tiles written to '{path}' in {time.perf_counter() - start:.1f}s, {size / 2**20:.1f} MB ({records} records)")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    build_dataset_tiles(args.hotspots_file_path, args.zooms)
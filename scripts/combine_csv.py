@@ -1,33 +1,122 @@
 import argparse
 import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from ColumnStore import ColumnStoreWriter  # noqa: E402
+from Dataset import MEASURE_COLUMNS, STRING_COLUMNS, read_hotspots_csv, typed_hotspots  # noqa: E402
+
+# columns the dashboard reads, daily files without them are skipped
+REQUIRED_COLUMNS = ["lat", "lon", "rep_date", "source", "fuel", "estarea", "fwi", "ros", "hfi"]
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Combine all csv files in a directory")
     parser.add_argument("input_dir", type=str, help="Input directory")
-    parser.add_argument("output_file", type=str, help="Output file path")
+    parser.add_argument("output_file", type=str,
+                        help="Output file path, a csv file if it ends with '.csv', otherwise a column store directory")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Parse daily files on a pool of processes (default: parse in this process)")
+    parser.add_argument("--tiles", action="store_true",
+                        help="Also precompute the heatmap tiles of a column store (see build_tiles.py)")
     return parser.parse_args()
 
 
-def combine_csv(input_dir: str, output_file: str):
+def read_header(file_path: str) -> list[str]:
+    with open(file_path, "r") as f:
+        return [col.strip() for col in f.readline().rstrip("\r\n").split(",")]
+
+
+def load_daily_csv(file_path: str, columns: list[str], typed: bool) -> pd.DataFrame | None:
+    """
+    Read one daily csv file and reorder its columns to `columns`.
+    Missing optional columns are left empty, unknown columns are dropped,
+    files missing a required column are skipped (returns None).
+    """
+    filename = os.path.basename(file_path)
+    df = read_hotspots_csv(file_path, skipinitialspace=True)
+    df.columns = df.columns.str.strip()
+
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        print(f"Warning: '{filename}' is missing columns {missing}, skipping...")
+        return None
+    unknown = [col for col in df.columns if col not in columns]
+    if unknown:
+        print(f"Warning: dropping unknown columns {unknown} in '{filename}'")
+    df = df.reindex(columns=columns)
+    # keep string columns categorical in the column store even when a file leaves them empty
+    for col in STRING_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(object)
+
+    if typed:
+        # daily files are combined in date order, sorting each one keeps the output sorted
+        df = typed_hotspots(df).sort_values("rep_date", kind="stable", ignore_index=True)
+    return df
+
+
+def _daily_frames(file_paths: list[str], columns: list[str], typed: bool, processes: int):
     """
-    Combine all csv files in the input_dir into a single csv file
+    Yield the parsed daily files in order, with at most 2 * processes files in flight
     """
-    with open(output_file, "w") as out_f:
-        filenames = sorted(filter(lambda x: x.endswith(".csv"), os.listdir(input_dir)))
-        headers = None
-        for filename in filenames:
-            with open(os.path.join(input_dir, filename), "r") as in_f:
-                h, rows = in_f.read().split("\n", 1)
-                if headers is None:
-                    headers = h
-                    out_f.write(h + "\n")
-                elif headers != h:
-                    print(f"Warning: headers mismatch in '{filename}', skipping...")
-                    continue
-                out_f.write(rows)
+    if processes <= 0:
+        for file_path in file_paths:
+            yield load_daily_csv(file_path, columns, typed)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = deque()
+        for file_path in file_paths:
+            pending.append(executor.submit(load_daily_csv, file_path, columns, typed))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def combine_csv(input_dir: str, output_file: str, processes: int = 0):
+    """
+    Combine all csv files in the input_dir into a single csv file, or into a column store
+    directory that Dataset memory-maps directly. Files are streamed one at a time, so
+    memory use is bounded by the largest daily file rather than the combined output.
+    """
+    filenames = sorted(filter(lambda x: x.endswith(".csv"), os.listdir(input_dir)))
+    file_paths = [os.path.join(input_dir, filename) for filename in filenames]
+
+    # the first file with all required columns decides the output column order
+    columns = None
+    for file_path in file_paths:
+        header = read_header(file_path)
+        if all(col in header for col in REQUIRED_COLUMNS):
+            columns = header
+            break
+    if columns is None:
+        raise ValueError(f"No csv file in '{input_dir}' has the required columns {REQUIRED_COLUMNS}")
+
+    to_csv = output_file.endswith(".csv")
+    frames = _daily_frames(file_paths, columns, not to_csv, processes)
+    if to_csv:
+        with open(output_file, "w") as out_f:
+            out_f.write(",".join(columns) + "\n")
+            for df in frames:
+                if df is not None:
+                    df.to_csv(out_f, header=False, index=False)
+    else:
+        writer = ColumnStoreWriter(output_file, float32_columns=MEASURE_COLUMNS)
+        for df in frames:
+            if df is not None:
+                writer.append(df)
+        writer.close()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    combine_csv(args.input_dir, args.output_file)
+    combine_csv(args.input_dir, args.output_file, args.processes)
+    if args.tiles:
+        from build_tiles import build_dataset_tiles
+        build_dataset_tiles(args.output_file)
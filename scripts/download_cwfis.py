@@ -1,54 +1,219 @@
 import argparse
 import datetime
+import hashlib
+import http.client
+import json
 import os
-from urllib.error import HTTPError
-from urllib.request import urlopen
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
 
 CWFIS_DOWNLOAD_HOTSPOTS_BASE_URL = "https://cwfis.cfs.nrcan.gc.ca/downloads/hotspots"
+MANIFEST_FILE_NAME = "manifest.json"
+REQUEST_TIMEOUT = 60
+
+# one keep-alive connection per worker thread and host
+_thread_local = threading.local()
+# all of them, closed when the download is over (the threads of the pool are gone by then)
+_open_connections: set[http.client.HTTPConnection] = set()
+_open_connections_lock = threading.Lock()
+
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Download CWFIS hotspots data")
     parser.add_argument("from_date", type=str, help="Start date (YYYY-MM-DD)")
     parser.add_argument("to_date", type=str, help="End date (YYYY-MM-DD)")
     parser.add_argument("output_dir", type=str, help="Output directory")
+    parser.add_argument("--workers", type=int, default=8, help="Number of concurrent downloads")
+    parser.add_argument("--retries", type=int, default=4, help="Retries per day on network or server errors")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="Seconds to wait for a response")
+    parser.add_argument("--base-url", type=str, default=CWFIS_DOWNLOAD_HOTSPOTS_BASE_URL, help="Hotspots download base url")
     return parser.parse_args()
 
 
-def download_hotspots(from_date: datetime.date, to_date: datetime.date, output_dir: str):
+class RetryableError(Exception):
+    pass
+
+
+def _connection(scheme: str, netloc: str, timeout: float) -> http.client.HTTPConnection:
+    connections = getattr(_thread_local, "connections", None)
+    if connections is None:
+        connections = _thread_local.connections = {}
+    conn = connections.get((scheme, netloc))
+    if conn is None:
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = connections[(scheme, netloc)] = conn_cls(netloc, timeout=timeout)
+        with _open_connections_lock:
+            _open_connections.add(conn)
+    return conn
+
+
+def _drop_connection(scheme: str, netloc: str):
+    conn = getattr(_thread_local, "connections", {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+        with _open_connections_lock:
+            _open_connections.discard(conn)
+
+
+def close_connections():
+    """
+    Close the keep-alive connections of all threads, e.g. once their pool is shut down
     """
+    with _open_connections_lock:
+        connections = list(_open_connections)
+        _open_connections.clear()
+    for conn in connections:
+        conn.close()
+
+
+def fetch(url: str, timeout: float = REQUEST_TIMEOUT) -> bytes | None:
+    """
+    GET `url` over the calling thread's keep-alive connection, waiting at most `timeout` seconds
+    for the server. Returns None on 404 (no data for that day), raises RetryableError on network
+    or server errors (including timeouts).
+    """
+    parts = urlsplit(url)
+    conn = _connection(parts.scheme, parts.netloc, timeout)
+    try:
+        conn.request("GET", parts.path, headers={"Connection": "keep-alive"})
+        response = conn.getresponse()
+        body = response.read()
+    except (http.client.HTTPException, OSError) as e:
+        # the connection is in an unknown state, open a new one next time
+        _drop_connection(parts.scheme, parts.netloc)
+        raise RetryableError(str(e)) from e
+
+    if response.will_close:
+        _drop_connection(parts.scheme, parts.netloc)
+    if response.status == 404:
+        return None
+    if response.status == 429 or response.status >= 500:
+        raise RetryableError(f"HTTP {response.status} {response.reason}")
+    if response.status != 200:
+        raise RuntimeError(f"HTTP {response.status} {response.reason}")
+    return body
+
+
+def download_day(date: datetime.date, output_dir: str, base_url: str, retries: int,
+                 timeout: float = REQUEST_TIMEOUT) -> tuple[str, dict | None]:
+    """
+    Download the hotspots of one day into `output_dir`, retrying with exponential backoff.
+    Returns the file name and its manifest entry (size and sha256), or None as entry if there
+    is no data for that day.
+    """
+    filename = f"{date.strftime('%Y%m%d')}.csv"
+    for attempt in range(retries + 1):
+        try:
+            content = fetch(f"{base_url}/{filename}", timeout)
+            break
+        except RetryableError as e:
+            if attempt == retries:
+                raise RuntimeError(f"giving up after {retries + 1} attempts: {e}") from e
+            delay = 2 ** attempt + random.random()
+            print(f"Failed to download '{filename}' ({e}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+    if content is None:
+        return filename, None
+
+    # handle extra spaces in the csv headers
+    header, rows = content.decode("utf-8").split("\n", 1)
+    header = ",".join(header.split(', '))
+
+    # write to a temporary file first, so an interrupted run never leaves a partial csv
+    # (the .part file of an interrupted run is overwritten)
+    data = (header + "\n" + rows).encode("utf-8")
+    file_path = os.path.join(output_dir, filename)
+    with open(file_path + ".part", "wb") as f:
+        f.write(data)
+    os.replace(file_path + ".part", file_path)
+    return filename, {"bytes": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+
+def is_downloaded(output_dir: str, filename: str, entry: dict | None) -> bool:
+    """
+    Whether `filename` is in `output_dir` with the size and checksum of its manifest entry
+    """
+    file_path = os.path.join(output_dir, filename)
+    if entry is None or not os.path.exists(file_path) or os.path.getsize(file_path) != entry.get("bytes"):
+        return False
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest() == entry.get("sha256")
+
+
+def load_manifest(output_dir: str) -> dict:
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir: str, manifest: dict):
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    with open(manifest_path + ".part", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".part", manifest_path)
+
+
+def download_hotspots(from_date: datetime.date, to_date: datetime.date, output_dir: str, *,
+                      workers: int = 8, retries: int = 4, timeout: float = REQUEST_TIMEOUT,
+                      base_url: str = CWFIS_DOWNLOAD_HOTSPOTS_BASE_URL) -> dict:
+    """
+    Download the daily hotspots files between from_date and to_date (inclusive) concurrently.
+    Days listed in the manifest of `output_dir` whose file matches its size and checksum are
+    skipped, so an interrupted run can be resumed. Returns the updated manifest.
+
     example usage:
     download_hotspots(datetime.date(2024, 1, 1), datetime.date(2024, 2, 1), "hotspots")
     """
 
-    cur_date = from_date
-
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # TODO: multithreading
+    manifest = load_manifest(output_dir)
+    manifest_lock = threading.Lock()
+
+    dates = []
+    cur_date = from_date
     while cur_date <= to_date:
         filename = f"{cur_date.strftime('%Y%m%d')}.csv"
-
-        try:
-            content = urlopen(f"{CWFIS_DOWNLOAD_HOTSPOTS_BASE_URL}/{filename}").read().decode("utf-8")
-        except HTTPError as e:
-            print(f"Failed to download '{filename}': {e}")
-            continue
-
-        # handle extra spaces in the csv headers
-        header, rows = content.split("\n", 1)
-        header = ",".join(header.split(', '))
-        with open(os.path.join(output_dir, filename), "w") as f:
-            f.write(header + "\n")
-            f.write(rows)
-            print(f"Downloaded '{filename}'")
-        
+        if is_downloaded(output_dir, filename, manifest.get(filename)):
+            print(f"Skipped '{filename}', already downloaded")
+        else:
+            dates.append(cur_date)
         cur_date += datetime.timedelta(days=1)
 
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(download_day, date, output_dir, base_url, retries, timeout): date
+                       for date in dates}
+            for future in as_completed(futures):
+                filename = f"{futures[future].strftime('%Y%m%d')}.csv"
+                try:
+                    _, entry = future.result()
+                except Exception as e:
+                    print(f"Failed to download '{filename}': {e}")
+                    continue
+                if entry is None:
+                    print(f"No data for '{filename}'")
+                    continue
+                with manifest_lock:
+                    manifest[filename] = entry
+                    save_manifest(output_dir, manifest)
+                print(f"Downloaded '{filename}'")
+    finally:
+        close_connections()
+
+    return manifest
+
 
 if __name__ == "__main__":
     args = parse_args()
     from_date = datetime.datetime.strptime(args.from_date, "%Y-%m-%d").date()
     to_date = datetime.datetime.strptime(args.to_date, "%Y-%m-%d").date()
 
-    download_hotspots(from_date, to_date, args.output_dir)
+    download_hotspots(from_date, to_date, args.output_dir,
+                      workers=args.workers, retries=args.retries, timeout=args.timeout, base_url=args.base_url)
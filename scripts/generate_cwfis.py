@@ -0,0 +1,232 @@
+import argparse
+import datetime
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# columns of the CWFIS daily hotspot files, in their order
+CWFIS_COLUMNS = [
+    "lat", "lon", "rep_date", "source", "sensor", "satellite", "agency", "temp", "rh", "ws", "wd", "pcp",
+    "ffmc", "dmc", "dc", "isi", "bui", "fwi", "fuel", "ros", "sfc", "tfc", "bfc", "hfi", "cfb", "age",
+    "estarea", "pcuring", "cfactor", "greenup", "elev",
+]
+
+DEFAULT_FUEL_WEIGHTS = ("C2=0.30,C3=0.12,C1=0.04,C4=0.02,C7=0.03,D1=0.12,M1=0.10,M2=0.03,O1a=0.06,O1b=0.04,S1=0.02,"
+                        "non-fuel=0.10,water=0.02")
+DEFAULT_SOURCE_WEIGHTS = "NASA_VIIRS=0.35,NASA7=0.25,NASA6=0.15,NOAA=0.15,UMD=0.07,AFFES=0.03"
+# sensor and satellites of each source
+SOURCE_SENSORS = {
+    "NASA6": ("MODIS", ["Terra", "Aqua"]),
+    "NASA7": ("VIIRS", ["NOAA-20"]),
+    "NASA_VIIRS": ("VIIRS", ["S-NPP"]),
+    "NOAA": ("AVHRR", ["NOAA-19"]),
+    "UMD": ("MODIS", ["Terra", "Aqua"]),
+    "AFFES": ("VIIRS", ["S-NPP", "NOAA-20"]),
+}
+AGENCIES = ["BC", "AB", "SK", "MB", "ON", "QC", "NT", "YT", "PC", "NL", "NS", "NB"]
+# area fires start in, [min_lat, max_lat, min_lon, max_lon], roughly the Canadian forest
+FIRE_BOUNDS = [45.0, 66.0, -136.0, -60.0]
+KM_PER_DEGREE_LAT = 111.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic daily hotspot csv files in the CWFIS format")
+    parser.add_argument("output_dir", type=str, help="Output directory, one YYYYMMDD.csv file per day")
+    parser.add_argument("--from-date", type=str, default="2023-05-01", help="First day (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=120, help="Number of days")
+    parser.add_argument("--rows-per-day", type=int, default=10_000, help="Hotspots per day")
+    parser.add_argument("--fires", type=int, default=200, help="Average number of burning fires on a day")
+    parser.add_argument("--fire-days", type=float, default=12, help="Average number of days a fire burns")
+    parser.add_argument("--cluster-km", type=float, default=8, help="Spread of the hotspots around a fire's center")
+    parser.add_argument("--background", type=float, default=0.05,
+                        help="Fraction of hotspots scattered uniformly instead of around a fire")
+    parser.add_argument("--fuel-weights", type=str, default=DEFAULT_FUEL_WEIGHTS,
+                        help="name=weight,... of the fuel types")
+    parser.add_argument("--source-weights", type=str, default=DEFAULT_SOURCE_WEIGHTS,
+                        help="name=weight,... of the sources")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed, the same arguments and seed give the same files")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Write the csv files on a pool of processes (default: write in this process)")
+    return parser.parse_args()
+
+
+def parse_weights(text: str) -> tuple[list[str], np.ndarray]:
+    names, weights = zip(*[item.split("=") for item in text.split(",")])
+    weights = np.array(weights, dtype=np.float64)
+    return [name.strip() for name in names], weights / weights.sum()
+
+
+class FireSimulator:
+    """
+    Fires that start at random places, burn for a random number of days and move slowly.
+    Each fire mostly burns one fuel and has its own fire weather, so hotspots are clustered
+    in space, time, fuel and value like real detections.
+    """
+
+    def __init__(self, rng: np.random.Generator, fires: int, fire_days: float, cluster_km: float,
+                 fuels: list[str], fuel_weights: np.ndarray):
+        self.rng = rng
+        self.fire_days = fire_days
+        self.cluster_km = cluster_km
+        self.fuels = fuels
+        self.fuel_weights = fuel_weights
+        # new fires per day that keep the number of burning fires around `fires`
+        self.start_rate = fires / fire_days
+        self.fires = self._start(rng.poisson(fires))
+
+
+    def _start(self, n: int) -> dict:
+        rng = self.rng
+        min_lat, max_lat, min_lon, max_lon = FIRE_BOUNDS
+        return {
+            "lat": rng.uniform(min_lat, max_lat, n),
+            "lon": rng.uniform(min_lon, max_lon, n),
+            "days_left": rng.geometric(1 / self.fire_days, n),
+            "size": rng.pareto(1.5, n) + 1,
+            "fuel": rng.choice(len(self.fuels), n, p=self.fuel_weights),
+            "fwi": rng.gamma(4, 5, n),
+        }
+
+
+    def next_day(self):
+        fires = self.fires
+        alive = fires["days_left"] > 1
+        fires = {key: values[alive] for key, values in fires.items()}
+        fires["days_left"] = fires["days_left"] - 1
+        # fires drift and grow
+        fires["lat"] = fires["lat"] + self.rng.normal(0, 0.02, len(fires["lat"]))
+        fires["lon"] = fires["lon"] + self.rng.normal(0, 0.03, len(fires["lon"]))
+        fires["size"] = fires["size"] * self.rng.uniform(0.9, 1.3, len(fires["size"]))
+        new = self._start(self.rng.poisson(self.start_rate))
+        self.fires = {key: np.concatenate([fires[key], new[key]]) for key in fires}
+
+
+    def hotspots(self, date: datetime.date, rows: int, background: float,
+                 sources: list[str], source_weights: np.ndarray) -> pd.DataFrame:
+        rng = self.rng
+        fires = self.fires
+        n_fires = len(fires["lat"])
+        n_background = rows if n_fires == 0 else rng.binomial(rows, background)
+        fire = rng.choice(n_fires, rows - n_background, p=fires["size"] / fires["size"].sum()) if n_fires else \
+            np.empty(0, dtype=np.int64)
+
+        min_lat, max_lat, min_lon, max_lon = FIRE_BOUNDS
+        spread = self.cluster_km / KM_PER_DEGREE_LAT * np.sqrt(fires["size"][fire])
+        lat = np.concatenate([fires["lat"][fire] + rng.normal(0, 1, len(fire)) * spread,
+                              rng.uniform(min_lat, max_lat, n_background)])
+        lon = np.concatenate([fires["lon"][fire] + rng.normal(0, 1, len(fire)) * spread
+                              / np.cos(np.radians(fires["lat"][fire])),
+                              rng.uniform(min_lon, max_lon, n_background)])
+        # most hotspots of a fire burn its fuel
+        fuel = np.concatenate([np.where(rng.random(len(fire)) < 0.8, fires["fuel"][fire],
+                                        rng.choice(len(self.fuels), len(fire), p=self.fuel_weights)),
+                               rng.choice(len(self.fuels), n_background, p=self.fuel_weights)])
+        fwi = np.concatenate([fires["fwi"][fire] * rng.lognormal(0, 0.15, len(fire)),
+                              rng.gamma(2, 5, n_background)])
+
+        # satellite overpasses are mostly in the afternoon and at night
+        seconds = (rng.normal(13.5, 3, rows) * 3600 + rng.choice([0, 12 * 3600], rows, p=[0.7, 0.3])) % 86400
+        rep_date = np.datetime64(date, "s") + seconds.astype("timedelta64[s]")
+        order = np.argsort(rep_date, kind="stable")
+
+        source = rng.choice(len(sources), rows, p=source_weights)
+        sensors = [SOURCE_SENSORS.get(name, ("VIIRS", ["S-NPP"])) for name in sources]
+        sensor = np.array([name for name, _ in sensors])[source]
+        # one of the (at most two) satellites of the source
+        satellites = np.array([[satellites[0], satellites[-1]] for _, satellites in sensors])
+        satellite = satellites[source, rng.integers(0, 2, rows)]
+        isi = fwi / 2.5 * rng.lognormal(0, 0.2, rows)
+        ros = np.round(isi * rng.gamma(2, 0.6, rows), 2)
+        tfc = np.round(rng.gamma(3, 0.8, rows), 3)
+        hfi = np.round(300 * tfc * ros)
+        non_fuel = np.isin(np.array(self.fuels)[fuel], ["non-fuel", "water"])
+        ros[non_fuel], hfi[non_fuel], tfc[non_fuel] = 0, 0, 0
+
+        df = pd.DataFrame({
+            "lat": np.round(lat, 5),
+            "lon": np.round(lon, 5),
+            "rep_date": pd.to_datetime(rep_date).strftime("%Y-%m-%d %H:%M:%S"),
+            "source": np.array(sources)[source],
+            "sensor": sensor,
+            "satellite": satellite,
+            "agency": rng.choice(AGENCIES, rows),
+            "temp": np.round(rng.normal(22, 5, rows), 1),
+            "rh": np.round(rng.uniform(15, 70, rows)),
+            "ws": np.round(rng.gamma(2, 6, rows), 1),
+            "wd": np.round(rng.uniform(0, 360, rows)),
+            "pcp": np.round(rng.exponential(0.3, rows) * (rng.random(rows) < 0.2), 1),
+            "ffmc": np.round(np.clip(rng.normal(88, 4, rows), 0, 101), 1),
+            "dmc": np.round(rng.gamma(4, 12, rows), 1),
+            "dc": np.round(rng.gamma(6, 60, rows), 1),
+            "isi": np.round(isi, 1),
+            "bui": np.round(rng.gamma(5, 15, rows), 1),
+            "fwi": np.round(fwi, 1),
+            "fuel": np.array(self.fuels)[fuel],
+            "ros": ros,
+            "sfc": np.round(tfc * 0.7, 3),
+            "tfc": tfc,
+            "bfc": np.round(tfc * 0.3, 3),
+            "hfi": hfi,
+            "cfb": np.round(np.clip(rng.normal(30, 30, rows), 0, 100)),
+            "age": rng.integers(0, 5, rows),
+            "estarea": np.round(rng.gamma(1, 0.4, rows) * np.where(non_fuel, 0.1, 1), 3),
+            "pcuring": np.round(rng.uniform(50, 100, rows)),
+            "cfactor": np.round(rng.uniform(0, 1, rows), 2),
+            "greenup": rng.integers(0, 2, rows),
+            "elev": np.round(rng.gamma(2, 250, rows)),
+        }, columns=CWFIS_COLUMNS)
+        return df.iloc[order]
+
+
+def write_csv(df: pd.DataFrame, file_path: str):
+    df.to_csv(file_path, index=False)
+
+
+def generate_cwfis(output_dir: str, from_date: datetime.date, days: int, rows_per_day: int, *,
+                   fires: int = 200, fire_days: float = 12, cluster_km: float = 8, background: float = 0.05,
+                   fuel_weights: str = DEFAULT_FUEL_WEIGHTS, source_weights: str = DEFAULT_SOURCE_WEIGHTS,
+                   seed: int = 0, processes: int = 0):
+    """
+    Write `days` daily hotspot csv files from `from_date` on, as scripts/download_cwfis.py does.
+    The days are simulated in order in this process, writing the csv files (most of the time)
+    can be spread over `processes` without changing their content.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    fuels, fuel_p = parse_weights(fuel_weights)
+    sources, source_p = parse_weights(source_weights)
+    simulator = FireSimulator(rng, fires, fire_days, cluster_km, fuels, fuel_p)
+
+    def daily_files():
+        for day in range(days):
+            date = from_date + datetime.timedelta(days=day)
+            yield simulator.hotspots(date, rows_per_day, background, sources, source_p), \
+                os.path.join(output_dir, f"{date.strftime('%Y%m%d')}.csv")
+            simulator.next_day()
+
+    if processes <= 0:
+        for df, file_path in daily_files():
+            write_csv(df, file_path)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # at most 2 * processes days in memory
+        pending = deque()
+        for df, file_path in daily_files():
+            pending.append(executor.submit(write_csv, df, file_path))
+            if len(pending) >= 2 * processes:
+                pending.popleft().result()
+        while pending:
+            pending.popleft().result()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    generate_cwfis(args.output_dir, datetime.date.fromisoformat(args.from_date), args.days, args.rows_per_day,
+                   fires=args.fires, fire_days=args.fire_days, cluster_km=args.cluster_km,
+                   background=args.background, fuel_weights=args.fuel_weights,
+                   source_weights=args.source_weights, seed=args.seed, processes=args.processes)
@@ -0,0 +1,210 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+SLIDER_ID = "filter-date-range-slider"
+# seconds between polls for a background callback's result, shorter than the browser's
+POLL_INTERVAL = 0.01
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure date range changes per second of the multi-process "
+                                                 "server for an increasing number of workers")
+    parser.add_argument("-f", "--hotspots-file-path", type=str, required=True,
+                        help="Hotspots csv file or column store directory to serve")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to test")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load per worker count")
+    parser.add_argument("--port", type=int, default=24805)
+    return parser.parse_args()
+
+
+def _request(conn: http.client.HTTPConnection, method: str, path: str, body: dict | None = None) -> bytes:
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = conn.getresponse()
+    data = response.read()
+    if response.status not in (200, 204):
+        raise RuntimeError(f"{method} {path} returned {response.status}")
+    return data
+
+
+def update_component(conn: http.client.HTTPConnection, body: dict) -> bytes:
+    """
+    Run a callback, polling for the result of background callbacks (the map renders)
+    """
+    data = _request(conn, "POST", "/_dash-update-component", body)
+    job = json.loads(data) if data else {}
+    if "cacheKey" not in job:
+        return data
+    query = urllib.parse.urlencode({"cacheKey": job["cacheKey"], "job": job["job"]})
+    while True:
+        data = _request(conn, "POST", f"/_dash-update-component?{query}", body)
+        if not data or "response" in json.loads(data):
+            return data
+        time.sleep(POLL_INTERVAL)
+
+
+def _find_component(layout, component_id: str) -> dict | None:
+    if isinstance(layout, dict):
+        if layout.get("props", {}).get("id") == component_id:
+            return layout
+        children = layout.get("props", {}).get("children")
+        return _find_component(children, component_id)
+    if isinstance(layout, list):
+        for child in layout:
+            found = _find_component(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+def callback_body(app: dict, output: str, values: dict, changed: list[str]) -> dict:
+    """
+    Body of the callback of `output` as the browser sends it: inputs and states have the values
+    of the served layout (`app` holds the "layout" and "dependencies"), unless `values` maps
+    their '<id>.<property>' to another value
+    """
+    dependency = next(dependency for dependency in app["dependencies"] if dependency["output"] == output)
+
+    def props(items: list[dict]) -> list[dict]:
+        result = []
+        for item in items:
+            name = f"{item['id']}.{item['property']}"
+            component = _find_component(app["layout"], item["id"]) or {}
+            result.append({**item, "value": values.get(name, component.get("props", {}).get(item["property"]))})
+        return result
+
+    component_id, prop = output.rsplit(".", 1)
+    return {
+        "output": output,
+        "outputs": {"id": component_id, "property": prop},
+        "inputs": props(dependency["inputs"]),
+        "changedPropIds": changed,
+        "state": props(dependency["state"]),
+    }
+
+
+def start_server(hotspots_file_path: str, workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ,
+               # no figure cache, every request computes its figure
+               CWFIS_APP_ARGS=f"-f {hotspots_file_path} --figure-cache-mb 0",
+               CWFIS_WORKERS=str(workers),
+               CWFIS_BIND=f"127.0.0.1:{port}")
+    return subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", os.path.join(SRC_DIR, "gunicorn.conf.py"),
+                             "wsgi:server"], env=env, cwd=SRC_DIR)
+
+
+def wait_ready(port: int, timeout: float = 600) -> dict:
+    """
+    Wait until the server is ready, returns its "layout" and callback "dependencies"
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            # answers 503 until the dashboard is built
+            _request(conn, "GET", "/ready")
+            return {"layout": json.loads(_request(conn, "GET", "/_dash-layout")),
+                    "dependencies": json.loads(_request(conn, "GET", "/_dash-dependencies"))}
+        except (OSError, RuntimeError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def date_range_change(conn: http.client.HTTPConnection, app: dict, min_date: int, max_date: int):
+    """
+    Move the date range slider to a random range and update the scatter mapbox, as the browser
+    does: the filter panel turns the slider value (with the sources, fuels and dataset version
+    of the layout) into the filter state, and the figure is computed for that state
+    """
+    start = random.randint(min_date, max_date)
+    end = random.randint(start, min(start + 30, max_date))
+    data = update_component(conn, callback_body(app, "filter-state.data", {f"{SLIDER_ID}.value": [start, end]},
+                                                [f"{SLIDER_ID}.value"]))
+    filter_state = json.loads(data)["response"]["filter-state"]["data"]
+    values = {
+        "filter-state.data": filter_state,
+        "scatter-mapbox-value-col.value": random.choice(["estarea", "fwi", "ros", "hfi"]),
+        "scatter-mapbox-color-col.value": random.choice(["fuel", "source"]),
+    }
+    update_component(conn, callback_body(app, "scatter-mapbox.figure", values, ["filter-state.data"]))
+
+
+def run_load(port: int, app: dict, min_date: int, max_date: int, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                date_range_change(conn, app, min_date, max_date)
+            except (OSError, RuntimeError, http.client.HTTPException):
+                conn.close()
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else float("nan"),
+        "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else float("nan"),
+    }
+
+
+def main():
+    args = parse_args()
+    # cpus this process may run on, fewer than os.cpu_count() in a container or with taskset
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    if max(args.workers) > cpus:
+        # the workers would share the cpus, the results would not show any scaling
+        sys.exit(f"Only {cpus} cpu(s) available, run with at most {cpus} worker(s) or on a larger machine")
+    print(f"{cpus} cpus, {args.concurrency} concurrent clients, {args.duration:.0f}s per run")
+    # a change is the two requests of a date range change: the filter state and the scatter figure
+    print(f"{'workers':>8} {'changes':>9} {'errors':>7} {'changes/s':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for workers in args.workers:
+        server = start_server(os.path.abspath(args.hotspots_file_path), workers, args.port)
+        try:
+            app = wait_ready(args.port)
+            slider = _find_component(app["layout"], SLIDER_ID)
+            if slider is None:
+                raise RuntimeError(f"No '{SLIDER_ID}' in the app layout")
+            result = run_load(args.port, app, slider["props"]["min"], slider["props"]["max"],
+                              args.concurrency, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{workers:>8} {result['requests']:>9} {result['errors']:>7} {result['rps']:>10.1f} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import functools
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# upper bounds of the callback duration histogram, in seconds
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+PHASES = ['filter', 'aggregate', 'figure', 'serialize']
+
+# the record of the callback running on this thread, if it is instrumented
+_current = threading.local()
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a phase (one of PHASES) of the instrumented callback running on this thread
+    """
+    record = getattr(_current, 'record', None)
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record['phases'][name] = record['phases'].get(name, 0.0) + time.perf_counter() - start
+
+
+def record_rows(rows: int):
+    """
+    Number of hotspots the running callback worked on
+    """
+    record = getattr(_current, 'record', None)
+    if record is not None:
+        record['rows'] += rows
+
+
+def record_payload(num_bytes: int, cached: bool):
+    """
+    Serialized size of the running callback's result, and whether it came from the figure cache
+    """
+    record = getattr(_current, 'record', None)
+    if record is not None:
+        record['payload_bytes'] = num_bytes
+        record['cached'] = cached
+
+
+class CallbackMetrics:
+    """
+    Per component counts and timings of the dashboard callbacks, in the Prometheus text format,
+    and optionally a log with one json line per call.
+
+    Each process counts its own calls. With a `directory` (see `use_directory`) shared by the
+    worker processes, every process writes its counts to a file there after each call and
+    `prometheus` sums the files, so a scrape answered by any worker reports the calls of all
+    of them and the counters never go back.
+    """
+
+    def __init__(self):
+        self.timing_log = None
+        self.directory = None
+        self._components: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._file_name = f'metrics-{uuid.uuid4().hex}.json'
+        # a forked worker starts from zero, the calls made before the fork are in the parent's file
+        os.register_at_fork(after_in_child=self._forked)
+
+
+    def _forked(self):
+        self._components = {}
+        self._lock = threading.Lock()
+        self._file_name = f'metrics-{uuid.uuid4().hex}.json'
+
+
+    def use_directory(self, directory: str):
+        """
+        Share the counts through `directory`, dropping the counts of earlier runs found there
+        """
+        for file_path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            os.remove(file_path)
+        self.directory = directory
+
+
+    def _component(self, component_id: str) -> dict:
+        # called with the lock held
+        component = self._components.get(component_id)
+        if component is None:
+            component = self._components[component_id] = {
+                'calls': 0, 'errors': 0, 'cache_hits': 0,
+                'duration_buckets': [0] * len(DURATION_BUCKETS), 'duration_sum': 0.0,
+                'phase_sums': {name: 0.0 for name in PHASES},
+                'payload_bytes_sum': 0, 'rows_sum': 0,
+            }
+        return component
+
+
+    def instrument(self, component_id: str):
+        """
+        Decorator for a callback function, to be placed under `@app.callback` (and above
+        `@figure_cache.memoize`, which reports the payload size)
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args):
+                record = _current.record = {'phases': {}, 'rows': 0, 'payload_bytes': 0, 'cached': False}
+                start = time.perf_counter()
+                try:
+                    return fn(*args)
+                except Exception:
+                    record['error'] = True
+                    raise
+                finally:
+                    _current.record = None
+                    self._add(component_id, record, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+
+    def _add(self, component_id: str, record: dict, duration: float):
+        with self._lock:
+            component = self._component(component_id)
+            component['calls'] += 1
+            component['errors'] += int(record.get('error', False))
+            component['cache_hits'] += int(record['cached'])
+            component['duration_sum'] += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    component['duration_buckets'][i] += 1
+            for name, seconds in record['phases'].items():
+                component['phase_sums'][name] = component['phase_sums'].get(name, 0.0) + seconds
+            component['payload_bytes_sum'] += record['payload_bytes']
+            component['rows_sum'] += record['rows']
+            if self.directory is not None:
+                self._write()
+
+            if self.timing_log is not None:
+                line = {
+                    'time': time.time(), 'component': component_id, 'total_ms': round(duration * 1000, 3),
+                    **{f'{name}_ms': round(seconds * 1000, 3) for name, seconds in record['phases'].items()},
+                    'rows': record['rows'], 'payload_bytes': record['payload_bytes'], 'cached': record['cached'],
+                    'error': record.get('error', False),
+                }
+                self.timing_log.write(json.dumps(line) + '\n')
+                self.timing_log.flush()
+
+
+    def _write(self):
+        # called with the lock held, replaced at once so readers never see a partial file
+        file_path = os.path.join(self.directory, self._file_name)
+        with open(f'{file_path}.tmp', 'w') as f:
+            json.dump(self._components, f)
+        os.replace(f'{file_path}.tmp', file_path)
+
+
+    def _merged(self) -> dict[str, dict]:
+        # called with the lock held: the counts of every process, this one's from memory
+        if self.directory is None:
+            return self._components
+        processes = [self._components]
+        for file_path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            if os.path.basename(file_path) == self._file_name:
+                continue
+            try:
+                with open(file_path) as f:
+                    processes.append(json.load(f))
+            except (OSError, ValueError):
+                # removed by a new run
+                continue
+
+        merged = {}
+        for components in processes:
+            for component_id, counts in components.items():
+                total = merged.get(component_id)
+                if total is None:
+                    merged[component_id] = {**counts, 'duration_buckets': list(counts['duration_buckets']),
+                                            'phase_sums': dict(counts['phase_sums'])}
+                    continue
+                for key in ('calls', 'errors', 'cache_hits', 'duration_sum', 'payload_bytes_sum', 'rows_sum'):
+                    total[key] += counts[key]
+                total['duration_buckets'] = [a + b for a, b in zip(total['duration_buckets'], counts['duration_buckets'])]
+                for name, seconds in counts['phase_sums'].items():
+                    total['phase_sums'][name] = total['phase_sums'].get(name, 0.0) + seconds
+        return merged
+
+
+    def prometheus(self, extra: dict[str, tuple[str, str, float]] | None = None) -> str:
+        """
+        All metrics in the Prometheus text exposition format. `extra` adds gauges or counters
+        by name: (type, help, value), or (type, help, {labels: value}) for several samples,
+        e.g. {'phase="load"': 1.5}.
+        """
+        lines = []
+
+        def metric(name: str, metric_type: str, help_text: str, samples: list[tuple[str, float]]):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            # repr keeps every digit, numpy scalars become python numbers first
+            lines.extend(f'{sample_name} {getattr(value, "item", lambda: value)()!r}' for sample_name, value in samples)
+
+        with self._lock:
+            components = sorted(self._merged().items())
+            metric('cwfis_callback_calls_total', 'counter', 'Callback calls.',
+                   [(f'cwfis_callback_calls_total{{component="{c}"}}', m['calls']) for c, m in components])
+            metric('cwfis_callback_errors_total', 'counter', 'Callback calls that raised.',
+                   [(f'cwfis_callback_errors_total{{component="{c}"}}', m['errors']) for c, m in components])
+            metric('cwfis_callback_cache_hits_total', 'counter', 'Callback results served from the figure cache.',
+                   [(f'cwfis_callback_cache_hits_total{{component="{c}"}}', m['cache_hits']) for c, m in components])
+
+            samples = []
+            for c, m in components:
+                for bound, count in zip(DURATION_BUCKETS, m['duration_buckets']):
+                    samples.append((f'cwfis_callback_duration_seconds_bucket{{component="{c}",le="{bound}"}}', count))
+                samples.append((f'cwfis_callback_duration_seconds_bucket{{component="{c}",le="+Inf"}}', m['calls']))
+                samples.append((f'cwfis_callback_duration_seconds_sum{{component="{c}"}}', m['duration_sum']))
+                samples.append((f'cwfis_callback_duration_seconds_count{{component="{c}"}}', m['calls']))
+            metric('cwfis_callback_duration_seconds', 'histogram', 'Callback duration.', samples)
+
+            metric('cwfis_callback_phase_seconds_total', 'counter',
+                   'Time spent filtering, aggregating, building and serializing figures.',
+                   [(f'cwfis_callback_phase_seconds_total{{component="{c}",phase="{p}"}}', seconds)
+                    for c, m in components for p, seconds in m['phase_sums'].items()])
+            metric('cwfis_callback_payload_bytes_total', 'counter', 'Serialized size of the callback results.',
+                   [(f'cwfis_callback_payload_bytes_total{{component="{c}"}}', m['payload_bytes_sum'])
+                    for c, m in components])
+            metric('cwfis_callback_rows_total', 'counter', 'Hotspots read by the callbacks.',
+                   [(f'cwfis_callback_rows_total{{component="{c}"}}', m['rows_sum']) for c, m in components])
+
+        for name, (metric_type, help_text, value) in (extra or {}).items():
+            samples = [(f'{name}{{{labels}}}', v) for labels, v in value.items()] if isinstance(value, dict) \
+                else [(name, value)]
+            metric(name, metric_type, help_text, samples)
+        return '\n'.join(lines) + '\n'
+
+
+# shared by all components
+callback_metrics = CallbackMetrics()
@@ -0,0 +1,316 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+META_FILE_NAME = 'meta.json'
+# held while rows are appended, so processes appending the same rows write them once
+LOCK_FILE_NAME = 'append.lock'
+FORMAT_VERSION = 1
+
+
+def file_signature(file_path: str, with_hash: bool = True) -> dict:
+    """
+    Identify a source file by size, mtime and (optionally) sha256 of its content
+    """
+    stat = os.stat(file_path)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        signature['sha256'] = digest.hexdigest()
+    return signature
+
+
+def _smallest_code_dtype(num_categories: int) -> str:
+    for dtype in ('int8', 'int16', 'int32'):
+        if num_categories <= np.iinfo(dtype).max:
+            return dtype
+    return 'int64'
+
+
+@contextlib.contextmanager
+def _locked(path: str):
+    try:
+        import fcntl
+    except ImportError:
+        # no other process appends without fork (e.g. on Windows)
+        fcntl = None
+    with open(os.path.join(path, LOCK_FILE_NAME), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _column_values(column: dict, series: pd.Series, known_categories: dict) -> np.ndarray:
+    """
+    Values of `series` as stored in `column`, strings as int32 codes against a category list
+    that only ever grows (`known_categories` maps each to its code), so earlier codes stay valid
+    """
+    if column['dtype'] == 'category':
+        codes, uniques = pd.factorize(series.astype(object), use_na_sentinel=True)
+        lookup = np.empty(len(uniques), dtype='int32')
+        for i, value in enumerate(uniques):
+            value = str(value)
+            if value not in known_categories:
+                known_categories[value] = len(column['categories'])
+                column['categories'].append(value)
+            lookup[i] = known_categories[value]
+        result = np.full(len(codes), -1, dtype='int32')
+        valid = codes >= 0
+        result[valid] = lookup[codes[valid]]
+        return result
+    if column['dtype'] == 'datetime64[ns]':
+        return pd.to_datetime(series).to_numpy(dtype='datetime64[ns]')
+    if column['dtype'] == 'bool':
+        return series.to_numpy(dtype='bool')
+    return series.to_numpy(dtype=column['dtype'], na_value=np.nan)
+
+
+class ColumnStore:
+    """
+    A directory holding one raw, memory-mappable binary file per column plus a
+    `meta.json` describing dtypes, categories and the source the store was built from.
+
+    Numeric and datetime columns are stored as plain little-endian arrays, strings
+    are stored as categorical codes, so a whole store can be opened with `np.memmap`
+    without parsing anything.
+    """
+
+    def __init__(self, path: str, num_rows: int | None = None):
+        """
+        `num_rows` maps only the leading rows of the store (another process may have appended more)
+        """
+        self.path = path
+        self.meta = self._read_meta(path)
+        self.num_rows: int = self.meta['num_rows'] if num_rows is None else num_rows
+
+
+    @staticmethod
+    def _read_meta(path: str) -> dict:
+        with open(os.path.join(path, META_FILE_NAME), 'r') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported column store format in '{path}'")
+        return meta
+
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, META_FILE_NAME))
+
+
+    def is_fresh(self, source_path: str) -> bool:
+        """
+        Check whether the store was built from the current content of `source_path`.
+        A matching size and mtime is trusted as is, otherwise the content hash decides.
+        """
+        source = self.meta.get('source')
+        if source is None:
+            return False
+        signature = file_signature(source_path, with_hash=False)
+        if signature['size'] != source['size']:
+            return False
+        if signature['mtime_ns'] == source['mtime_ns']:
+            return True
+        if file_signature(source_path)['sha256'] != source.get('sha256'):
+            return False
+
+        # content unchanged (e.g. the file was touched), remember the new mtime
+        self.meta['source']['mtime_ns'] = signature['mtime_ns']
+        _write_meta(self.path, self.meta)
+        return True
+
+
+    def _column_file(self, name: str) -> str:
+        return os.path.join(self.path, f'{name}.bin')
+
+
+    def read(self, columns: list[str] | None = None) -> pd.DataFrame:
+        """
+        Open the store as a read-only DataFrame backed by memory-mapped columns
+        """
+        data = {}
+        for column in self.meta['columns']:
+            name = column['name']
+            if columns is not None and name not in columns:
+                continue
+            if column['dtype'] == 'category':
+                codes = self._memmap(name, column['codes_dtype'])
+                data[name] = pd.Categorical.from_codes(codes, column['categories'])
+            else:
+                data[name] = self._memmap(name, column['dtype'])
+        return pd.DataFrame(data, copy=False)
+
+
+    def _memmap(self, name: str, dtype: str) -> np.ndarray:
+        if self.num_rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._column_file(name), dtype=dtype, mode='r', shape=(self.num_rows,))
+
+
+    def append(self, df: pd.DataFrame) -> 'ColumnStore | None':
+        """
+        Write the rows of `df` (with the columns of the store) after the `num_rows` rows of this
+        store and return the store mapping them too, None if the store was changed in another way
+        since it was opened.
+
+        Several processes may append the same rows (e.g. every gunicorn worker appends the files
+        of the watch directory): rows another process already appended are checked and kept, so
+        the rows are written once and every process maps the same pages. The column files are
+        extended before the row count in meta.json, an interrupted append leaves the store as it was.
+        """
+        with _locked(self.path):
+            meta = self._read_meta(self.path)
+            stored = meta['num_rows']
+            if stored < self.num_rows or [c['name'] for c in meta['columns']] != list(df.columns):
+                return None
+            # rows already appended by another process
+            overlap = min(stored - self.num_rows, len(df))
+
+            values = {}
+            for column in meta['columns']:
+                name = column['name']
+                known = {category: code for code, category in enumerate(column.get('categories', []))}
+                values[name] = _column_values(column, df[name], known)
+                if overlap:
+                    dtype = column['codes_dtype'] if column['dtype'] == 'category' else column['dtype']
+                    existing = np.fromfile(self._column_file(name), dtype=dtype, count=overlap,
+                                           offset=self.num_rows * np.dtype(dtype).itemsize)
+                    expected = np.ascontiguousarray(values[name][:overlap].astype(dtype))
+                    if not np.array_equal(existing.view(np.uint8), expected.view(np.uint8)):
+                        return None
+
+            if overlap < len(df):
+                for column in meta['columns']:
+                    if column['dtype'] == 'category':
+                        codes_dtype = _smallest_code_dtype(len(column['categories']))
+                        if np.dtype(codes_dtype).itemsize > np.dtype(column['codes_dtype']).itemsize:
+                            self._widen_codes(meta, column, codes_dtype)
+                for column in meta['columns']:
+                    name = column['name']
+                    dtype = column['codes_dtype'] if column['dtype'] == 'category' else column['dtype']
+                    new_values = np.ascontiguousarray(values[name][overlap:].astype(dtype, copy=False))
+                    with open(self._column_file(name), 'r+b') as f:
+                        # past the stored rows, not the end of the file: an interrupted append
+                        # may have left more
+                        f.seek(stored * new_values.itemsize)
+                        new_values.tofile(f)
+                        f.truncate()
+                meta['num_rows'] = self.num_rows + len(df)
+                _write_meta(self.path, meta)
+        return ColumnStore(self.path, self.num_rows + len(df))
+
+
+    def _widen_codes(self, meta: dict, column: dict, codes_dtype: str):
+        # into a new file, the old one stays mapped by the processes reading it
+        file_path = self._column_file(column['name'])
+        codes = np.fromfile(file_path, dtype=column['codes_dtype'], count=meta['num_rows'])
+        codes.astype(codes_dtype).tofile(f'{file_path}.tmp')
+        os.replace(f'{file_path}.tmp', file_path)
+        column['codes_dtype'] = codes_dtype
+        _write_meta(self.path, meta)
+
+
+def _write_meta(path: str, meta: dict):
+    tmp_path = os.path.join(path, f'{META_FILE_NAME}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, META_FILE_NAME))
+
+
+class ColumnStoreWriter:
+    """
+    Build a ColumnStore by appending DataFrame chunks. Column types are fixed by the
+    first chunk: datetimes are stored as datetime64[ns], strings as categorical codes,
+    `float32_columns` as float32 and every other numeric column as float64.
+
+    The store is written to a temporary directory and moved into place on `close()`,
+    so readers never see a half-written store.
+    """
+
+    def __init__(self, path: str, float32_columns: list[str] | None = None):
+        self.path = path
+        self.tmp_path = f'{path}.tmp-{os.getpid()}'
+        self.float32_columns = set(float32_columns or [])
+        self.columns: list[dict] | None = None
+        self.num_rows = 0
+        self._category_codes: dict[str, dict] = {}
+        self._files = {}
+
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+
+
+    def _init_columns(self, chunk: pd.DataFrame):
+        self.columns = []
+        for name, dtype in chunk.dtypes.items():
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                column = {'name': name, 'dtype': 'datetime64[ns]'}
+            elif pd.api.types.is_bool_dtype(dtype):
+                column = {'name': name, 'dtype': 'bool'}
+            elif pd.api.types.is_numeric_dtype(dtype):
+                column = {'name': name, 'dtype': 'float32' if name in self.float32_columns else 'float64'}
+            else:
+                column = {'name': name, 'dtype': 'category', 'codes_dtype': 'int32', 'categories': []}
+                self._category_codes[name] = {}
+            self.columns.append(column)
+            self._files[name] = open(os.path.join(self.tmp_path, f'{name}.bin'), 'wb')
+
+
+    def append(self, chunk: pd.DataFrame):
+        if self.columns is None:
+            self._init_columns(chunk)
+        for column in self.columns:
+            name = column['name']
+            values = _column_values(column, chunk[name], self._category_codes.get(name))
+            np.ascontiguousarray(values).tofile(self._files[name])
+        self.num_rows += len(chunk)
+
+
+    def close(self, source: dict | None = None) -> ColumnStore:
+        for f in self._files.values():
+            f.close()
+        if self.columns is None:
+            self.columns = []
+
+        # shrink categorical codes now that the final number of categories is known
+        for column in self.columns:
+            if column['dtype'] != 'category':
+                continue
+            codes_dtype = _smallest_code_dtype(len(column['categories']))
+            if codes_dtype != column['codes_dtype']:
+                file_path = os.path.join(self.tmp_path, f"{column['name']}.bin")
+                codes = np.fromfile(file_path, dtype=column['codes_dtype'])
+                codes.astype(codes_dtype).tofile(file_path)
+                column['codes_dtype'] = codes_dtype
+
+        _write_meta(self.tmp_path, {
+            'format_version': FORMAT_VERSION,
+            'num_rows': self.num_rows,
+            'columns': self.columns,
+            'source': source,
+        })
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+        return ColumnStore(self.path)
+
+
+    @classmethod
+    def write(cls, path: str, df: pd.DataFrame, float32_columns: list[str] | None = None,
+              source: dict | None = None) -> ColumnStore:
+        writer = cls(path, float32_columns)
+        writer.append(df)
+        return writer.close(source)
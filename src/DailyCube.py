@@ -0,0 +1,372 @@
+import numpy as np
+import pandas as pd
+
+# number of equal-depth bins of the median sketch, more bins -> better approximation, more memory
+MEDIAN_SKETCH_BINS = 32
+# 'auto' medians of up to this many selected rows are exact (about 100 ms per million rows)
+EXACT_MEDIAN_MAX_ROWS = 2_000_000
+GROUP_COLS = ['fuel', 'source']
+# time buckets of the series, weeks start on Monday
+BUCKETS = ['day', 'week', 'month']
+
+
+def _merge(keys: np.ndarray, *arrays: np.ndarray) -> tuple[np.ndarray, list[np.ndarray]]:
+    """
+    Sum the rows of `arrays` that share a key, returns the sorted unique keys and the merged arrays
+    """
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=int)
+    merged = [np.add.reduceat(a[order], starts, axis=0) if len(keys) else a[:0] for a in arrays]
+    return keys[starts], merged
+
+
+def _quantile_edges(values: np.ndarray) -> np.ndarray:
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.zeros(1)
+    return np.unique(np.quantile(values, np.linspace(0, 1, MEDIAN_SKETCH_BINS + 1)))
+
+
+class DailyCube:
+    """
+    Aggregates of the hotspots per (day, fuel, source) cell, built once so daily series
+    can be computed from the cells instead of the rows.
+
+    Each cell holds the number of hotspots and, for every value column, the sum, the
+    number of non-missing values and a median sketch: a histogram over equal-depth bins
+    whose edges are the global quantiles of the column. Sketches of several cells merge
+    by adding them up.
+
+    Medians come in three modes:
+    - 'auto' (default) is 'exact' when at most EXACT_MEDIAN_MAX_ROWS rows are selected,
+      'approx' otherwise (see `exact_median`).
+    - 'approx' interpolates inside the sketch bin holding the median, the result is always
+      within the bins of the two middle values (usually one bin), i.e. its error is at most
+      their width (bins hold ~1/MEDIAN_SKETCH_BINS of all values each). Bin edges are
+      fixed when the cube is first built, values appended later outside of them fall into
+      the first or last bin.
+    - 'exact' computes the median from the rows, its cost grows with the number of rows.
+    """
+
+    def __init__(self, df: pd.DataFrame, days: np.ndarray, day_offsets: np.ndarray, value_cols: list[str]):
+        self.value_cols = value_cols
+        self.sketch_edges = {col: _quantile_edges(df[col].to_numpy(dtype=np.float64)) for col in value_cols}
+        self._set_rows(df, days, day_offsets)
+        self.cells = self._aggregate(slice(0, len(df)))
+        self._set_group_totals()
+
+
+    def _set_rows(self, df: pd.DataFrame, days: np.ndarray, day_offsets: np.ndarray):
+        self._df = df
+        self.days = days
+        self.categories = {col: list(df[col].cat.categories) for col in GROUP_COLS}
+        self._row_days = np.repeat(np.arange(len(days), dtype=np.int32), np.diff(day_offsets))
+        # missing categories get their own slot after the last category
+        self._row_slots = {}
+        for col in GROUP_COLS:
+            codes = df[col].array.codes
+            self._row_slots[col] = np.where(codes < 0, len(self.categories[col]), codes).astype(np.int32)
+
+
+    def _cell_keys(self, day: np.ndarray, fuel: np.ndarray, source: np.ndarray) -> np.ndarray:
+        n_fuel = len(self.categories['fuel']) + 1
+        n_source = len(self.categories['source']) + 1
+        return (day.astype(np.int64) * n_fuel + fuel) * n_source + source
+
+
+    def _cells_from_keys(self, keys: np.ndarray, measures: dict) -> dict:
+        n_fuel = len(self.categories['fuel']) + 1
+        n_source = len(self.categories['source']) + 1
+        return {
+            'day': (keys // (n_fuel * n_source)).astype(np.int32),
+            'fuel': (keys // n_source % n_fuel).astype(np.int32),
+            'source': (keys % n_source).astype(np.int32),
+            **measures,
+        }
+
+
+    def _aggregate(self, rows: slice) -> dict:
+        """
+        Cells of the rows in `rows`, as a dict of arrays with one entry per non-empty cell:
+        day/fuel/source slots, count, and <col>_sum, <col>_n, <col>_sketch per value column
+        """
+        keys = self._cell_keys(self._row_days[rows], self._row_slots['fuel'][rows], self._row_slots['source'][rows])
+        # dense slot counts, then keep the non-empty slots only
+        n_slots = len(self.days) * (len(self.categories['fuel']) + 1) * (len(self.categories['source']) + 1)
+        slot_counts = np.bincount(keys, minlength=n_slots)
+        cell_keys = np.flatnonzero(slot_counts)
+        row_cells = (np.cumsum(slot_counts > 0) - 1)[keys]
+        n_cells = len(cell_keys)
+
+        measures = {'count': slot_counts[cell_keys]}
+        for col in self.value_cols:
+            values = self._df[col].to_numpy(dtype=np.float64)[rows]
+            valid = ~np.isnan(values)
+            measures[f'{col}_sum'] = np.bincount(row_cells[valid], weights=values[valid], minlength=n_cells)
+            measures[f'{col}_n'] = np.bincount(row_cells[valid], minlength=n_cells)
+
+            edges = self.sketch_edges[col]
+            n_bins = max(len(edges) - 1, 1)
+            bins = np.clip(np.searchsorted(edges, values[valid], side='right') - 1, 0, n_bins - 1)
+            measures[f'{col}_sketch'] = np.bincount(row_cells[valid] * n_bins + bins, minlength=n_cells * n_bins) \
+                .reshape(n_cells, n_bins).astype(np.uint32)
+        return self._cells_from_keys(cell_keys, measures)
+
+
+    def extended(self, df: pd.DataFrame, days: np.ndarray, day_offsets: np.ndarray, start: int) -> 'DailyCube':
+        """
+        Cube of `df`, whose rows before `start` are the rows this cube was built from
+        (in the same order), aggregating only the rows from `start` on
+        """
+        cube = DailyCube.__new__(DailyCube)
+        cube.value_cols = self.value_cols
+        cube.sketch_edges = self.sketch_edges
+        cube._set_rows(df, days, day_offsets)
+        new_cells = cube._aggregate(slice(start, len(df)))
+
+        # categories may have been added, move the missing slots after the new last category
+        old_cells = dict(self.cells)
+        for col in GROUP_COLS:
+            slots = old_cells[col]
+            old_missing = len(self.categories[col])
+            old_cells[col] = np.where(slots == old_missing, len(cube.categories[col]), slots)
+
+        measure_names = [name for name in new_cells if name not in ('day', 'fuel', 'source')]
+        keys = np.concatenate([cube._cell_keys(cells['day'], cells['fuel'], cells['source'])
+                               for cells in (old_cells, new_cells)])
+        keys, merged = _merge(keys, *[np.concatenate([old_cells[name], new_cells[name]]) for name in measure_names])
+        cube.cells = cube._cells_from_keys(keys, dict(zip(measure_names, merged)))
+        cube._set_group_totals()
+        return cube
+
+
+    def _set_group_totals(self):
+        # unfiltered totals per category, for charts of the whole dataset
+        self.group_totals = {(group_col, value_col): self._totals(group_col, value_col, None)
+                             for group_col in GROUP_COLS for value_col in ['hotspots'] + self.value_cols}
+
+
+    def _group_slots(self, group_col: str | None) -> tuple[np.ndarray, list[str]]:
+        if group_col is None:
+            return np.zeros(len(self.cells['day']), dtype=np.int32), ['all']
+        if group_col not in GROUP_COLS:
+            raise ValueError(f'Invalid group column: {group_col}')
+        return self.cells[group_col], self.categories[group_col]
+
+
+    def _selected(self, day: np.ndarray, fuel: np.ndarray, source: np.ndarray, filters: dict) -> np.ndarray | None:
+        """
+        Mask of the cells (or rows) with the given day/fuel/source slots that match `filters`
+        (min_date/max_date as whole days, inclusive, sources, fuels), None if all of them do
+        """
+        masks = []
+        if filters.get('min_date') is not None:
+            masks.append(day >= np.searchsorted(self.days, np.datetime64(filters['min_date'], 'D'), side='left'))
+        if filters.get('max_date') is not None:
+            masks.append(day < np.searchsorted(self.days, np.datetime64(filters['max_date'], 'D'), side='right'))
+        for slots, col, values in ((fuel, 'fuel', filters.get('fuels')), (source, 'source', filters.get('sources'))):
+            if values is not None:
+                # the missing slot after the last category is never selected
+                selected = np.zeros(len(self.categories[col]) + 1, dtype=bool)
+                selected[:-1] = np.isin(self.categories[col], values)
+                masks.append(selected[slots])
+        return np.logical_and.reduce(masks) if masks else None
+
+
+    def _buckets(self, bucket: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Bucket of each day (index into the returned start days) and the first day of each bucket
+        """
+        if bucket == 'day':
+            return np.arange(len(self.days)), self.days
+        if bucket == 'week':
+            # 1970-01-01 was a Thursday
+            starts = self.days - (self.days.astype(np.int64) + 3) % 7
+        elif bucket == 'month':
+            starts = self.days.astype('datetime64[M]').astype('datetime64[D]')
+        else:
+            raise ValueError(f'Invalid bucket: {bucket}')
+        bucket_days, day_buckets = np.unique(starts, return_inverse=True)
+        return day_buckets, bucket_days
+
+
+    def series(self, group_col: str | None, value_col: str, aggregate: str = 'sum', *,
+               median: str = 'auto', bucket: str = 'day', events: np.ndarray | None = None,
+               **filters) -> dict[str, pd.Series]:
+        """
+        `aggregate` of `value_col` ('hotspots' counts rows) per `bucket` (one of BUCKETS, indexed
+        by its first day) for each group of `group_col` (None for a single 'all' group). Only the
+        buckets a group has hotspots in are included. `filters` (min_date, max_date, sources, fuels)
+        restrict the cells used, dates by whole days. 'events' counts the distinct fire events
+        from the rows, `events` being the event of each row (see FireEvents.row_events).
+        """
+        if value_col not in ('hotspots', 'events') and aggregate not in ('sum', 'mean', 'median'):
+            raise ValueError(f'Invalid aggregate type: {aggregate}')
+        day_buckets, bucket_days = self._buckets(bucket)
+        if value_col == 'events':
+            keys, counts, names = self._event_counts(group_col, events, filters, day_buckets, len(bucket_days))
+            return self._split(keys, counts, names, bucket_days)
+        if median == 'auto':
+            median = 'exact' if self.exact_median(**filters) else 'approx'
+        if value_col != 'hotspots' and aggregate == 'median' and median == 'exact':
+            return self._exact_median_series(group_col, value_col, filters, day_buckets, bucket_days)
+
+        cells = self.cells
+        group_slots, names = self._group_slots(group_col)
+        keys = group_slots.astype(np.int64) * len(bucket_days) + day_buckets[cells['day']]
+        valid = group_slots < len(names)  # cells of missing categories are not a group
+        selected = self._selected(cells['day'], cells['fuel'], cells['source'], filters)
+        if selected is not None:
+            valid &= selected
+
+        if value_col == 'hotspots':
+            keys, (values,) = _merge(keys[valid], cells['count'][valid])
+        elif aggregate == 'median':
+            if median != 'approx':
+                raise ValueError(f'Invalid median mode: {median}')
+            keys, (sketches,) = _merge(keys[valid], cells[f'{value_col}_sketch'][valid])
+            values = self._sketch_median(value_col, sketches)
+        else:
+            keys, (sums, non_missing) = _merge(keys[valid], cells[f'{value_col}_sum'][valid],
+                                               cells[f'{value_col}_n'][valid])
+            if aggregate == 'sum':
+                values = sums
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    values = np.where(non_missing > 0, sums / np.maximum(non_missing, 1), np.nan)
+
+        return self._split(keys, values, names, bucket_days)
+
+
+    def row_count(self, **filters) -> int:
+        """
+        Number of rows in the cells matching `filters` (see series)
+        """
+        cells = self.cells
+        selected = self._selected(cells['day'], cells['fuel'], cells['source'], filters)
+        counts = cells['count'] if selected is None else cells['count'][selected]
+        return int(counts.sum())
+
+
+    def exact_median(self, **filters) -> bool:
+        """
+        Whether 'auto' medians of the cells matching `filters` (see series) are exact
+        """
+        return self.row_count(**filters) <= EXACT_MEDIAN_MAX_ROWS
+
+
+    def totals(self, group_col: str, value_col: str, events: np.ndarray | None = None, **filters) -> pd.Series:
+        """
+        Sum of `value_col` ('hotspots' counts rows, 'events' distinct fire events as in series) per
+        category of `group_col`, over the cells matching `filters` (see series). Categories without
+        values are left out. An event burning in several categories counts in each of them.
+        """
+        if value_col == 'events':
+            keys, counts, names = self._event_counts(group_col, events, filters)
+            return pd.Series(counts, index=pd.Index(np.asarray(names, dtype=object)[keys], name=group_col),
+                             name=value_col)
+        cells = self.cells
+        selected = self._selected(cells['day'], cells['fuel'], cells['source'], filters)
+        if selected is None or selected.all():
+            return self.group_totals[(group_col, value_col)]
+        return self._totals(group_col, value_col, selected)
+
+
+    def _totals(self, group_col: str, value_col: str, selected: np.ndarray | None) -> pd.Series:
+        cells = self.cells
+        group_slots, names = self._group_slots(group_col)
+        valid = group_slots < len(names)
+        if selected is not None:
+            valid &= selected
+        if value_col == 'hotspots':
+            sums = non_missing = cells['count']
+        else:
+            sums, non_missing = cells[f'{value_col}_sum'], cells[f'{value_col}_n']
+        totals = np.bincount(group_slots[valid], weights=sums[valid], minlength=len(names))
+        if value_col == 'hotspots':
+            # weighted bincount sums in float64, exact for counts
+            totals = totals.astype(np.int64)
+        present = np.bincount(group_slots[valid], weights=non_missing[valid], minlength=len(names)) > 0
+        return pd.Series(totals[present], index=pd.Index(np.asarray(names, dtype=object)[present], name=group_col),
+                         name=value_col)
+
+
+    @staticmethod
+    def _split(keys: np.ndarray, values: np.ndarray, names: list[str], days: np.ndarray) -> dict[str, pd.Series]:
+        groups = keys // len(days)
+        result = {}
+        for slot in np.unique(groups):
+            in_group = groups == slot
+            index = pd.DatetimeIndex(days[keys[in_group] % len(days)], name='rep_date')
+            result[str(names[slot])] = pd.Series(values[in_group], index=index)
+        return dict(sorted(result.items()))
+
+
+    def _sketch_median(self, value_col: str, sketches: np.ndarray) -> np.ndarray:
+        edges = self.sketch_edges[value_col]
+        totals = sketches.sum(axis=1)
+        medians = np.full(len(sketches), np.nan)
+        if len(edges) < 2:
+            medians[totals > 0] = edges[0]
+            return medians
+
+        cumulative = np.cumsum(sketches, axis=1)
+        half = totals / 2
+        bins = np.minimum((cumulative < half[:, None]).sum(axis=1), sketches.shape[1] - 1)
+        rows = np.arange(len(sketches))
+        before = np.where(bins > 0, cumulative[rows, bins - 1], 0)
+        in_bin = sketches[rows, bins]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip(np.where(in_bin > 0, (half - before) / in_bin, 0.5), 0, 1)
+        lo, hi = edges[bins], edges[bins + 1]
+        medians = lo + fraction * (hi - lo)
+        medians[totals == 0] = np.nan
+        return medians
+
+
+    def _event_counts(self, group_col: str | None, events: np.ndarray, filters: dict,
+                      day_buckets: np.ndarray | None = None, n_buckets: int = 1) -> tuple[np.ndarray, np.ndarray, list[str]]:
+        """
+        Distinct events among the rows matching `filters` per group slot and bucket of the rows:
+        sorted keys (slot * n_buckets + bucket), counts and the group names. Rows without an
+        event (negative) are left out.
+        """
+        if group_col is None:
+            slots, names = np.zeros(len(events), dtype=np.int32), ['all']
+        else:
+            _, names = self._group_slots(group_col)
+            slots = self._row_slots[group_col]
+        valid = (slots < len(names)) & (events >= 0)
+        selected = self._selected(self._row_days, self._row_slots['fuel'], self._row_slots['source'], filters)
+        if selected is not None:
+            valid &= selected
+        keys = slots[valid].astype(np.int64) * n_buckets
+        if day_buckets is not None:
+            keys += day_buckets[self._row_days[valid]]
+        n_events = int(events.max(initial=0)) + 1
+        pairs = np.unique(keys * n_events + events[valid])
+        keys, counts = np.unique(pairs // n_events, return_counts=True)
+        return keys, counts, names
+
+
+    def _exact_median_series(self, group_col: str | None, value_col: str, filters: dict,
+                             day_buckets: np.ndarray, bucket_days: np.ndarray) -> dict[str, pd.Series]:
+        values = self._df[value_col].to_numpy(dtype=np.float64)
+        selected = self._selected(self._row_days, self._row_slots['fuel'], self._row_slots['source'], filters)
+        row_buckets = day_buckets[self._row_days]
+        if group_col is None:
+            if selected is not None:
+                values, row_buckets = values[selected], row_buckets[selected]
+            medians = pd.Series(values).groupby(row_buckets).median()
+            keys = medians.index.to_numpy(dtype=np.int64)
+            return self._split(keys, medians.to_numpy(), ['all'], bucket_days)
+
+        _, names = self._group_slots(group_col)
+        slots = self._row_slots[group_col]
+        valid = slots < len(names)
+        if selected is not None:
+            valid &= selected
+        keys = slots[valid].astype(np.int64) * len(bucket_days) + row_buckets[valid]
+        medians = pd.Series(values[valid]).groupby(keys).median()
+        return self._split(medians.index.to_numpy(dtype=np.int64), medians.to_numpy(), names, bucket_days)
@@ -0,0 +1,72 @@
+import time
+import urllib.parse
+
+# seconds between polls for a background callback's result, shorter than the browser's
+POLL_INTERVAL = 0.02
+
+
+def _find_component(layout, component_id: str) -> dict | None:
+    if isinstance(layout, dict):
+        props = layout.get('props', {})
+        if props.get('id') == component_id:
+            return props
+        return _find_component(props.get('children'), component_id)
+    if isinstance(layout, list):
+        for child in layout:
+            found = _find_component(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+class DashClient:
+    """
+    Calls the app's callbacks as the browser does, with the values of the initial layout
+    unless overridden, so new inputs of a component need no change here. Not thread-safe,
+    clients of several threads can share the layout and dependencies of the first one.
+    """
+
+    def __init__(self, app, layout: dict | None = None, dependencies: list[dict] | None = None):
+        """
+        `layout` and `dependencies` as the app serves them to the browser, requested if None
+        """
+        self.client = app.server.test_client()
+        self.layout = self.client.get('/_dash-layout').get_json() if layout is None else layout
+        self.dependencies = self.client.get('/_dash-dependencies').get_json() if dependencies is None else dependencies
+
+
+    def value(self, component_id: str, prop: str):
+        props = _find_component(self.layout, component_id)
+        return None if props is None else props.get(prop)
+
+
+    def dependency(self, output: str) -> dict:
+        return next(dependency for dependency in self.dependencies if dependency['output'] == output)
+
+
+    def call(self, output: str, values: dict | None = None) -> dict:
+        """
+        Run the callback of `output` ('<id>.<property>'), `values` maps '<id>.<property>' to input values
+        """
+        dependency = self.dependency(output)
+        values = values or {}
+
+        def props(items: list[dict]) -> list[dict]:
+            return [{**item, 'value': values.get(f"{item['id']}.{item['property']}",
+                                                 self.value(item['id'], item['property']))} for item in items]
+
+        component_id, prop = output.rsplit('.', 1)
+        body = {'output': output, 'outputs': {'id': component_id, 'property': prop},
+                'inputs': props(dependency['inputs']), 'state': props(dependency['state']), 'changedPropIds': []}
+        path = '/_dash-update-component'
+        while True:
+            response = self.client.post(path, json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f'{output} returned {response.status_code}: {response.data[:200]!r}')
+            data = response.get_json()
+            if 'response' in data:
+                return data['response']
+            if 'cacheKey' in data:
+                # a background callback, poll for its result
+                path += '?' + urllib.parse.urlencode({'cacheKey': data['cacheKey'], 'job': data['job']})
+            time.sleep(POLL_INTERVAL)
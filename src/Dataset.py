@@ -1,32 +1,378 @@
+import threading
 from datetime import datetime
+import numpy as np
 import pandas as pd
 
+from ColumnStore import ColumnStore, ColumnStoreWriter, file_signature
+from DailyCube import DailyCube
+from FireEvents import FireEvents
+from GridIndex import GridIndex
+
+MEASURE_COLUMNS = ['estarea', 'fwi', 'ros', 'hfi']
+# columns read by the dashboard components, the only ones kept in compact mode
+USED_COLUMNS = ['lat', 'lon', 'rep_date', 'source', 'fuel'] + MEASURE_COLUMNS
+# read as strings even when a chunk only holds empty values, so the cached types are stable
+STRING_COLUMNS = ['source', 'sensor', 'satellite', 'agency', 'fuel']
+CACHE_SUFFIX = '.cache'
+CSV_CHUNK_SIZE = 500_000
+
+
+def _is_sorted_by_date(df: pd.DataFrame) -> bool:
+    return df['rep_date'].is_monotonic_increasing and not df['rep_date'].hasnans
+
+
+def _sorted_by_date(df: pd.DataFrame) -> pd.DataFrame:
+    if _is_sorted_by_date(df):
+        return df
+    df = df[df['rep_date'].notna()]
+    return df.sort_values('rep_date', kind='stable', ignore_index=True)
+
+
+def _concat(df: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rows of df followed by the rows of new_df, keeping the column types of df.
+    New categories are added after the existing ones, so existing codes stay valid.
+    """
+    columns = {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            new_values = new_df[col].astype(object)
+            categories = df[col].cat.categories
+            categories = categories.append(pd.Index(new_values.dropna().unique()).difference(categories))
+            codes = np.concatenate([df[col].array.codes, categories.get_indexer(new_values)])
+            columns[col] = pd.Categorical.from_codes(codes, categories)
+        elif pd.api.types.is_integer_dtype(df[col].dtype):
+            # downcast integers are promoted if the new values do not fit
+            columns[col] = pd.concat([df[col], new_df[col]], ignore_index=True)
+        else:
+            columns[col] = pd.concat([df[col], new_df[col].astype(df[col].dtype)], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def compact_hotspots(df: pd.DataFrame, extra_columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Keep only the columns the dashboard uses (plus `extra_columns`), store strings as
+    categoricals and downcast numbers: integral columns without missing values to the
+    smallest integer type, other floats to float32 (about 7 significant digits, i.e.
+    better than 1 m for lat/lon).
+    """
+    keep = USED_COLUMNS + [col for col in extra_columns or [] if col not in USED_COLUMNS]
+    columns = {}
+    for col in [col for col in df.columns if col in keep]:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(series.dtype):
+            columns[col] = series
+        elif pd.api.types.is_bool_dtype(series.dtype):
+            columns[col] = series
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            values = series.to_numpy()
+            if not series.hasnans and len(values) and np.all(np.mod(values, 1) == 0):
+                kind = 'unsigned' if values.min() >= 0 else 'integer'
+                columns[col] = pd.to_numeric(series, downcast=kind)
+            elif pd.api.types.is_float_dtype(series.dtype) and \
+                    np.nanmax(np.abs(values), initial=0) < np.finfo(np.float32).max:
+                columns[col] = series.astype(np.float32)
+            else:
+                columns[col] = series
+        else:
+            columns[col] = series.astype('category')
+    return pd.DataFrame(columns, copy=False)
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """
+    Memory per column of two versions of a frame, in bytes
+    """
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'bytes_before': before.memory_usage(index=False, deep=True),
+    })
+    # dropped columns take no memory
+    report['dtype_after'] = after.dtypes.astype(str).reindex(report.index, fill_value='dropped')
+    report['bytes_after'] = after.memory_usage(index=False, deep=True).reindex(report.index, fill_value=0)
+    report.loc['total'] = ['', report['bytes_before'].sum(), '', report['bytes_after'].sum()]
+    return report
+
+
+def read_hotspots_csv(file_path: str, **kwargs):
+    return pd.read_csv(file_path, dtype=dict.fromkeys(STRING_COLUMNS, str), **kwargs)
+
+
+def typed_hotspots(df: pd.DataFrame) -> pd.DataFrame:
+    df['rep_date'] = pd.to_datetime(df['rep_date'])
+    return df
+
+
+class _LazyEvents:
+    """
+    FireEvents of one state of the dataset, clustered on first use (clustering takes a few
+    times as long as loading the data, and only some charts need it)
+    """
+
+    def __init__(self, df: pd.DataFrame, days: np.ndarray, day_offsets: np.ndarray,
+                 events: FireEvents | None = None):
+        self._rows = (df, days, day_offsets)
+        self.events = events
+        self._lock = threading.Lock()
+
+
+    def get(self) -> FireEvents:
+        with self._lock:
+            if self.events is None:
+                self.events = FireEvents.build(*self._rows)
+            return self.events
+
 
 class Dataset:
-    def __init__(self, file_path: str):
-        self.df = pd.read_csv(file_path)
-        self.df['rep_date'] = pd.to_datetime(self.df['rep_date'])
+    def __init__(self, file_path: str, *, cache: bool = True, compact: bool = False,
+                 extra_columns: list[str] | None = None):
+        """
+        `file_path` is either a hotspots csv file or a ColumnStore directory.
+        A csv file is converted to a ColumnStore at `<file_path>.cache` the first time
+        it is loaded and read from there until the csv changes.
+        With `compact`, the rows are kept in memory in the smaller form of `compact_hotspots`.
+        """
+        store = None
+        if ColumnStore.exists(file_path):
+            store = ColumnStore(file_path)
+            df = store.read()
+        elif cache:
+            store = self._load_cached(file_path)
+            df = store.read()
+        else:
+            df = typed_hotspots(read_hotspots_csv(file_path))
+        if compact:
+            compact_df = compact_hotspots(df, extra_columns)
+            print(f"Memory per column:\n{memory_report(df, compact_df).to_string()}")
+            df = compact_df
+        self._set_df(df)
+        # appended rows go to the store while the rows in use are its memory-mapped columns
+        self._store = store if store is not None and self.df is df else None
+
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> 'Dataset':
+        dataset = cls.__new__(cls)
+        dataset._set_df(df)
+        dataset._store = None
+        return dataset
+
+
+    def _set_df(self, df: pd.DataFrame):
+        df = _sorted_by_date(df)
+        for col in ('source', 'fuel'):
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df = df.assign(**{col: df[col].astype('category')})
+        self._append_lock = threading.Lock()
+        # number of rows before the last append that moved existing rows (rows of earlier days
+        # are sorted in), -1 if none did. Other appends only add rows at the end.
+        self.reordered_rows = -1
+        self._swap(self._build_state(df))
 
+
+    def _build_state(self, df: pd.DataFrame, previous: dict | None = None) -> dict:
+        """
+        Everything derived from `df`. If `previous` is the state of the leading rows of `df`
+        (and `df` adds rows reported after them), the indexes and the cube are extended
+        instead of rebuilt.
+        """
+        state = {'df': df}
         # TODO: readonly
-        self.source_types = self.df['source'].unique().tolist()
-        self.fuel_types = self.df['fuel'].unique().tolist()
-        self.min_date: datetime = self.df['rep_date'].min()
-        self.max_date: datetime = self.df['rep_date'].max()
-    
+        state['min_date'] = df['rep_date'].min()
+        state['max_date'] = df['rep_date'].max()
+        # rep_date is sorted, so a date range is a contiguous slice found by binary search
+        rep_date = df['rep_date'].to_numpy(dtype='datetime64[ns]')
+        lat, lon = df['lat'].to_numpy(), df['lon'].to_numpy()
+        value_cols = [col for col in MEASURE_COLUMNS if col in df]
+
+        if previous is None:
+            state['source_types'] = df['source'].dropna().unique().tolist()
+            state['fuel_types'] = df['fuel'].dropna().unique().tolist()
+            # day_offsets[i]:day_offsets[i + 1] are the rows reported on days[i]
+            state['days'], day_starts = np.unique(rep_date.astype('datetime64[D]'), return_index=True)
+            state['day_offsets'] = np.append(day_starts, len(df))
+            state['grid_index'] = GridIndex(lat, lon)
+            state['cube'] = DailyCube(df, state['days'], state['day_offsets'], value_cols)
+            state['_events'] = _LazyEvents(df, state['days'], state['day_offsets'])
+        else:
+            start = len(previous['df'])
+            new_rows = df.iloc[start:]
+            for col, key in (('source', 'source_types'), ('fuel', 'fuel_types')):
+                added = [t for t in new_rows[col].dropna().unique().tolist() if t not in previous[key]]
+                state[key] = previous[key] + added
+            new_days, new_day_starts = np.unique(rep_date[start:].astype('datetime64[D]'), return_index=True)
+            if len(previous['days']) and new_days[0] == previous['days'][-1]:
+                # the first new day continues the last known day
+                new_days, new_day_starts = new_days[1:], new_day_starts[1:]
+            state['days'] = np.concatenate([previous['days'], new_days])
+            state['day_offsets'] = np.concatenate([previous['day_offsets'][:-1], new_day_starts + start, [len(df)]])
+            state['grid_index'] = previous['grid_index'].extended(lat, lon)
+            state['cube'] = previous['cube'].extended(df, state['days'], state['day_offsets'], start)
+            # events already clustered are extended with the new days, otherwise clustered on first use
+            events = previous['_events'].events
+            if events is not None:
+                events = events.extended(df, state['days'], state['day_offsets'], start)
+            state['_events'] = _LazyEvents(df, state['days'], state['day_offsets'], events)
+
+        # category codes used to build selection bitmasks, -1 (missing) never matches
+        codes = {col: df[col].array.codes for col in ('source', 'fuel')}
+        has_missing = {col: bool(df[col].hasnans) for col in ('source', 'fuel')}
+        # read at once by filter(), so a concurrent append() never mixes old and new data
+        state['_index'] = (df, rep_date, codes, has_missing, state['grid_index'])
+        return state
+
+
+    def _swap(self, state: dict):
+        # bumped whenever the data changes, part of the key of anything derived from it
+        state['version'] = getattr(self, 'version', -1) + 1
+        # a single dict update, callbacks see either the old or the new data
+        self.__dict__.update(state)
+
+
+    @property
+    def events(self) -> FireEvents:
+        """
+        Fire events of the rows (`events.table` has one row per event, `events.row_events` the
+        event of every row), clustered on first use
+        """
+        return self._events.get()
+
+
+    def append(self, df: pd.DataFrame):
+        """
+        Add hotspots (e.g. newly downloaded days) to the dataset. When every new row is reported
+        after the current last row, the indexes and the cube are extended incrementally.
+
+        A dataset read from a column store (not `compact`) appends such rows to the store and maps
+        them from there, so processes serving the same store (gunicorn workers) share them through
+        the page cache. The store then holds the appended rows for later runs too. Other rows, or a
+        store changed in another way, make the dataset keep its own copy of all rows in memory.
+        """
+        if len(df) == 0:
+            return
+        with self._append_lock:
+            df = _sorted_by_date(df.reindex(columns=self.df.columns))
+            incremental = len(self.df) > 0 and df['rep_date'].iloc[0] >= self.max_date
+            combined = self._append_to_store(df) if incremental else None
+            if combined is None:
+                self._store = None
+                combined = _concat(self.df, df)
+            if incremental:
+                previous = {key: getattr(self, key) for key in
+                            ('df', 'source_types', 'fuel_types', 'days', 'day_offsets', 'grid_index', 'cube',
+                             '_events')}
+                self._swap(self._build_state(combined, previous))
+            else:
+                state = self._build_state(_sorted_by_date(combined))
+                state['reordered_rows'] = len(self.df)
+                self._swap(state)
+
+
+    def _append_to_store(self, df: pd.DataFrame) -> pd.DataFrame | None:
+        # all rows, read from the store after `df` is appended to it, None if it cannot be
+        if self._store is None:
+            return None
+        try:
+            store = self._store.append(df)
+        except OSError as e:
+            print(f"Failed to append to the column store '{self._store.path}', keeping the rows in memory: {e}")
+            return None
+        if store is None:
+            print(f"The column store '{self._store.path}' changed, keeping the rows in memory")
+            return None
+        self._store = store
+        return store.read()
+
+
+    @staticmethod
+    def _load_cached(file_path: str) -> ColumnStore:
+        cache_path = file_path + CACHE_SUFFIX
+        if ColumnStore.exists(cache_path):
+            store = ColumnStore(cache_path)
+            if store.is_fresh(file_path):
+                return store
+            print(f"'{file_path}' changed, rebuilding cache '{cache_path}'...")
+        else:
+            print(f"Building cache '{cache_path}'...")
+
+        # hash before parsing, so a file modified during the build is not marked fresh
+        source = file_signature(file_path)
+        writer = ColumnStoreWriter(cache_path, float32_columns=MEASURE_COLUMNS)
+        for chunk in read_hotspots_csv(file_path, chunksize=CSV_CHUNK_SIZE):
+            writer.append(typed_hotspots(chunk))
+        store = writer.close(source)
+
+        # store the rows sorted by date, so later loads skip sorting
+        df = store.read()
+        if not _is_sorted_by_date(df):
+            store = ColumnStoreWriter.write(cache_path, _sorted_by_date(df),
+                                            float32_columns=MEASURE_COLUMNS, source=source)
+        return store
+
+
+    @staticmethod
+    def _date_slice(rep_date: np.ndarray, min_date: datetime | None, max_date: datetime | None) -> slice:
+        lo = 0 if min_date is None else \
+            np.searchsorted(rep_date, np.datetime64(min_date, 'ns'), side='left')
+        hi = len(rep_date) if max_date is None else \
+            np.searchsorted(rep_date, np.datetime64(max_date, 'ns'), side='right')
+        return slice(int(lo), int(max(lo, hi)))
+
+
+    @staticmethod
+    def _category_mask(df: pd.DataFrame, codes: np.ndarray, has_missing: bool, col: str, values: list[str],
+                       rows: slice | np.ndarray) -> np.ndarray | None:
+        """
+        Bitmask of the rows in `rows` whose `col` is one of `values`, None if every row matches
+        """
+        categories = df[col].cat.categories
+        selected = np.zeros(len(categories) + 1, dtype=bool)
+        selected[:-1] = categories.isin(values)
+        if selected[:-1].all() and not has_missing:
+            return None
+        # code -1 indexes the trailing False entry
+        return selected[codes[rows]]
+
+
+    def filter_positions(self, *,
+                         min_date: datetime | None = None,
+                         max_date: datetime | None = None,
+                         sources: list[str] | None = None,
+                         fuels: list[str] | None = None,
+                         bounds: list[float] | None = None
+    ) -> tuple[pd.DataFrame, slice | np.ndarray]:
+        """
+        The dataset's rows and the positions of the rows `filter` returns among them (a slice or
+        sorted positions), so they can be read a part at a time (e.g. by an export)
+        """
+        df, rep_date, codes, has_missing, grid_index = self._index
+        rows = self._date_slice(rep_date, min_date, max_date)
+        if bounds is not None:
+            rows = grid_index.query(bounds, rows)
+
+        mask = None
+        for col, values in (('source', sources), ('fuel', fuels)):
+            if values is None:
+                continue
+            col_mask = self._category_mask(df, codes[col], has_missing[col], col, values, rows)
+            if col_mask is not None:
+                mask = col_mask if mask is None else mask & col_mask
+        if mask is not None:
+            rows = rows[mask] if isinstance(rows, np.ndarray) else rows.start + np.flatnonzero(mask)
+        return df, rows
+
 
     def filter(self, *,
                min_date: datetime | None = None,
                max_date: datetime | None = None,
                sources: list[str] | None = None,
-               fuels: list[str] | None = None
+               fuels: list[str] | None = None,
+               bounds: list[float] | None = None
     ):
-        df = self.df
-        if min_date is not None:
-            df = df[df['rep_date'] >= min_date]
-        if max_date is not None:
-            df = df[df['rep_date'] <= max_date]
-        if sources is not None:
-            df = df[df['source'].isin(sources)]
-        if fuels is not None:
-            df = df[df['fuel'].isin(fuels)]
-        return df
+        """
+        Rows reported between min_date and max_date (inclusive), from the given sources and fuels,
+        inside `bounds` ([min_lat, max_lat, min_lon, max_lon]).
+        """
+        df, rows = self.filter_positions(min_date=min_date, max_date=max_date, sources=sources, fuels=fuels,
+                                         bounds=bounds)
+        return df.iloc[rows]
@@ -0,0 +1,74 @@
+import os
+import threading
+
+import pandas as pd
+
+from Dataset import Dataset, read_hotspots_csv, typed_hotspots
+
+
+class DatasetWatcher:
+    """
+    Poll a directory of daily CWFIS csv files (e.g. the output directory of
+    scripts/download_cwfis.py) and append the files that appear in it to a running Dataset.
+
+    Files already in the directory when the watcher is created are assumed to be part of
+    the dataset. Files are expected to appear complete (the downloader writes them to a
+    temporary file first and renames them).
+    """
+
+    def __init__(self, dataset: Dataset, watch_dir: str, interval: float = 60.0):
+        self.dataset = dataset
+        self.watch_dir = watch_dir
+        self.interval = interval
+        self._seen = set(self._csv_files())
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+
+    def _csv_files(self) -> list[str]:
+        if not os.path.isdir(self.watch_dir):
+            return []
+        return sorted(filter(lambda x: x.endswith('.csv'), os.listdir(self.watch_dir)))
+
+
+    def poll(self) -> int:
+        """
+        Append the files that appeared since the last poll, returns the number of rows appended
+        """
+        new_files = [filename for filename in self._csv_files() if filename not in self._seen]
+        frames = []
+        for filename in new_files:
+            try:
+                df = read_hotspots_csv(os.path.join(self.watch_dir, filename), skipinitialspace=True)
+                df.columns = df.columns.str.strip()
+                frames.append(typed_hotspots(df))
+            except Exception as e:
+                print(f"Failed to read '{filename}', skipping: {e}")
+            self._seen.add(filename)
+        if not frames:
+            return 0
+
+        # one append for all new files, so derived data is rebuilt and swapped in once
+        df = pd.concat(frames, ignore_index=True)
+        self.dataset.append(df)
+        print(f"Appended {len(df)} hotspots from {len(frames)} new file(s), dataset version {self.dataset.version}")
+        return len(df)
+
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Failed to update the dataset from '{self.watch_dir}': {e}")
+
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='dataset-watcher', daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
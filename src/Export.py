@@ -0,0 +1,261 @@
+import io
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+
+import numpy as np
+
+from Dataset import Dataset
+
+# rows converted and sent at a time, the output is never held in memory as a whole
+CHUNK_ROWS = 65_536
+# rows of a page when no limit is given, and at most: a large export is requested page by page,
+# so no request keeps a server worker busy for long
+PAGE_ROWS = 1_000_000
+# format: (mimetype, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+class ExportError(ValueError):
+    """
+    Invalid export parameters, `status` is the HTTP status of the response
+    """
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class _Sink(io.RawIOBase):
+    """
+    File the Parquet and Arrow writers write to, whose content is taken after every chunk
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+
+    def writable(self) -> bool:
+        return True
+
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+
+    def tell(self) -> int:
+        return self._position
+
+
+    def take(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _check_format(format: str):
+    # Parquet and Arrow are written with pyarrow, an optional dependency
+    if format == 'csv':
+        return
+    try:
+        import pyarrow
+        if format == 'parquet':
+            import pyarrow.parquet
+    except ImportError:
+        raise ExportError(f'Exporting {format} needs pyarrow (pip install pyarrow)', status=501)
+
+
+def _list(args, name: str) -> list[str] | None:
+    # a=x&a=y or a=x,y, None when the parameter is absent, an empty value selects nothing
+    if name not in args:
+        return None
+    return [value for values in args.getlist(name) for value in values.split(',') if value]
+
+
+def _date(args, name: str, end: bool) -> datetime | None:
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        if len(value) == len('YYYY-MM-DD'):
+            day = date.fromisoformat(value)
+            # a max_date day includes all of it, like the date range of the filter panel
+            return datetime.fromordinal(day.toordinal() + 1) - timedelta(microseconds=1) if end \
+                else datetime.fromordinal(day.toordinal())
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Invalid {name}: '{value}', expected YYYY-MM-DD or an ISO timestamp")
+
+
+def _int(args, name: str, default: int) -> int:
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise ExportError(f"Invalid {name}: '{value}', expected a non-negative integer")
+    return number
+
+
+def parse_filters(args) -> dict:
+    """
+    Keyword arguments of Dataset.filter from the query parameters `args` (a werkzeug MultiDict):
+    min_date, max_date (YYYY-MM-DD, inclusive, or ISO timestamps), sources, fuels (comma
+    separated or repeated) and bounds (min_lat,max_lat,min_lon,max_lon)
+    """
+    filters = {
+        'min_date': _date(args, 'min_date', end=False),
+        'max_date': _date(args, 'max_date', end=True),
+        'sources': _list(args, 'sources'),
+        'fuels': _list(args, 'fuels'),
+        'bounds': None,
+    }
+    if args.get('bounds'):
+        try:
+            bounds = [float(value) for value in args['bounds'].split(',')]
+        except ValueError:
+            bounds = []
+        if len(bounds) != 4:
+            raise ExportError(f"Invalid bounds: '{args['bounds']}', expected min_lat,max_lat,min_lon,max_lon")
+        filters['bounds'] = bounds
+    return filters
+
+
+def export_query(filters: dict, format: str = 'csv') -> str:
+    """
+    Query string of the export of the filter panel's `filters` (see Selection)
+    """
+    [first_day, last_day] = filters['date_range']
+    params = [
+        ('format', format),
+        ('min_date', date.fromordinal(first_day).isoformat()),
+        ('max_date', date.fromordinal(last_day).isoformat()),
+        ('sources', ','.join(filters['sources'])),
+        ('fuels', ','.join(filters['fuels'])),
+    ]
+    if filters['bounds'] is not None:
+        params.append(('bounds', ','.join(str(value) for value in filters['bounds'])))
+    return urlencode(params)
+
+
+class Export:
+    """
+    A page of the rows of a dataset matching the query parameters of the export route, see
+    `parse_filters` for the filters and the README for the other parameters. The rows are
+    converted and yielded CHUNK_ROWS at a time by `chunks`.
+    """
+
+    def __init__(self, dataset: Dataset, args):
+        self.format = args.get('format', 'csv')
+        if self.format not in FORMATS:
+            raise ExportError(f"Invalid format: '{self.format}', expected one of {', '.join(FORMATS)}")
+        _check_format(self.format)
+        self.mimetype, self.extension = FORMATS[self.format]
+        # the pages of an export come from the dataset's first `rows` rows when the export started:
+        # later days are appended after them, so any worker that appended the same files (maybe
+        # more, maybe in other batches) serves the same pages
+        filters = parse_filters(args)
+        df, rows = dataset.filter_positions(**filters)
+        self.dataset_rows = _int(args, 'rows', len(df))
+        if self.dataset_rows > len(df):
+            raise ExportError(f'This server process has {len(df)} of the {self.dataset_rows} rows of the export '
+                              'yet, try again later', status=503)
+        # read after the rows, an append in between is seen here
+        if dataset.reordered_rows >= self.dataset_rows:
+            raise ExportError(f'Rows of earlier days were added since the export started '
+                              f'({self.dataset_rows} rows), start the export again', status=409)
+        if isinstance(rows, slice):
+            rows = slice(min(rows.start, self.dataset_rows), min(rows.stop, self.dataset_rows))
+        else:
+            rows = rows[:np.searchsorted(rows, self.dataset_rows)]
+        self.total = rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+        self.offset = _int(args, 'offset', 0)
+        limit = min(_int(args, 'limit', PAGE_ROWS), PAGE_ROWS)
+        if limit == 0:
+            # an empty page would link to itself
+            raise ExportError('Invalid limit: 0, expected a positive integer')
+
+        columns = _list(args, 'columns')
+        if columns is not None:
+            unknown = [col for col in columns if col not in df]
+            if unknown:
+                raise ExportError(f"Unknown columns: {', '.join(unknown)}")
+        self.columns = list(df.columns) if columns is None else columns
+        self._column_positions = df.columns.get_indexer(self.columns)
+        self._df = df
+        self._rows = rows
+        self._page = slice(min(self.offset, self.total), min(self.offset + limit, self.total))
+
+
+    @property
+    def next_offset(self) -> int | None:
+        """
+        Offset of the next page, None if this is the last one
+        """
+        return self._page.stop if self._page.stop < self.total else None
+
+
+    def _frames(self):
+        start, stop = self._page.start, self._page.stop
+        # at least one (maybe empty) frame, so an empty page still has a header or a schema
+        for lo in range(start, max(stop, start + 1), CHUNK_ROWS):
+            hi = min(lo + CHUNK_ROWS, stop)
+            rows = slice(self._rows.start + lo, self._rows.start + hi) if isinstance(self._rows, slice) \
+                else self._rows[lo:hi]
+            # only the chunk's values of the exported columns are copied
+            yield self._df.iloc[rows, self._column_positions]
+
+
+    def chunks(self):
+        """
+        The page in the export's format, a chunk of bytes at a time
+        """
+        if self.format == 'csv':
+            for i, frame in enumerate(self._frames()):
+                yield frame.to_csv(index=False, header=i == 0).encode()
+            return
+
+        import pyarrow as pa
+        sink = _Sink()
+        writer, schema = None, None
+        for frame in self._frames():
+            table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                if self.format == 'parquet':
+                    import pyarrow.parquet as pq
+                    writer = pq.ParquetWriter(sink, schema)
+                else:
+                    writer = pa.ipc.new_stream(sink, schema)
+            if table.num_rows:
+                writer.write_table(table)
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+
+
+    def headers(self, path: str, args) -> dict:
+        """
+        Response headers of the page: the total rows, the dataset rows it comes from and a link to the next
+        page (`path` with `args` and the next offset), to be followed until there is none
+        """
+        headers = {
+            'Content-Disposition': f'attachment; filename="hotspots-{self.offset}.{self.extension}"',
+            'X-Total-Rows': str(self.total),
+            'X-Dataset-Rows': str(self.dataset_rows),
+        }
+        if self.next_offset is not None:
+            params = [(name, value) for name, value in args.items(multi=True) if name not in ('offset', 'rows')]
+            params += [('offset', self.next_offset), ('rows', self.dataset_rows)]
+            headers['Link'] = f'<{path}?{urlencode(params)}>; rel="next"'
+        return headers
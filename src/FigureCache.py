@@ -0,0 +1,164 @@
+import functools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+from CallbackMetrics import phase, record_payload
+
+DEFAULT_MAX_BYTES = 256 * 2**20
+# elements of a longer array encoded to estimate its serialized size
+SIZE_SAMPLE = 256
+
+
+def _normalize(value):
+    """
+    Turn callback inputs into a hashable key, lists of strings (checklist
+    selections) are sorted since their order does not change the figure
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        items = tuple(_normalize(v) for v in value)
+        if items and all(isinstance(v, str) for v in items):
+            return tuple(sorted(items))
+        return items
+    return value
+
+
+def _encoded_size(value) -> int:
+    # the encoder of Dash's responses, e.g. float32 values are written with float32 precision
+    return len(to_json_plotly(value))
+
+
+def payload_size(value) -> int:
+    """
+    Estimated size of `value` (e.g. a figure) serialized as Dash sends it to the browser. Long
+    arrays (the points of the traces) are replaced by an evenly spaced sample of SIZE_SAMPLE
+    elements, whose size is scaled up, so sizing a figure costs a fraction of serializing it.
+    """
+    extra = 0
+
+    def sampled(item):
+        nonlocal extra
+        if hasattr(item, 'to_plotly_json'):
+            return sampled(item.to_plotly_json())
+        if isinstance(item, dict):
+            return {key: sampled(child) for key, child in item.items()}
+        if isinstance(item, (pd.Series, pd.Index)):
+            item = item.to_numpy()
+        if isinstance(item, (list, tuple, np.ndarray)) and len(item) > SIZE_SAMPLE:
+            sample = item[::len(item) // SIZE_SAMPLE][:SIZE_SAMPLE]
+            # the sample's elements and commas, without the brackets
+            extra += int((_encoded_size(sample) - 2) * (len(item) / len(sample) - 1))
+            return sample
+        if isinstance(item, (list, tuple)):
+            return [sampled(child) for child in item]
+        return item
+
+    return _encoded_size(sampled(value)) + extra
+
+
+class FigureCache:
+    """
+    LRU cache of callback results (figures) shared by all dashboard components.
+    Entries are keyed by component id, normalized inputs and dataset version, and
+    evicted least recently used first once their serialized size (see `payload_size`)
+    exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[tuple, tuple[object, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def _lookup(self, key: tuple) -> tuple[object, int] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+
+    def get(self, key: tuple):
+        entry = self._lookup(key)
+        return None if entry is None else entry[0]
+
+
+    def put(self, key: tuple, value: object) -> int:
+        """
+        Cache `value` if it fits, returns its (estimated) serialized size
+        """
+        # the size of what Dash sends to the browser, not the python object size, estimated as
+        # Dash serializes the value again (timed as the serialize phase)
+        with phase('serialize'):
+            size = payload_size(value)
+        if size > self.max_bytes:
+            return size
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.num_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.num_bytes += size
+            while self.num_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.num_bytes -= evicted_size
+                self.evictions += 1
+        return size
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.num_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+    def memoize(self, component_id: str, dataset):
+        """
+        Decorator for a callback function, to be placed under `@app.callback`:
+
+            @app.callback(Output('heatmap', 'figure'), ...)
+            @figure_cache.memoize('heatmap', dataset)
+            def update(...): ...
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args):
+                key = (component_id, dataset.version, _normalize(args))
+                entry = self._lookup(key)
+                if entry is None:
+                    value = fn(*args)
+                    record_payload(self.put(key, value), cached=False)
+                else:
+                    value, size = entry
+                    record_payload(size, cached=True)
+                return value
+            return wrapper
+        return decorator
+
+
+# shared by all components
+figure_cache = FigureCache()
@@ -0,0 +1,248 @@
+import numpy as np
+import pandas as pd
+
+# hotspots in the same or adjacent cells of a grid of this size (so up to about 2.8 cells apart)...
+DEFAULT_DISTANCE_KM = 1.0
+# ... reported at most this many days apart belong to the same fire
+DEFAULT_MAX_GAP_DAYS = 3
+KM_PER_DEGREE = 111.32
+# cells are this many degrees of longitude wide at most, near the poles
+MAX_CELL_LON_DEGREES = 10.0
+# cell keys are row * 2**32 + column + COL_OFFSET
+COL_OFFSET = 2**31
+# label of the rows without coordinates
+NO_EVENT = -1
+
+
+def _components(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Connected components of the graph of `n` nodes with the edges a[i] - b[i]: the smallest
+    node of the component of each node. Roots are hooked under smaller roots across the edges,
+    then every node is pointed at its root, until no edge joins two roots.
+    """
+    parent = np.arange(n)
+    while True:
+        root_a, root_b = parent[a], parent[b]
+        joining = root_a != root_b
+        if not joining.any():
+            return parent
+        # edges inside a component stay inside it
+        a, b, root_a, root_b = a[joining], b[joining], root_a[joining], root_b[joining]
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def _first(groups: np.ndarray, n: int) -> np.ndarray:
+    """
+    Index of the first element of each of the `n` groups (n for empty groups)
+    """
+    first = np.full(n, len(groups), dtype=np.int64)
+    np.minimum.at(first, groups, np.arange(len(groups)))
+    return first
+
+
+class FireEvents:
+    """
+    Hotspots grouped into fire events. Two hotspots are linked when they are in the same or
+    adjacent cells of a grid of `distance_km` (rows of equal latitude, cells of equal width in
+    km along each row) and were reported at most `max_gap_days` apart. An event is a group of
+    hotspots linked directly or through others of the event.
+
+    Days are clustered in order, each against the cells seen in the last `max_gap_days` days
+    only, found by binary search in their sorted keys, so the work grows with the number of
+    hotspots instead of its square, and appended days extend the events (see `extended`).
+
+    `row_events` is the event of every row (NO_EVENT without coordinates) and `table` has one
+    row per event: first and last day, centroid, number of hotspots, total estarea and max hfi.
+    Events are numbered in the order of their first hotspot.
+    """
+
+    def __init__(self, distance_km: float = DEFAULT_DISTANCE_KM, max_gap_days: int = DEFAULT_MAX_GAP_DAYS):
+        self.distance_km = distance_km
+        self.max_gap_days = max_gap_days
+        # label of every row when it was clustered, events merged later are resolved by _merges
+        self._labels = np.empty(0, dtype=np.int64)
+        self._num_labels = 0
+        # (merged label, label it was merged into)
+        self._merges = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        # cells seen in the last max_gap_days days: sorted keys, label and last day (day number)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._key_labels = np.empty(0, dtype=np.int64)
+        self._key_days = np.empty(0, dtype=np.int64)
+        self._last_day = None
+
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, days: np.ndarray, day_offsets: np.ndarray, **kwargs) -> 'FireEvents':
+        """
+        Events of the rows of `df`, sorted by date, with the days and day offsets of Dataset
+        """
+        events = cls(**kwargs)
+        events._add(df, days, day_offsets, 0)
+        return events
+
+
+    def extended(self, df: pd.DataFrame, days: np.ndarray, day_offsets: np.ndarray, start: int) -> 'FireEvents':
+        """
+        Events of `df`, whose rows before `start` are the rows these events were built from (in
+        the same order) and whose later rows were reported on or after the last day of them.
+        Only the new rows are clustered, the events of the old ones are shared, not copied.
+        Gives the same events as building them from all of `df`.
+        """
+        events = FireEvents.__new__(FireEvents)
+        events.__dict__.update(self.__dict__)
+        events._add(df, days, day_offsets, start)
+        return events
+
+
+    def _cell_keys(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        row = np.floor(lat * KM_PER_DEGREE / self.distance_km).astype(np.int64)
+        col = np.floor(lon / self._cell_width(row)).astype(np.int64)
+        return row * 2**32 + col + COL_OFFSET
+
+
+    def _cell_width(self, row: np.ndarray) -> np.ndarray:
+        # degrees of longitude of distance_km at the middle of the grid row
+        lat = np.radians((row + 0.5) * self.distance_km / KM_PER_DEGREE)
+        return np.minimum(self.distance_km / (KM_PER_DEGREE * np.maximum(np.cos(lat), 1e-9)), MAX_CELL_LON_DEGREES)
+
+
+    def _neighbor_keys(self, keys: np.ndarray):
+        """
+        For sorted `keys`, batches of (index of a cell in `keys`, key of a neighbor): the cells in
+        the rows above, below and of the cell overlapping it widened by a cell on both sides.
+        Keys within a batch are sorted too, which makes looking them up faster.
+        """
+        row, col = keys // 2**32, keys % 2**32 - COL_OFFSET
+        width = self._cell_width(row)
+        for d_row in (-1, 0, 1):
+            other_row = row + d_row
+            if d_row == 0:
+                first, last = col - 1, col + 1
+            else:
+                other_width = self._cell_width(other_row)
+                first = np.floor((col - 1) * width / other_width).astype(np.int64)
+                last = np.ceil((col + 2) * width / other_width).astype(np.int64) - 1
+            for offset in range(int((last - first).max(initial=0)) + 1):
+                other_col = first + offset
+                within = np.flatnonzero(other_col <= last)
+                yield within, other_row[within] * 2**32 + other_col[within] + COL_OFFSET
+
+
+    @staticmethod
+    def _lookup(sorted_keys: np.ndarray, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Indices of `keys` found in `sorted_keys`, and their positions there
+        """
+        positions = np.searchsorted(sorted_keys, keys)
+        found = positions < len(sorted_keys)
+        found[found] = sorted_keys[positions[found]] == keys[found]
+        return np.flatnonzero(found), positions[found]
+
+
+    def _add(self, df: pd.DataFrame, days: np.ndarray, day_offsets: np.ndarray, start: int):
+        lat = df['lat'].to_numpy(dtype=np.float64)[start:]
+        lon = df['lon'].to_numpy(dtype=np.float64)[start:]
+        day_numbers = days.astype('datetime64[D]').astype(np.int64)
+        labels = np.full(len(lat), NO_EVENT, dtype=np.int64)
+        merged_from, merged_into = [self._merges[0]], [self._merges[1]]
+        keys, key_labels, key_days = self._keys, self._key_labels, self._key_days
+
+        for i in range(int(np.searchsorted(day_offsets, start, side='right')) - 1, len(days)):
+            lo, hi = max(int(day_offsets[i]), start) - start, int(day_offsets[i + 1]) - start
+            if lo >= hi:
+                continue
+            day = day_numbers[i]
+            recent = key_days >= day - self.max_gap_days
+            if not recent.all():
+                keys, key_labels, key_days = keys[recent], key_labels[recent], key_days[recent]
+
+            located = np.flatnonzero(~(np.isnan(lat[lo:hi]) | np.isnan(lon[lo:hi])))
+            day_keys, first_rows, row_cells = np.unique(self._cell_keys(lat[lo:hi][located], lon[lo:hi][located]),
+                                                        return_index=True, return_inverse=True)
+            # nodes: the day's cells, then the events of the recent cells
+            known_labels, key_nodes = np.unique(key_labels, return_inverse=True)
+            n_cells = len(day_keys)
+            edges_a, edges_b = [], []
+            for sources, neighbors in self._neighbor_keys(day_keys):
+                found, positions = self._lookup(day_keys, neighbors)
+                edges_a.append(sources[found])
+                edges_b.append(positions)
+                found, positions = self._lookup(keys, neighbors)
+                edges_a.append(sources[found])
+                edges_b.append(n_cells + key_nodes[positions])
+            root = _components(n_cells + len(known_labels), np.concatenate(edges_a), np.concatenate(edges_b))
+
+            # the earliest event of each component, events it joined are merged into it
+            component_labels = np.full(n_cells + len(known_labels), np.iinfo(np.int64).max)
+            np.minimum.at(component_labels, root[n_cells:], known_labels)
+            known_into = component_labels[root[n_cells:]]
+            joined = known_into != known_labels
+            merged_from.append(known_labels[joined])
+            merged_into.append(known_into[joined])
+            # components without an event are new events, numbered by their first hotspot
+            cell_roots = root[:n_cells]
+            new_roots = np.unique(cell_roots[component_labels[cell_roots] == np.iinfo(np.int64).max])
+            if len(new_roots):
+                first_row = np.full(n_cells + len(known_labels), np.iinfo(np.int64).max)
+                np.minimum.at(first_row, cell_roots, first_rows)
+                new_roots = new_roots[np.argsort(first_row[new_roots], kind='stable')]
+                component_labels[new_roots] = self._num_labels + np.arange(len(new_roots))
+                self._num_labels += len(new_roots)
+            cell_labels = component_labels[cell_roots]
+            labels[lo:hi][located] = cell_labels[row_cells]
+
+            # the day's cells replace the recent ones with the same key
+            key_labels = known_into[key_nodes]
+            keys, first = np.unique(np.concatenate([day_keys, keys]), return_index=True)
+            key_labels = np.concatenate([cell_labels, key_labels])[first]
+            key_days = np.concatenate([np.full(n_cells, day), key_days])[first]
+
+        self._labels = np.concatenate([self._labels, labels])
+        self._merges = (np.concatenate(merged_from), np.concatenate(merged_into))
+        self._keys, self._key_labels, self._key_days = keys, key_labels, key_days
+        self._set_table(df)
+
+
+    def _set_table(self, df: pd.DataFrame):
+        # labels point at the label they were merged into, that one may have been merged later
+        parent = np.arange(self._num_labels)
+        parent[self._merges[0]] = self._merges[1]
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+        # merges keep the smaller label, the one of the earlier first hotspot, so the order of the
+        # remaining labels is the order of the events' first hotspots
+        located = self._labels != NO_EVENT
+        event_labels, row_events = np.unique(parent[self._labels[located]], return_inverse=True)
+        self.row_events = np.full(len(self._labels), NO_EVENT, dtype=np.int32 if len(event_labels) < 2**31 else np.int64)
+        self.row_events[located] = row_events
+        n_events = len(event_labels)
+
+        rows = np.flatnonzero(located)
+        rep_date = df['rep_date'].to_numpy(dtype='datetime64[ns]')[rows]
+        counts = np.bincount(row_events, minlength=n_events)
+        # rows are sorted by date: the first and last row of an event are its first and last day
+        last = len(rows) - 1 - _first(row_events[::-1], n_events)
+        table = {
+            'start_date': rep_date[_first(row_events, n_events)].astype('datetime64[D]'),
+            'end_date': rep_date[last].astype('datetime64[D]'),
+            'lat': np.bincount(row_events, weights=df['lat'].to_numpy(dtype=np.float64)[rows], minlength=n_events) / counts,
+            'lon': np.bincount(row_events, weights=df['lon'].to_numpy(dtype=np.float64)[rows], minlength=n_events) / counts,
+            'hotspots': counts,
+        }
+        if 'estarea' in df:
+            estarea = df['estarea'].to_numpy(dtype=np.float64)[rows]
+            valid = ~np.isnan(estarea)
+            table['estarea'] = np.bincount(row_events[valid], weights=estarea[valid], minlength=n_events)
+        if 'hfi' in df:
+            hfi = np.full(n_events, np.nan)
+            np.fmax.at(hfi, row_events, df['hfi'].to_numpy(dtype=np.float64)[rows])
+            table['hfi'] = hfi
+        self.table = pd.DataFrame(table, index=pd.RangeIndex(n_events, name='event'))
@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 64 * 2**20
+DEFAULT_WORKERS = 4
+# callers whose last prefetch is remembered, e.g. the selections being played back
+MAX_PREFETCH_OWNERS = 64
+
+
+class FrameCache:
+    """
+    Animation frames (e.g. the gridded heatmap of one day) built in the background on a
+    pool of threads, numpy releases the GIL for most of the work and the threads share the
+    dataset. Built frames are kept until their total size exceeds `max_bytes`, least recently
+    used first out, so moving back and forth between frames never builds one twice.
+
+    Every caller (`owner`) of `prefetch` replaces its own previous prefetch only, and a frame
+    someone waits for in `get` is never cancelled.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, workers: int = DEFAULT_WORKERS):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-cache')
+        self._entries: OrderedDict[tuple, Future] = OrderedDict()
+        self._sizes: dict[tuple, int] = {}
+        # keys of the last prefetch of each owner, least recently used first
+        self._prefetched: OrderedDict[object, list[tuple]] = OrderedDict()
+        # number of get() calls waiting for each key
+        self._waiters: dict[tuple, int] = {}
+        # reentrant: a future that is done already runs its callback when it is added
+        self._lock = threading.RLock()
+
+
+    def _submit(self, key: tuple, build) -> Future:
+        # called with the lock held
+        future = self._entries.get(key)
+        if future is not None and not future.cancelled():
+            self._entries.move_to_end(key)
+            return future
+        future = self._entries[key] = self._executor.submit(build)
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+
+    def _done(self, key: tuple, future: Future):
+        if future.cancelled():
+            # removed by whoever cancelled it
+            return
+        if future.exception() is not None:
+            with self._lock:
+                if self._entries.get(key) is future:
+                    del self._entries[key]
+            return
+        value = future.result()
+        size = int(value.memory_usage(index=True).sum()) if isinstance(value, pd.DataFrame) else 0
+        with self._lock:
+            if self._entries.get(key) is not future:
+                return
+            self._sizes[key] = size
+            self.num_bytes += size
+            # evict built frames only, pending ones are not counted yet
+            for old_key in list(self._entries):
+                if self.num_bytes <= self.max_bytes or old_key == key:
+                    break
+                if old_key in self._sizes:
+                    del self._entries[old_key]
+                    self.num_bytes -= self._sizes.pop(old_key)
+
+
+    def _cancel(self, key: tuple):
+        # called with the lock held: drop a frame nobody waits for that has not started yet
+        future = self._entries.get(key)
+        if future is not None and key not in self._waiters and future.cancel():
+            del self._entries[key]
+
+
+    def get(self, key: tuple, build):
+        """
+        The frame of `key`, built by `build()` now unless it is built or being built already
+        """
+        while True:
+            with self._lock:
+                future = self._submit(key, build)
+                self._waiters[key] = self._waiters.get(key, 0) + 1
+            try:
+                return future.result()
+            except CancelledError:
+                # cancelled before it was waited for, build it again
+                continue
+            finally:
+                with self._lock:
+                    self._waiters[key] -= 1
+                    if not self._waiters[key]:
+                        del self._waiters[key]
+
+
+    def prefetch(self, frames: list[tuple[tuple, object]], owner: object = None):
+        """
+        Build the (key, build) `frames` in the background, in order. Frames of the previous
+        prefetch of `owner` that have not started yet are cancelled, e.g. when its animation
+        changes, unless another owner prefetched them too or someone waits for them.
+        """
+        with self._lock:
+            keys = [key for key, _ in frames]
+            previous = self._prefetched.pop(owner, [])
+            self._prefetched[owner] = keys
+            while len(self._prefetched) > MAX_PREFETCH_OWNERS:
+                self._prefetched.popitem(last=False)
+            if keys == previous:
+                return
+            wanted = set(keys).union(*self._prefetched.values())
+            for key in previous:
+                if key not in wanted:
+                    self._cancel(key)
+            for key, build in frames:
+                self._submit(key, build)
+
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._cancel(key)
+            # frames being waited for finish for their waiters, without being kept
+            self._entries.clear()
+            self._sizes.clear()
+            self._prefetched.clear()
+            self.num_bytes = 0
+
+
+# shared by all components
+frame_cache = FrameCache()
@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+
+# cell size of the index in degrees
+GRID_INDEX_CELL_SIZE = 1.0
+
+
+class GridIndex:
+    """
+    Bucket index of the rows by a regular lat/lon grid, for bounding box queries.
+
+    Row ids are grouped by cell (cells in row-major order) and kept in increasing order
+    within a cell. Cells of one grid row that overlap a bounding box are therefore one
+    contiguous range of `row_ids`, and a box query only touches the rows of those cells.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_size: float = GRID_INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self.n_rows = int(math.ceil(180 / cell_size))
+        self.n_cols = int(math.ceil(360 / cell_size))
+        self._lat = lat
+        self._lon = lon
+
+        cells = self._cells(lat, lon)
+        # a stable sort keeps row ids increasing within each cell, uint16 cells are radix sorted
+        cell_dtype = np.uint16 if self.n_rows * self.n_cols <= np.iinfo(np.uint16).max else np.uint32
+        row_id_dtype = np.int32 if len(lat) <= np.iinfo(np.int32).max else np.int64
+        self.row_ids = np.argsort(cells.astype(cell_dtype), kind='stable').astype(row_id_dtype)
+        self.cell_starts = np.r_[0, np.cumsum(np.bincount(cells, minlength=self.n_rows * self.n_cols))]
+
+
+    def _cells(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        row = np.clip(np.floor((np.nan_to_num(lat) + 90) / self.cell_size), 0, self.n_rows - 1).astype(np.int64)
+        col = np.clip(np.floor((np.nan_to_num(lon) + 180) / self.cell_size), 0, self.n_cols - 1).astype(np.int64)
+        return row * self.n_cols + col
+
+
+    @property
+    def nbytes(self) -> int:
+        return self.row_ids.nbytes + self.cell_starts.nbytes
+
+
+    def query(self, bounds: list[float], rows: slice | None = None) -> np.ndarray:
+        """
+        Sorted ids of the rows inside `bounds` ([min_lat, max_lat, min_lon, max_lon], inclusive),
+        limited to the row id range `rows` if given. When `rows` holds fewer rows than the cells
+        under `bounds` (e.g. a day at country zoom), its rows are tested directly instead.
+        """
+        min_lat, max_lat, min_lon, max_lon = bounds
+        (row0, col0), (row1, col1) = [
+            divmod(int(cell), self.n_cols) for cell in self._cells(np.array([min_lat, max_lat]),
+                                                                   np.array([min_lon, max_lon]))
+        ]
+        ranges = [(self.cell_starts[row * self.n_cols + col0], self.cell_starts[row * self.n_cols + col1 + 1])
+                  for row in range(row0, row1 + 1)]
+
+        if rows is not None and rows.stop - rows.start <= sum(stop - start for start, stop in ranges):
+            lat, lon = self._lat[rows], self._lon[rows]
+            inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+            return (np.flatnonzero(inside) + rows.start).astype(self.row_ids.dtype)
+
+        pieces = [self.row_ids[start:stop] for start, stop in ranges]
+        ids = np.concatenate(pieces) if pieces else np.empty(0, dtype=self.row_ids.dtype)
+        if rows is not None:
+            ids = ids[(ids >= rows.start) & (ids < rows.stop)]
+
+        # cells on the border of the box are only partially inside
+        lat, lon = self._lat[ids], self._lon[ids]
+        ids = ids[(lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)]
+        ids.sort()
+        return ids
+
+
+    def extended(self, lat: np.ndarray, lon: np.ndarray) -> 'GridIndex':
+        """
+        Index of `lat`/`lon`, whose leading rows are the rows this index was built from,
+        merging the new rows into the existing buckets without sorting the old ones again
+        """
+        start = len(self.row_ids)
+        n_cells = self.n_rows * self.n_cols
+        new_cells = self._cells(lat[start:], lon[start:])
+        new_counts = np.bincount(new_cells, minlength=n_cells)
+        new_starts = np.r_[0, np.cumsum(new_counts)]
+        old_counts = np.diff(self.cell_starts)
+
+        index = GridIndex.__new__(GridIndex)
+        index.cell_size, index.n_rows, index.n_cols = self.cell_size, self.n_rows, self.n_cols
+        index._lat, index._lon = lat, lon
+        index.cell_starts = self.cell_starts + new_starts
+        row_id_dtype = np.int32 if len(lat) <= np.iinfo(np.int32).max else np.int64
+        index.row_ids = np.empty(len(lat), dtype=row_id_dtype)
+
+        # old rows move back by the number of new rows in the cells before theirs
+        old_row_cells = np.repeat(np.arange(n_cells), old_counts)
+        index.row_ids[np.arange(start) + new_starts[old_row_cells]] = self.row_ids
+        # new rows go after the old rows of their cell, in increasing order
+        order = np.argsort(new_cells, kind='stable')
+        sorted_cells = new_cells[order]
+        positions = index.cell_starts[sorted_cells] + old_counts[sorted_cells] \
+            + np.arange(len(order)) - new_starts[sorted_cells]
+        index.row_ids[positions] = order + start
+        return index
@@ -0,0 +1,303 @@
+import glob
+import itertools
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+import dash
+
+# the manager plugs into private parts of Dash 2 (the callback context, AttributeDict and the
+# long callback managers), which Dash 3 reworked
+if not (2, 16) <= tuple(int(part) for part in dash.__version__.split('.')[:2]) < (3, 0):
+    raise ImportError(f'JobManager needs dash >= 2.16, < 3, found dash {dash.__version__} '
+                      "(pip install 'dash>=2.16,<3')")
+
+from dash._callback_context import context_value  # noqa: E402
+from dash._utils import AttributeDict  # noqa: E402
+from dash.exceptions import PreventUpdate  # noqa: E402
+from dash.long_callback.managers import BaseLongCallbackManager  # noqa: E402
+
+DEFAULT_WORKERS = 4
+# milliseconds between the browser's polls for the result of a background callback
+POLL_INTERVAL = 250
+# finished results are kept this long for the requests polling for them
+RESULT_TTL = 60
+# requests whose browser never polled again (e.g. the tab was closed)
+TICKET_TTL = 600
+CLEANUP_INTERVAL = 10
+
+# the job running on this thread, if any
+_current = threading.local()
+
+
+class JobCancelled(BaseException):
+    """
+    Not an Exception, like asyncio.CancelledError, so error handlers (and the callback
+    metrics) do not take a cancelled job for a failed one
+    """
+
+
+def checkpoint(message: str | None = None):
+    """
+    Called between the steps of a background callback: stops it (raises JobCancelled) if no
+    request is waiting for its result any more, otherwise shows `message` as its progress.
+    Does nothing outside of a background job.
+    """
+    job = getattr(_current, 'job', None)
+    if job is None:
+        return
+    if not job.manager._wanted(job.key):
+        raise JobCancelled(job.key)
+    if message is not None:
+        job.manager._set_progress(job.key, [message])
+
+
+class _Job:
+    def __init__(self, manager: 'JobManager', key: str):
+        self.manager = manager
+        self.key = key
+
+
+class JobManager(BaseLongCallbackManager):
+    """
+    Background callback manager (`Dash(background_callback_manager=...)`) running the jobs on
+    a pool of threads of the process that got the request, without an external broker.
+
+    Every request for a job gets its own ticket. Identical requests (same callback and
+    inputs) share one job, whose result is kept for RESULT_TTL seconds. A job is cancelled at
+    its next `checkpoint` once none of its tickets is left, e.g. when the browser sent a newer
+    request for the callback. Tickets, progress and results are files in `directory`, so
+    worker processes forked from the process that made the manager can answer each other's
+    polls (results are pickled). `directory` and `workers` can be set until the first job.
+    """
+
+    def __init__(self, directory: str | None = None, workers: int = DEFAULT_WORKERS):
+        self.directory = directory
+        self.workers = workers
+        self._executor = None
+        # keys of the jobs running in this process
+        self._running: set[str] = set()
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._last_cleanup = 0.0
+        # threads do not survive a fork, e.g. gunicorn forking its workers after the app warmed up
+        os.register_at_fork(after_in_child=self._after_fork)
+        super().__init__(cache_by=None)
+
+
+    def _after_fork(self):
+        self._executor = None
+        self._running = set()
+        self._lock = threading.Lock()
+
+
+    def _path(self, name: str) -> str:
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='cwfis-jobs-')
+        return os.path.join(self.directory, name)
+
+
+    def _write(self, name: str, data: bytes):
+        # readers never see a partly written file
+        tmp_path = self._path(f'.{name}.{os.getpid()}.{threading.get_ident()}')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(name))
+
+
+    @staticmethod
+    def _key(ticket: str) -> str:
+        return ticket.split('.', 1)[0]
+
+
+    def _wanted(self, key: str) -> bool:
+        return bool(glob.glob(self._path(f'ticket-{key}.*')))
+
+
+    def _set_progress(self, key: str, progress: list):
+        self._write(f'progress-{key}', json.dumps(progress).encode())
+
+
+    def _owner_alive(self, key: str) -> bool:
+        try:
+            with open(self._path(f'running-{key}'), 'r') as f:
+                pid = int(f.read())
+        except (OSError, ValueError):
+            return False
+        if pid == os.getpid():
+            return key in self._running
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+
+    def _cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        for path in glob.glob(self._path('*')):
+            name = os.path.basename(path)
+            try:
+                age = now - os.path.getmtime(path)
+                if (name.startswith(('result-', 'progress-')) and age > RESULT_TTL) or \
+                        (name.startswith('ticket-') and age > TICKET_TTL) or \
+                        (name.startswith('running-') and not self._owner_alive(name[len('running-'):])):
+                    os.remove(path)
+            except OSError:
+                # removed by another process meanwhile
+                pass
+
+
+    def make_job_fn(self, fn, progress, key=None):
+        def job_fn(job: _Job, args, context):
+            def run() -> bool:
+                c = AttributeDict(**context)
+                c.ignore_register_page = False
+                c.updated_props = {}
+                context_value.set(c)
+                _current.job = job
+                try:
+                    checkpoint()
+                    if isinstance(args, dict):
+                        result = fn(**args)
+                    elif isinstance(args, (list, tuple)):
+                        result = fn(*args)
+                    else:
+                        result = fn(args)
+                except JobCancelled:
+                    return False
+                except PreventUpdate:
+                    result = {'_dash_no_update': '_dash_no_update'}
+                except Exception as err:
+                    result = {'long_callback_error': {'msg': str(err), 'tb': traceback.format_exc()}}
+                finally:
+                    _current.job = None
+                # a figure's plain dict, unpickling a figure validates all of it again
+                if hasattr(result, 'to_plotly_json'):
+                    result = result.to_plotly_json()
+                self._write(f'result-{job.key}', pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+                return True
+
+            finished = False
+            try:
+                finished = copy_context().run(run)
+            finally:
+                with self._lock:
+                    try:
+                        os.remove(self._path(f'running-{job.key}'))
+                    except OSError:
+                        pass
+                    # a request may have joined the job while it was being cancelled,
+                    # it saw the job running (tickets are written before that is checked)
+                    if not finished and self._wanted(job.key):
+                        self._write(f'running-{job.key}', str(os.getpid()).encode())
+                        self._executor.submit(job_fn, job, args, context)
+                    else:
+                        self._running.discard(job.key)
+        return job_fn
+
+
+    def call_job_fn(self, key, job_fn, args, context):
+        self._cleanup()
+        ticket = f'{key}.{os.getpid()}-{next(self._counter)}'
+        self._write(f'ticket-{ticket}', b'')
+        with self._lock:
+            # finished a moment ago, or running here or in another process: share it
+            if os.path.exists(self._path(f'result-{key}')) or self._owner_alive(key):
+                return ticket
+            self._running.add(key)
+            self._write(f'running-{key}', str(os.getpid()).encode())
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='background-job')
+        self._executor.submit(job_fn, _Job(self, key), args, context)
+        return ticket
+
+
+    def terminate_job(self, job):
+        if job is None:
+            return
+        try:
+            os.remove(self._path(f'ticket-{job}'))
+        except OSError:
+            pass
+
+
+    def terminate_unhealthy_job(self, job):
+        key = self._key(job)
+        if os.path.exists(self._path(f'running-{key}')) and not self._owner_alive(key):
+            os.remove(self._path(f'running-{key}'))
+            return True
+        return False
+
+
+    def job_running(self, job):
+        if job is None:
+            return False
+        key = self._key(job)
+        if not os.path.exists(self._path(f'ticket-{job}')):
+            return False
+        # a result that appeared after get_result looked is picked up by the next poll
+        return self._owner_alive(key) or os.path.exists(self._path(f'result-{key}'))
+
+
+    def get_progress(self, key):
+        try:
+            with open(self._path(f'progress-{key}'), 'r') as f:
+                progress = json.load(f)
+            os.remove(self._path(f'progress-{key}'))
+        except (OSError, ValueError):
+            return None
+        return progress
+
+
+    def result_ready(self, key):
+        return os.path.exists(self._path(f'result-{key}'))
+
+
+    def get_result(self, key, job):
+        try:
+            with open(self._path(f'result-{key}'), 'rb') as f:
+                result = pickle.load(f)
+        except OSError:
+            return self.UNDEFINED
+        # kept for the other requests sharing it, until it expires
+        self.terminate_job(job)
+        return result
+
+
+    def get_updated_props(self, key):
+        return {}
+
+
+    def clear_cache_entry(self, key):
+        for name in (f'result-{key}', f'progress-{key}'):
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+
+    def clear(self):
+        """
+        Forget the finished results, e.g. to time the jobs again
+        """
+        for path in glob.glob(self._path('result-*')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# shared by all components
+job_manager = JobManager()
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from DailyCube import DailyCube
+from Dataset import Dataset, MEASURE_COLUMNS
+
+# selections kept per process, each may hold a copy of the selected rows
+DEFAULT_MAX_ENTRIES = 8
+
+
+def selection_key(version: int, filters: dict) -> str:
+    return hashlib.sha1(json.dumps([version, filters], sort_keys=True).encode()).hexdigest()
+
+
+class Selection:
+    """
+    Rows of the dataset matching the filter panel, shared by every component.
+    The rows and anything derived from them are computed once, on first use, even when
+    several callbacks ask for them at the same time.
+
+    `filters` is a dict of 'date_range' ([first day, last day] as ordinals, inclusive),
+    'sources', 'fuels' and 'bounds' ([min_lat, max_lat, min_lon, max_lon] or None).
+    """
+
+    def __init__(self, dataset: Dataset, filters: dict):
+        self.dataset = dataset
+        self.filters = filters
+        [first_day, last_day] = filters['date_range']
+        self.min_date = datetime.fromordinal(first_day)
+        # up to the end of the last day
+        self.max_date = datetime.fromordinal(last_day + 1) - timedelta(microseconds=1)
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+
+    def _memo(self, name: tuple, compute):
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._values:
+                self._values[name] = compute()
+            return self._values[name]
+
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self._memo(('df',), lambda: self.dataset.filter(
+            min_date=self.min_date, max_date=self.max_date,
+            sources=self.filters['sources'], fuels=self.filters['fuels'], bounds=self.filters['bounds']))
+
+
+    def within(self, bounds: list[float] | None) -> pd.DataFrame:
+        """
+        Selected rows inside `bounds` (e.g. the view of a map), all of them if None
+        """
+        df = self.df
+        if bounds is None:
+            return df
+        lat, lon = self._memo(('lat_lon',), lambda: (df['lat'].to_numpy(), df['lon'].to_numpy()))
+        min_lat, max_lat, min_lon, max_lon = bounds
+        return df[(lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)]
+
+
+    def between(self, first_day: int, last_day: int) -> pd.DataFrame:
+        """
+        Selected rows reported from `first_day` to `last_day` (ordinals, inclusive)
+        """
+        df = self.df
+        # the selection keeps the dataset's order by date
+        rep_date = self._memo(('rep_date',), lambda: df['rep_date'].to_numpy(dtype='datetime64[ns]'))
+        lo = np.searchsorted(rep_date, np.datetime64(datetime.fromordinal(first_day), 'ns'), side='left')
+        hi = np.searchsorted(rep_date, np.datetime64(datetime.fromordinal(last_day + 1), 'ns'), side='left')
+        return df.iloc[lo:hi]
+
+
+    def _row_events(self, value_col: str) -> np.ndarray | None:
+        """
+        Fire events of the dataset's rows, for the 'events' value (None for other values)
+        """
+        return self.dataset.events.row_events if value_col == 'events' else None
+
+
+    def _selected_row_events(self, value_col: str) -> np.ndarray | None:
+        # the selected rows keep their positions in the dataset as their index
+        if value_col != 'events':
+            return None
+        return self._memo(('row_events',), lambda: self._row_events(value_col)[self.df.index.to_numpy()])
+
+
+    def _cube(self) -> DailyCube:
+        df = self.df
+        rep_date = df['rep_date'].to_numpy(dtype='datetime64[ns]')
+        days, day_starts = np.unique(rep_date.astype('datetime64[D]'), return_index=True)
+        return DailyCube(df, days, np.append(day_starts, len(df)), [col for col in MEASURE_COLUMNS if col in df])
+
+
+    def series(self, group_col: str | None, value_col: str, aggregate: str = 'sum',
+               bucket: str = 'day') -> dict[str, pd.Series]:
+        """
+        DailyCube.series of the selected rows. Without bounds, the cells of the dataset's
+        cube are filtered, otherwise a cube of the selected rows is built once. 'events'
+        counts the distinct fire events of the rows.
+        """
+        def compute():
+            if self.filters['bounds'] is None:
+                return self.dataset.cube.series(group_col, value_col, aggregate, bucket=bucket,
+                                                events=self._row_events(value_col),
+                                                min_date=self.min_date, max_date=self.max_date,
+                                                sources=self.filters['sources'], fuels=self.filters['fuels'])
+            cube = self._memo(('cube',), self._cube)
+            return cube.series(group_col, value_col, aggregate, bucket=bucket,
+                               events=self._selected_row_events(value_col))
+        return self._memo(('series', group_col, value_col, aggregate, bucket), compute)
+
+
+    def row_count(self) -> int:
+        """
+        Number of selected rows, counted in the dataset's cube unless there are bounds
+        """
+        def compute():
+            if self.filters['bounds'] is None:
+                return self.dataset.cube.row_count(min_date=self.min_date, max_date=self.max_date,
+                                                   sources=self.filters['sources'], fuels=self.filters['fuels'])
+            return len(self.df)
+        return self._memo(('row_count',), compute)
+
+
+    def exact_median(self) -> bool:
+        """
+        Whether the medians of `series` are exact rather than estimated from the cube's sketches
+        """
+        def compute():
+            if self.filters['bounds'] is None:
+                return self.dataset.cube.exact_median(min_date=self.min_date, max_date=self.max_date,
+                                                      sources=self.filters['sources'], fuels=self.filters['fuels'])
+            return self._memo(('cube',), self._cube).exact_median()
+        return self._memo(('exact_median',), compute)
+
+
+    def totals(self, group_col: str, value_col: str) -> pd.Series:
+        """
+        DailyCube.totals of the selected rows, from the dataset's cube unless there are bounds
+        """
+        def compute():
+            if self.filters['bounds'] is None:
+                return self.dataset.cube.totals(group_col, value_col, events=self._row_events(value_col),
+                                                min_date=self.min_date, max_date=self.max_date,
+                                                sources=self.filters['sources'], fuels=self.filters['fuels'])
+            cube = self._memo(('cube',), self._cube)
+            return cube.totals(group_col, value_col, events=self._selected_row_events(value_col))
+        return self._memo(('totals', group_col, value_col), compute)
+
+
+class SelectionCache:
+    """
+    Selections by key, least recently used first out. The filter panel puts only the key and
+    the filters in the browser (a dcc.Store), components look the selection up by key and
+    rebuild it from the filters if it is not here (evicted, or made by another worker process).
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Selection] = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def state(self, dataset: Dataset, filters: dict) -> dict:
+        """
+        The dcc.Store data of `filters`, the selection is computed when first used
+        """
+        return {'key': selection_key(dataset.version, filters), 'filters': filters}
+
+
+    def get(self, dataset: Dataset, state: dict) -> Selection:
+        with self._lock:
+            selection = self._entries.get(state['key'])
+            if selection is None:
+                selection = self._entries[state['key']] = Selection(dataset, state['filters'])
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(state['key'])
+            return selection
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# shared by all components
+selection_cache = SelectionCache()
@@ -0,0 +1,80 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# when this module was first imported, app.py imports it before the heavy modules
+PROCESS_START = time.perf_counter()
+
+
+class Startup:
+    """
+    Progress of the app's startup: how long each phase took, the phase running now, and
+    whether the app is ready to serve the dashboard (or failed to start)
+    """
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self.current: str | None = None
+        self.error: str | None = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._last = PROCESS_START
+
+
+    @contextmanager
+    def phase(self, name: str):
+        with self._lock:
+            self.current = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+                self.current = None
+
+
+    def mark(self, name: str):
+        """
+        Record the time since the previous mark (or the process start) as phase `name`
+        """
+        now = time.perf_counter()
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + now - self._last
+            self._last = now
+
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+
+    def set_ready(self):
+        self._ready.set()
+        print(self.report())
+
+
+    def fail(self, error: str):
+        self.error = error
+        print(f'Startup failed: {error}')
+
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'phase': self.current,
+                'error': self.error,
+                'phases': dict(self.phases),
+                'elapsed': time.perf_counter() - PROCESS_START,
+            }
+
+
+    def report(self) -> str:
+        with self._lock:
+            phases = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in self.phases.items())
+        return f'Ready in {time.perf_counter() - PROCESS_START:.2f}s ({phases})'
@@ -0,0 +1,234 @@
+import json
+import math
+import os
+import shutil
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from spatial_binning import cell_size
+
+META_FILE_NAME = 'meta.json'
+FORMAT_VERSION = 1
+TILES_SUFFIX = '.tiles'
+# map zoom levels with precomputed tiles, deeper zooms show few enough hotspots to bin the rows
+DEFAULT_ZOOMS = list(range(0, 7))
+# grid cell ids of deeper zooms do not fit the uint32 cell field
+MAX_ZOOM = 10
+GROUP_COLS = ['fuel', 'source']
+
+
+def _write_meta(path: str, meta: dict):
+    tmp_path = os.path.join(path, f'{META_FILE_NAME}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, META_FILE_NAME))
+
+
+def _grid_cells(lat: np.ndarray, lon: np.ndarray, size: float) -> np.ndarray:
+    # the grid of spatial_binning.bin_points
+    n_cols = int(math.ceil(360 / size))
+    row = np.floor((lat + 90) / size).astype(np.int64)
+    col = np.clip(np.floor((lon + 180) / size).astype(np.int64), 0, n_cols - 1)
+    return row * n_cols + col
+
+
+class TileStore:
+    """
+    Gridded hotspot aggregates per (day, fuel, source, grid cell) at several map zoom levels,
+    using the grid of spatial_binning.bin_points at each zoom. A directory next to the dataset
+    (`<dataset path>.tiles`) with a `meta.json` and one memory-mappable file per zoom and field.
+
+    Records of a zoom are sorted by day, so a date range is a contiguous slice, and the heatmap
+    of a selection is a sum over the matching records instead of a pass over the rows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE_NAME), 'r') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported tile store format in '{path}'")
+        self.days = np.array(self.meta['days'], dtype='datetime64[D]')
+        self.day_counts = np.array(self.meta['day_counts'], dtype=np.int64)
+        self.categories = self.meta['categories']
+        self.value_cols = self.meta['value_cols']
+        self.zooms = [int(zoom) for zoom in self.meta['zooms']]
+
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, META_FILE_NAME))
+
+
+    @classmethod
+    def open_for(cls, dataset_path: str, dataset) -> 'TileStore | None':
+        """
+        The tile store of the dataset loaded from `dataset_path`, None if there is none
+        or it was built from other data
+        """
+        path = dataset_path.rstrip('/\\') + TILES_SUFFIX
+        if not cls.exists(path):
+            return None
+        store = cls(path)
+        if not store.covers(dataset):
+            print(f"Tile store '{path}' does not match the data, rebuild it with scripts/build_tiles.py")
+            return None
+        return store
+
+
+    def covers(self, dataset) -> bool:
+        """
+        Whether the tiles were built from the dataset's current rows (the same hotspots per day)
+        """
+        return len(self.days) == len(dataset.days) and bool(np.all(self.days == dataset.days)) and \
+            bool(np.all(self.day_counts == np.diff(dataset.day_offsets)))
+
+
+    def _memmap(self, zoom: int, field: str, dtype: str) -> np.ndarray:
+        num_records = self.meta['num_records'][str(zoom)]
+        if num_records == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, f'z{zoom}_{field}.bin'), dtype=dtype, mode='r',
+                         shape=(num_records,))
+
+
+    def _slots(self, col: str, values: list[str] | None) -> np.ndarray | None:
+        # selected slots, the missing slot after the last category only when there is no filter
+        if values is None:
+            return None
+        selected = np.zeros(len(self.categories[col]) + 1, dtype=bool)
+        selected[:-1] = np.isin(self.categories[col], values)
+        return selected
+
+
+    def cells(self, zoom: int, value_col: str, aggregate: str, first_day: int, last_day: int,
+              sources: list[str] | None = None, fuels: list[str] | None = None,
+              bounds: list[float] | None = None) -> pd.DataFrame:
+        """
+        Same as spatial_binning.bin_points(rows, value_col, cell_size(zoom), aggregate) for the rows
+        reported from `first_day` to `last_day` (ordinals, inclusive) matching `sources` and `fuels`
+        (None for all). With `bounds`, cells overlapping them are kept, so hotspots just outside of
+        them may be counted in the edge cells.
+        """
+        if aggregate not in ('sum', 'mean'):
+            raise ValueError(f'Invalid aggregate type: {aggregate}')
+        offsets = self.meta['day_offsets'][str(zoom)]
+        lo = offsets[np.searchsorted(self.days, np.datetime64(date.fromordinal(first_day), 'D'), side='left')]
+        hi = offsets[np.searchsorted(self.days, np.datetime64(date.fromordinal(last_day), 'D'), side='right')]
+
+        cells = self._memmap(zoom, 'cell', 'uint32')[lo:hi].astype(np.int64)
+        mask = np.ones(len(cells), dtype=bool)
+        for col, values in (('fuel', fuels), ('source', sources)):
+            selected = self._slots(col, values)
+            if selected is not None:
+                mask &= selected[self._memmap(zoom, col, self.meta['slot_dtype'])[lo:hi]]
+
+        size = cell_size(zoom)
+        n_cols = int(math.ceil(360 / size))
+        if bounds is not None:
+            min_lat, max_lat, min_lon, max_lon = bounds
+            row, col = cells // n_cols, cells % n_cols
+            mask &= (row >= math.floor((min_lat + 90) / size)) & (row <= math.floor((max_lat + 90) / size)) & \
+                (col >= math.floor((min_lon + 180) / size)) & (col <= math.floor((max_lon + 180) / size))
+
+        sums = self._memmap(zoom, f'{value_col}_sum', 'float32')[lo:hi][mask]
+        # the number of values is only stored for columns with missing values
+        count_field = f'{value_col}_n' if value_col in self.meta['missing_value_cols'] else 'count'
+        counts = self._memmap(zoom, count_field, 'uint32')[lo:hi][mask]
+        unique_cells, inverse = np.unique(cells[mask], return_inverse=True)
+        counts = np.bincount(inverse, weights=counts, minlength=len(unique_cells))
+        z = np.bincount(inverse, weights=sums, minlength=len(unique_cells))
+        # cells whose hotspots all miss the value are not in bin_points either
+        present = counts > 0
+        unique_cells, counts, z = unique_cells[present], counts[present].astype(np.int64), z[present]
+        if aggregate == 'mean':
+            z = z / counts
+
+        return pd.DataFrame({
+            'lat': (unique_cells // n_cols + 0.5) * size - 90,
+            'lon': (unique_cells % n_cols + 0.5) * size - 180,
+            value_col: z,
+            'count': counts,
+        })
+
+
+def build_tiles(dataset, path: str, zooms: list[int] | None = None) -> TileStore:
+    """
+    Write the tile store of a Dataset to `path`, through a temporary directory moved into place
+    """
+    zooms = DEFAULT_ZOOMS if zooms is None else sorted(zooms)
+    if zooms and (zooms[0] < 0 or zooms[-1] > MAX_ZOOM):
+        raise ValueError(f'Tile zoom levels must be between 0 and {MAX_ZOOM}')
+    df = dataset.df
+    value_cols = list(dataset.cube.value_cols)
+    categories = {col: [str(name) for name in df[col].cat.categories] for col in GROUP_COLS}
+    max_slot = max(len(names) for names in categories.values())
+    slot_dtype = next(dtype for dtype in ('int8', 'int16', 'int32') if max_slot <= np.iinfo(dtype).max)
+    # missing categories get their own slot after the last category
+    slots = {}
+    for col in GROUP_COLS:
+        codes = df[col].array.codes
+        slots[col] = np.where(codes < 0, len(categories[col]), codes).astype(np.int64)
+    row_days = np.repeat(np.arange(len(dataset.days), dtype=np.int64), np.diff(dataset.day_offsets))
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['lon'].to_numpy(dtype=np.float64)
+    located = ~(np.isnan(lat) | np.isnan(lon))
+    values = {col: df[col].to_numpy(dtype=np.float64)[located] for col in value_cols}
+    missing_value_cols = [col for col in value_cols if np.isnan(values[col]).any()]
+    row_days, lat, lon = row_days[located], lat[located], lon[located]
+    slots = {col: col_slots[located] for col, col_slots in slots.items()}
+
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    num_records, day_offsets = {}, {}
+    n_fuel, n_source = len(categories['fuel']) + 1, len(categories['source']) + 1
+    for zoom in zooms:
+        cells = _grid_cells(lat, lon, cell_size(zoom))
+        # sorted by day first, then fuel, source and cell
+        keys = ((row_days * n_fuel + slots['fuel']) * n_source + slots['source']) * (cells.max(initial=0) + 1) + cells
+        record_keys, inverse = np.unique(keys, return_inverse=True)
+        # a row of each record
+        first = np.zeros(len(record_keys), dtype=np.int64)
+        first[inverse[::-1]] = np.arange(len(keys))[::-1]
+        n_records = len(record_keys)
+
+        # sums in float32 like the value columns, the query adds them up in float64
+        fields = {
+            'cell': cells[first].astype(np.uint32),
+            'fuel': slots['fuel'][first].astype(slot_dtype),
+            'source': slots['source'][first].astype(slot_dtype),
+            'count': np.bincount(inverse, minlength=n_records).astype(np.uint32),
+        }
+        for col in value_cols:
+            valid = ~np.isnan(values[col])
+            fields[f'{col}_sum'] = np.bincount(inverse[valid], weights=values[col][valid], minlength=n_records) \
+                .astype(np.float32)
+            if col in missing_value_cols:
+                fields[f'{col}_n'] = np.bincount(inverse[valid], minlength=n_records).astype(np.uint32)
+        for field, array in fields.items():
+            np.ascontiguousarray(array).tofile(os.path.join(tmp_path, f'z{zoom}_{field}.bin'))
+
+        record_days = row_days[first]
+        num_records[str(zoom)] = n_records
+        day_offsets[str(zoom)] = np.searchsorted(record_days, np.arange(len(dataset.days) + 1)).tolist()
+
+    _write_meta(tmp_path, {
+        'format_version': FORMAT_VERSION,
+        'days': [str(day) for day in dataset.days],
+        'day_counts': np.diff(dataset.day_offsets).tolist(),
+        'categories': categories,
+        'slot_dtype': slot_dtype,
+        'value_cols': value_cols,
+        'missing_value_cols': missing_value_cols,
+        'zooms': zooms,
+        'num_records': num_records,
+        'day_offsets': day_offsets,
+    })
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return TileStore(path)
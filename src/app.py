@@ -1,35 +1,266 @@
+# first, the startup times count from its import
+from Startup import Startup
 import argparse
-from dash import Dash, html
+import json
+import os
+import sys
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dash import Dash, dcc, html, no_update, Input, Output, State
+from flask import Response, request
 
-from Dataset import Dataset
-from components.box_plot import box_plot
-from components.heatmap import heatmap
-from components.pie_chart import pie_chart
-from components.scatter_mapbox import scatter_mapbox
-from components.trend_line_chart import trend_line_chart
+from CallbackMetrics import callback_metrics
+from FigureCache import figure_cache
+from JobManager import DEFAULT_WORKERS, job_manager
+# the dataset, the components and the modules they need (pandas, plotly express) are
+# imported by build_dashboard, so the server can bind its port before they are loaded
 
-def parse_args():
+# milliseconds between the startup page's polls for its progress
+STARTUP_POLL_INTERVAL = 500
+
+def parse_args(argv: list[str] | None = None):
     parser = argparse.ArgumentParser()
     parser.add_argument('-f', '--hotspots-file-path', type=str, required=True)
     parser.add_argument('--port', type=int, default=24804)
     parser.add_argument('--debug', action='store_true')
-    return parser.parse_args()
+    parser.add_argument('--no-cache', action='store_true', help='always parse the csv file, do not build or read the column cache')
+    parser.add_argument('--compact', action='store_true', help='keep only the used columns in memory, with downcast types')
+    parser.add_argument('--extra-columns', type=str, nargs='*', help='columns kept in addition to the used ones with --compact')
+    parser.add_argument('--figure-cache-mb', type=int, default=256, help='size budget of the shared figure cache')
+    parser.add_argument('--timing-log', type=str, help="file to append one json line of timings per callback call to, '-' for stderr")
+    parser.add_argument('--watch-dir', type=str, help='directory of daily csv files to poll for new data, e.g. the download directory')
+    parser.add_argument('--watch-interval', type=float, default=60, help='seconds between polls of --watch-dir')
+    parser.add_argument('--background-workers', type=int, default=DEFAULT_WORKERS, help='threads running the map renders of each process')
+    parser.add_argument('--jobs-dir', type=str, help='directory of the background job results, shared by the worker processes (default: a new temporary directory)')
+    parser.add_argument('--no-tiles', action='store_true', help='bin the hotspots for the heatmap even when precomputed tiles of the data exist')
+    parser.add_argument('--no-warmup', action='store_true', help='do not render the initial figures at startup, the first page view renders them')
+    return parser.parse_args(argv)
 
 
-def main():
-    args = parse_args()
-    dataset = Dataset(args.hotspots_file_path)
+def startup_panel(loading: bool) -> html.Div:
+    """
+    Progress of the startup, the page reloads itself once the dashboard is ready.
+    Also in the dashboard's layout, without polling, as the callbacks need its components.
+    """
+    return html.Div([
+        html.Div(id='startup-status', children='Starting...' if loading else None),
+        dcc.Interval(id='startup-interval', interval=STARTUP_POLL_INTERVAL, disabled=not loading),
+        dcc.Store(id='startup-ready', data=False),
+        dcc.Store(id='startup-reload'),
+    ])
+
+
+def build_dashboard(app: Dash, args, startup: Startup) -> tuple:
+    """
+    Load the dataset and build the components. Returns (layout, dataset, watcher of --watch-dir
+    that is not started yet).
+    """
+    with startup.phase('deferred imports'):
+        from Dataset import Dataset
+        from DatasetWatcher import DatasetWatcher
+        from TileStore import TileStore
+        from components.box_plot import box_plot
+        from components.filter_panel import filter_panel
+        from components.heatmap import heatmap
+        from components.pie_chart import pie_chart
+        from components.scatter_mapbox import scatter_mapbox
+        from components.trend_line_chart import trend_line_chart
+
+    with startup.phase('dataset'):
+        dataset = Dataset(args.hotspots_file_path, cache=not args.no_cache,
+                          compact=args.compact, extra_columns=args.extra_columns)
+    with startup.phase('tiles'):
+        # tiles written by scripts/build_tiles.py next to the data
+        tile_store = None if args.no_tiles else TileStore.open_for(args.hotspots_file_path, dataset)
+
+    with startup.phase('components'):
+        layout = html.Div([
+            html.H1('CWFIS Wildfire Visualization'),
+            startup_panel(loading=False),
+            # components refresh when the dataset version changes, i.e. new data was appended
+            dcc.Store(id='dataset-version', data=dataset.version),
+            dcc.Interval(id='dataset-version-interval', interval=args.watch_interval * 1000,
+                         disabled=args.watch_dir is None),
+            filter_panel(app, dataset),
+            heatmap(app, dataset, tile_store),
+            scatter_mapbox(app, dataset),
+            trend_line_chart(app, dataset),
+            pie_chart(app, dataset),
+            box_plot(app, dataset),
+        ])
+
+        @app.callback(
+            Output('dataset-version', 'data'),
+            Input('dataset-version-interval', 'n_intervals'),
+            State('dataset-version', 'data'))
+        def update_dataset_version(_n_intervals: int, version: int):
+            # only move forward, workers of a multi-process server may not have appended the same files yet
+            return no_update if version >= dataset.version else dataset.version
+
+    watcher = DatasetWatcher(dataset, args.watch_dir, args.watch_interval) if args.watch_dir is not None else None
+    return layout, dataset, watcher
+
+
+def warm_up(app: Dash, layout: html.Div, startup: Startup):
+    """
+    Render the initial figure of every component as the first page view asks for them, in
+    parallel, so the figure cache (and the background job results) already have them
+    """
+    from plotly.io.json import to_json_plotly
+    from DashClient import DashClient
+
+    with startup.phase('warmup'):
+        client = DashClient(app, layout=json.loads(to_json_plotly(layout)))
+        values = {'filter-state.data': client.call('filter-state.data')['filter-state']['data']}
+        outputs = [dependency['output'] for dependency in client.dependencies
+                   if dependency['output'].endswith('.figure')]
+        with ThreadPoolExecutor(max_workers=len(outputs), thread_name_prefix='warmup') as executor:
+            # a client per thread
+            list(executor.map(lambda output: DashClient(app, client.layout, client.dependencies).call(output, values),
+                              outputs))
+
+
+def cluster_events(dataset, startup: Startup):
+    """
+    Group the hotspots into fire events now instead of on the first chart of them
+    """
+    with startup.phase('events'):
+        dataset.events
+
+
+def create_app(args, background: bool = False) -> tuple[Dash, 'DatasetWatcher | None']:
+    """
+    The app and, with --watch-dir, a watcher of the dataset that is not started yet.
+    With `background`, the dataset is loaded and the components are built on a thread while
+    the app serves a page showing the progress, the watcher is then started by that thread.
+    """
+    startup = Startup()
+    startup.mark('imports')
+    figure_cache.max_bytes = args.figure_cache_mb * 2**20
+    # made before gunicorn forks the workers, so they share it
+    job_manager.directory = args.jobs_dir or tempfile.mkdtemp(prefix='cwfis-jobs-')
+    os.makedirs(job_manager.directory, exist_ok=True)
+    job_manager.workers = args.background_workers
+    # /metrics sums the callback counts of the workers through files next to the jobs
+    callback_metrics.use_directory(job_manager.directory)
 
-    app = Dash()
+    # map renders run as background jobs, so the ones a newer request superseded can be cancelled
+    app = Dash(background_callback_manager=job_manager)
     app.title = 'CWFIS Wildfire Visualization'
-    app.layout = html.Div([
-        html.H1('CWFIS Wildfire Visualization'),
-        heatmap(app, dataset),
-        scatter_mapbox(app, dataset),
-        trend_line_chart(app, dataset),
-        pie_chart(app, dataset),
-        box_plot(app, dataset),
-    ])
+    # set by build_dashboard
+    dashboard = {}
+
+    def serve_layout():
+        if startup.ready:
+            return dashboard['layout']
+        return html.Div([html.H1('CWFIS Wildfire Visualization'), startup_panel(loading=True)])
+    app.layout = serve_layout
+
+    @app.callback(
+        Output('startup-status', 'children'),
+        Output('startup-ready', 'data'),
+        Output('startup-interval', 'disabled'),
+        Input('startup-interval', 'n_intervals'),
+        prevent_initial_call=True)
+    def update_startup_status(_n_intervals: int):
+        status = startup.status()
+        if status['error'] is not None:
+            return f"Startup failed: {status['error']}", False, True
+        if status['ready']:
+            return 'Loading the dashboard...', True, True
+        return f"Starting: {status['phase'] or 'starting'} ({status['elapsed']:.0f}s)", False, False
+
+    app.clientside_callback(
+        'function(ready) { if (ready) { window.location.reload(); } return null; }',
+        Output('startup-reload', 'data'),
+        Input('startup-ready', 'data'),
+        prevent_initial_call=True)
+
+    if args.timing_log is not None:
+        callback_metrics.timing_log = sys.stderr if args.timing_log == '-' else open(args.timing_log, 'a')
+
+    @app.server.route('/ready')
+    def ready():
+        # 200 once the dashboard is served, e.g. for a load balancer's health check
+        status = startup.status()
+        return Response(json.dumps(status), status=200 if status['ready'] else 503, mimetype='application/json')
+
+    @app.server.route('/metrics')
+    def metrics():
+        cache_stats = figure_cache.stats()
+        status = startup.status()
+        # each worker has its own figure cache, labelled with the worker answering the scrape
+        worker = f'worker="{os.getpid()}"'
+        extra = {
+            'cwfis_figure_cache_bytes': ('gauge', 'Serialized size of the cached figures.',
+                                         {worker: cache_stats['bytes']}),
+            'cwfis_figure_cache_entries': ('gauge', 'Cached figures.', {worker: cache_stats['entries']}),
+            'cwfis_figure_cache_evictions_total': ('counter', 'Figures evicted from the cache.',
+                                                   {worker: cache_stats['evictions']}),
+            'cwfis_ready': ('gauge', 'Whether the dashboard is served.', int(status['ready'])),
+            'cwfis_startup_phase_seconds': ('gauge', 'Duration of the phases of the startup.',
+                                            {f'phase="{name}"': seconds for name, seconds in status['phases'].items()}),
+        }
+        dataset = dashboard.get('dataset')
+        if dataset is not None:
+            extra['cwfis_dataset_rows'] = ('gauge', 'Hotspots in the dataset.', len(dataset.df))
+            extra['cwfis_dataset_version'] = ('gauge', 'Version of the dataset, bumped when data is appended.', dataset.version)
+        return Response(callback_metrics.prometheus(extra), mimetype='text/plain; version=0.0.4')
+
+    @app.server.route('/export')
+    def export():
+        # the filtered rows, streamed a chunk at a time, see Export and the README
+        dataset = dashboard.get('dataset')
+        if not startup.ready or dataset is None:
+            return Response('The dashboard is starting, try again later', status=503, mimetype='text/plain')
+        from Export import Export, ExportError
+        try:
+            page = Export(dataset, request.args)
+        except ExportError as err:
+            return Response(str(err), status=err.status, mimetype='text/plain')
+        return Response(page.chunks(), mimetype=page.mimetype, headers=page.headers(request.path, request.args))
+
+    def load():
+        layout, dataset, watcher = build_dashboard(app, args, startup)
+        dashboard.update(layout=layout, dataset=dataset, watcher=watcher)
+        if not args.no_warmup:
+            warm_up(app, layout, startup)
+            if not background:
+                # before gunicorn forks the workers, so they share them
+                cluster_events(dataset, startup)
+        startup.set_ready()
+        if background and not args.no_warmup:
+            # the page does not wait for them, only the fire event counts do
+            cluster_events(dataset, startup)
+
+    if not background:
+        load()
+        return app, dashboard['watcher']
+
+    # build_dashboard registers the component callbacks on this thread, after the server answered
+    # its first request, so Dash's one-time _setup_server (validate_long_callbacks, the `cancel=`
+    # wiring) never sees them: background callbacks must not use `cancel=`, a superseded render
+    # is dropped at its next JobManager checkpoint instead
+    def load_in_background():
+        try:
+            load()
+        except Exception as err:
+            traceback.print_exc()
+            startup.fail(str(err))
+            return
+        if dashboard['watcher'] is not None:
+            dashboard['watcher'].start()
+
+    threading.Thread(target=load_in_background, name='startup', daemon=True).start()
+    return app, None
+
+
+def main():
+    args = parse_args()
+    # the server starts right away, showing the progress until the dashboard is ready
+    app, _ = create_app(args, background=True)
     app.run(port=args.port, debug=args.debug)
 
 
@@ -1,7 +1,12 @@
 from dash import Dash, dcc, html, Input, Output
-import plotly.express as px
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
 
+from CallbackMetrics import callback_metrics, phase, record_rows
 from Dataset import Dataset
+from FigureCache import figure_cache
+from Selection import selection_cache
 
 X_COL_OPTIONS = [
     {'label': 'Fuel', 'value': 'fuel'},
@@ -15,15 +20,94 @@ Y_COL_OPTIONS = [
     {'label': 'Head Fire Intensity', 'value': 'hfi'},
 ]
 
+# outliers shown per group, the smallest and the largest are always kept
+MAX_OUTLIERS_PER_GROUP = 200
+BOX_COLOR = '#636efa'
+
+
+def box_stats(df: pd.DataFrame, x_col: str, y_col: str) -> list[dict]:
+    """
+    Per `x_col` group: quartiles of `y_col` (linear interpolation, as plotly computes them),
+    mean, whiskers (the most extreme values within 1.5 IQR of the box) and a capped sample
+    of the outliers beyond them. Missing values are ignored.
+    """
+    groups = df[x_col]
+    if isinstance(groups.dtype, pd.CategoricalDtype):
+        codes, names = groups.array.codes, groups.cat.categories
+    else:
+        codes, names = pd.factorize(groups)
+    values = df[y_col].to_numpy(dtype=np.float64)
+    valid = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+
+    # one sort puts every group's values in a contiguous, ascending segment
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    counts = np.bincount(codes, minlength=len(names))
+    present = np.flatnonzero(counts)
+    n = counts[present]
+    starts = np.r_[0, np.cumsum(counts)][present]
+
+    def quantile(p: float) -> np.ndarray:
+        pos = starts + p * (n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, starts + n - 1)
+        return values[lo] + (pos - lo) * (values[hi] - values[lo])
+
+    q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    means = np.add.reduceat(values, starts) / n if len(starts) else np.empty(0)
+    rng = np.random.default_rng(0)
+
+    stats = []
+    for i, group in enumerate(present):
+        segment = values[starts[i]:starts[i] + n[i]]
+        iqr = q3[i] - q1[i]
+        lo = np.searchsorted(segment, q1[i] - 1.5 * iqr, side='left')
+        hi = np.searchsorted(segment, q3[i] + 1.5 * iqr, side='right')
+        outliers = np.concatenate([segment[:lo], segment[hi:]])
+        if len(outliers) > MAX_OUTLIERS_PER_GROUP:
+            sample = rng.choice(len(outliers) - 2, MAX_OUTLIERS_PER_GROUP - 2, replace=False) + 1
+            outliers = np.concatenate([outliers[[0, -1]], outliers[np.sort(sample)]])
+        stats.append({
+            'name': str(names[group]),
+            'q1': q1[i], 'median': median[i], 'q3': q3[i], 'mean': means[i],
+            'lowerfence': segment[lo], 'upperfence': segment[hi - 1],
+            'outliers': outliers,
+        })
+    return sorted(stats, key=lambda group_stats: group_stats['name'])
+
+
 def box_plot(app: Dash, dataset: Dataset):
     @app.callback(
         Output('box-plot', 'figure'),
         Input('box-plot-group-col', 'value'),
         Input('box-plot-value-col', 'value'),
+        Input('filter-state', 'data'),
+        Input('dataset-version', 'data'),
     )
-    def update(x_col: str, y_col: str):
-        fig = px.box(dataset.df, x=x_col, y=y_col)
-        fig.update_layout(height=800)
+    @callback_metrics.instrument('box-plot')
+    @figure_cache.memoize('box-plot', dataset)
+    def update(x_col: str, y_col: str, filter_state: dict, _version: int):
+        with phase('filter'):
+            df = selection_cache.get(dataset, filter_state).df
+        record_rows(len(df))
+        # the figure carries the box statistics instead of every value
+        with phase('aggregate'):
+            stats = box_stats(df, x_col, y_col)
+        with phase('figure'):
+            names = [group['name'] for group in stats]
+            fig = go.Figure()
+            fig.add_trace(go.Box(
+                x=names,
+                **{key: [group[key] for group in stats] for key in ('q1', 'median', 'q3', 'mean', 'lowerfence', 'upperfence')},
+                marker_color=BOX_COLOR, name=y_col, hoverinfo='x+y',
+            ))
+            fig.add_trace(go.Scatter(
+                x=np.repeat(names, [len(group['outliers']) for group in stats]),
+                y=np.concatenate([group['outliers'] for group in stats]) if stats else [],
+                mode='markers', marker=dict(color=BOX_COLOR, size=4), name='outliers',
+            ))
+            fig.update_layout(height=800, showlegend=False, xaxis_title=x_col, yaxis_title=y_col)
         return fig
 
     
@@ -0,0 +1,53 @@
+from dash import Dash, dcc, Input, Output, State
+
+from Dataset import Dataset
+
+
+def _marks(dataset: Dataset) -> dict:
+    return {
+        dataset.min_date.toordinal(): dataset.min_date.strftime('%Y-%m-%d'),
+        dataset.max_date.toordinal(): dataset.max_date.strftime('%Y-%m-%d'),
+    }
+
+
+def date_range_slider(app: Dash, dataset: Dataset, slider_id: str):
+    """
+    RangeSlider over the days of the dataset (as ordinals), its bounds follow the dataset
+    when new data is appended
+    """
+    @app.callback(
+        Output(slider_id, 'min'),
+        Output(slider_id, 'max'),
+        Output(slider_id, 'marks'),
+        Output(slider_id, 'value'),
+        Input('dataset-version', 'data'),
+        State(slider_id, 'max'),
+        State(slider_id, 'value'),
+        prevent_initial_call=True,
+    )
+    def refresh(_version: int, old_max_date: int, date_range: list[int]):
+        min_date = dataset.min_date.toordinal()
+        max_date = dataset.max_date.toordinal()
+        [start, end] = date_range
+        # a range that ended on the last day keeps following it
+        if end == old_max_date:
+            end = max_date
+        return min_date, max_date, _marks(dataset), [max(start, min_date), min(end, max_date)]
+
+
+    min_date = dataset.min_date.toordinal()
+    max_date = dataset.max_date.toordinal()
+
+    return dcc.RangeSlider(
+        id=slider_id,
+        min=min_date,
+        max=max_date,
+        step=1,
+        value=[min_date, max_date],
+        marks=_marks(dataset),
+        tooltip={
+            "always_visible": True,
+            "transform": "ordinalToDateStr" # function in assets/utils.js
+        },
+        allowCross=False,
+    )
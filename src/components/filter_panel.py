@@ -0,0 +1,103 @@
+from dash import Dash, dcc, html, no_update, Input, Output, State
+
+from Dataset import Dataset
+from Export import FORMATS, export_query
+from Selection import selection_cache
+from components.date_range_slider import date_range_slider
+
+VIEWPORT_OPTIONS = [
+    {'label': 'Only hotspots in the heatmap view', 'value': 'viewport'},
+]
+
+
+def filter_panel(app: Dash, dataset: Dataset):
+    """
+    Date range, sources, fuels and (optionally) the heatmap view, applied to every component.
+    The filters go to the 'filter-state' store as a key, components get the selected rows
+    from `selection_cache`, where they are computed once per change.
+    """
+    @app.callback(
+        Output('filter-source-checklist', 'options'),
+        Output('filter-source-checklist', 'value'),
+        Output('filter-fuel-checklist', 'options'),
+        Output('filter-fuel-checklist', 'value'),
+        Input('dataset-version', 'data'),
+        State('filter-source-checklist', 'options'),
+        State('filter-source-checklist', 'value'),
+        State('filter-fuel-checklist', 'options'),
+        State('filter-fuel-checklist', 'value'),
+        prevent_initial_call=True)
+    def refresh_checklists(_version: int, source_options: list[dict], sources: list[str],
+                           fuel_options: list[dict], fuels: list[str]):
+        # categories that appeared with new data are added checked
+        new_sources = [s for s in dataset.source_types if s not in {o['value'] for o in source_options}]
+        new_fuels = [f for f in dataset.fuel_types if f not in {o['value'] for o in fuel_options}]
+        return (
+            [{'label': source, 'value': source} for source in dataset.source_types], sources + new_sources,
+            [{'label': fuel, 'value': fuel} for fuel in dataset.fuel_types], fuels + new_fuels,
+        )
+
+
+    @app.callback(
+        Output('filter-state', 'data'),
+        Input('filter-date-range-slider', 'value'),
+        Input('filter-source-checklist', 'value'),
+        Input('filter-fuel-checklist', 'value'),
+        Input('filter-viewport', 'value'),
+        Input('heatmap-viewport', 'data'),
+        Input('dataset-version', 'data'),
+        State('filter-state', 'data'))
+    def update_filter_state(date_range: list[int], sources: list[str], fuels: list[str], viewport: list[str],
+                            heatmap_view: dict, _version: int, current_state: dict | None):
+        filters = {
+            'date_range': date_range,
+            'sources': sorted(sources),
+            'fuels': sorted(fuels),
+            'bounds': heatmap_view['bounds'] if 'viewport' in viewport else None,
+        }
+        state = selection_cache.state(dataset, filters)
+        # e.g. the heatmap moved while the view is not used
+        return no_update if current_state is not None and state['key'] == current_state['key'] else state
+
+    @app.callback(
+        [Output(f'filter-export-{format}', 'href') for format in FORMATS],
+        Input('filter-state', 'data'),
+        prevent_initial_call=True)
+    def update_export_links(state: dict):
+        # the selected rows, from the export route
+        return [f'/export?{export_query(state["filters"], format)}' for format in FORMATS]
+
+    return html.Div([
+        html.H3('Filters'),
+        html.Div([
+            html.H3('Date Range'),
+            date_range_slider(app, dataset, 'filter-date-range-slider'),
+        ]),
+        html.Div([
+            html.H3('Sources'),
+            dcc.Checklist(
+                id='filter-source-checklist',
+                options=[{'label': source,'value': source} for source in dataset.source_types],
+                value=dataset.source_types,
+                inline=True,
+                labelStyle={'margin-right': '12px'},
+            ),
+        ]),
+        html.Div([
+            html.H3('Fuels'),
+            dcc.Checklist(
+                id='filter-fuel-checklist',
+                options=[{'label': fuel, 'value': fuel} for fuel in dataset.fuel_types],
+                value=dataset.fuel_types,
+                inline=True,
+                labelStyle={'margin-right': '12px'},
+            ),
+        ]),
+        dcc.Checklist(id='filter-viewport', options=VIEWPORT_OPTIONS, value=[]),
+        dcc.Store(id='filter-state'),
+        html.Div([
+            'Export the selected hotspots: ',
+            *[html.A(format.upper() if format == 'csv' else format.capitalize(), id=f'filter-export-{format}',
+                     href=None, style={'margin-right': '12px'}) for format in FORMATS],
+        ]),
+    ])
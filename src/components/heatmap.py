@@ -1,8 +1,17 @@
-from datetime import datetime
-from dash import Dash, dcc, html, Input, Output
+from datetime import date
+import functools
+from dash import Dash, ctx, dcc, html, no_update, Input, Output, State
+import pandas as pd
 import plotly.express as px
 
+from CallbackMetrics import callback_metrics, phase, record_rows
 from Dataset import Dataset
+from FigureCache import figure_cache
+from FrameCache import frame_cache
+from JobManager import POLL_INTERVAL, checkpoint
+from Selection import Selection, selection_cache
+from spatial_binning import bin_points, cell_size, viewport
+from TileStore import TileStore
 
 NORTH_AMERICA_MAPBOX_SETTINGS = {
     'center': {"lat": 50, "lon": -100},
@@ -16,73 +25,193 @@ HEATMAP_COLUMN_OPTIONS = [
     {'label': 'Estimated Area', 'value': 'estarea'}
 ]
 
-def heatmap(app: Dash, dataset: Dataset):
+AGGREGATE_TYPE_OPTIONS = [
+    {'label': 'Sum', 'value': 'sum'},
+    {'label': 'Mean', 'value': 'mean'},
+]
+
+PLAYBACK_STEP_OPTIONS = [
+    {'label': 'Off', 'value': 'off'},
+    {'label': 'Daily', 'value': 'day'},
+    {'label': 'Weekly', 'value': 'week'},
+]
+PLAYBACK_STEP_DAYS = {'day': 1, 'week': 7}
+# milliseconds between two frames while playing
+PLAYBACK_INTERVAL = 800
+
+
+def playback_periods(date_range: list[int], step: str) -> list[list[int]]:
+    """
+    [first day, last day] (ordinals) of each frame of a playback over `date_range`
+    """
+    [first_day, last_day] = date_range
+    days = PLAYBACK_STEP_DAYS[step]
+    return [[start, min(start + days - 1, last_day)] for start in range(first_day, last_day + 1, days)]
+
+
+def tiles_for(selection: Selection, tile_store: TileStore | None, zoom: int) -> TileStore | None:
+    """
+    The tile store if it can serve the selection at `zoom`: it has the zoom level, was built from
+    the current data (not before an append) and the filters have no bounds, which tiles only
+    match by whole cells
+    """
+    if tile_store is None or selection.filters['bounds'] is not None or zoom not in tile_store.zooms:
+        return None
+    return tile_store if tile_store.covers(selection.dataset) else None
+
+
+def frame_cells(selection: Selection, tile_store: TileStore | None, period: list[int], col: str,
+                aggregate_type: str, zoom: int) -> pd.DataFrame:
+    """
+    Grid cells of the hotspots of one playback frame, over the whole selection so panning keeps the frame
+    """
+    tiles = tiles_for(selection, tile_store, zoom)
+    if tiles is not None:
+        return tiles.cells(zoom, col, aggregate_type, *period,
+                           sources=selection.filters['sources'], fuels=selection.filters['fuels'])
+    return bin_points(selection.between(*period), col, cell_size(zoom), aggregate_type)
+
+
+def heatmap(app: Dash, dataset: Dataset, tile_store: TileStore | None = None):
+    @app.callback(
+        Output('heatmap-viewport', 'data'),
+        Input('heatmap', 'relayoutData'),
+        State('heatmap-viewport', 'data'))
+    def update_viewport(relayout_data: dict | None, current_view: dict):
+        view = viewport(relayout_data, NORTH_AMERICA_MAPBOX_SETTINGS['zoom'])
+        return no_update if view is None or view == current_view else view
+
+
+    @app.callback(
+        Output('heatmap-playback-frame', 'max'),
+        Output('heatmap-playback-frame', 'value'),
+        Output('heatmap-playback-frame', 'disabled'),
+        Input('heatmap-playback-step', 'value'),
+        Input('filter-state', 'data'),
+        Input('heatmap-playback-interval', 'n_intervals'),
+        State('heatmap-playback-frame', 'value'),
+        State('heatmap-playback-frame', 'max'))
+    def update_playback_frame(step: str, filter_state: dict, _n_intervals: int, frame: int, last_frame: int):
+        if ctx.triggered_id == 'heatmap-playback-interval':
+            # next frame, from the last one back to the first
+            return no_update, (frame + 1) % (last_frame + 1), no_update
+        if step == 'off':
+            return 0, 0, True
+        return len(playback_periods(filter_state['filters']['date_range'], step)) - 1, 0, False
+
+
+    @app.callback(
+        Output('heatmap-playback-interval', 'disabled'),
+        Output('heatmap-playback-button', 'children'),
+        Input('heatmap-playback-button', 'n_clicks'),
+        Input('heatmap-playback-step', 'value'),
+        State('heatmap-playback-interval', 'disabled'),
+        prevent_initial_call=True)
+    def toggle_playback(_n_clicks: int, step: str, paused: bool):
+        if step == 'off' or ctx.triggered_id == 'heatmap-playback-step':
+            return True, 'Play'
+        return (False, 'Pause') if paused else (True, 'Play')
+
+
     @app.callback(
         Output('heatmap', 'figure'),
         Input('heatmap-value-col', 'value'),
-        Input('heatmap-date-range-slider', 'value'),
-        Input('heatmap-source-checklist', 'value'),
-        Input('heatmap-fuel-checklist', 'value'))
-    def update(col: str, date_range: list[int], sources: list[str], fuels: list[str]):
-        [min_date, max_date] = date_range
-        min_date = datetime.fromordinal(min_date)
-        max_date = datetime.fromordinal(max_date)
-        df = dataset.filter(min_date=min_date, max_date=max_date, sources=sources, fuels=fuels)
-        return px.density_mapbox(df, lat='lat', lon='lon', z=col, radius=5,
-                            **NORTH_AMERICA_MAPBOX_SETTINGS,
-                            mapbox_style="open-street-map")
-
-    min_date = dataset.min_date.toordinal()
-    max_date = dataset.max_date.toordinal()
+        Input('heatmap-aggregate-type', 'value'),
+        Input('heatmap-viewport', 'data'),
+        Input('heatmap-playback-step', 'value'),
+        Input('heatmap-playback-frame', 'value'),
+        Input('filter-state', 'data'),
+        Input('dataset-version', 'data'),
+        # a background job, the browser cancels it when it sends newer inputs
+        background=True,
+        interval=POLL_INTERVAL,
+        progress=[Output('heatmap-progress', 'children')],
+        progress_default=[''])
+    @callback_metrics.instrument('heatmap')
+    @figure_cache.memoize('heatmap', dataset)
+    def update(col: str, aggregate_type: str, view: dict, step: str, frame: int, filter_state: dict, _version: int):
+        selection = selection_cache.get(dataset, filter_state)
+        title = None
+        tiles = tiles_for(selection, tile_store, view['zoom'])
+        if step == 'off' and tiles is not None:
+            # the cells of the view are summed from the precomputed tiles, whole cells at its edges
+            checkpoint('Aggregating tiles...')
+            with phase('aggregate'):
+                filters = selection.filters
+                cells = tiles.cells(view['zoom'], col, aggregate_type, *filters['date_range'],
+                                    sources=filters['sources'], fuels=filters['fuels'], bounds=view['bounds'])
+            record_rows(int(cells['count'].sum()))
+        elif step == 'off':
+            checkpoint('Filtering hotspots...')
+            with phase('filter'):
+                df = selection.within(view['bounds'])
+            record_rows(len(df))
+            checkpoint(f'Aggregating {len(df):,} hotspots...')
+            # aggregate on the server, the figure holds one point per grid cell instead of per hotspot
+            with phase('aggregate'):
+                cells = bin_points(df, col, cell_size(view['zoom']), aggregate_type)
+        else:
+            periods = playback_periods(filter_state['filters']['date_range'], step)
+            frame = min(frame, len(periods) - 1)
+            frames = [((filter_state['key'], col, aggregate_type, view['zoom'], *period),
+                       functools.partial(frame_cells, selection, tile_store, period, col, aggregate_type,
+                                         view['zoom']))
+                      for period in periods]
+            # build the following frames in the background, playing and scrubbing then find them built,
+            # replacing the frames prefetched for the same filters only (not those of other sessions)
+            frame_cache.prefetch(frames[frame:] + frames[:frame], owner=filter_state['key'])
+            checkpoint(f'Building frame {frame + 1} of {len(frames)}...')
+            with phase('aggregate'):
+                cells = frame_cache.get(*frames[frame])
+            first_day, last_day = (date.fromordinal(day) for day in periods[frame])
+            title = str(first_day) if first_day == last_day else f'{first_day} to {last_day}'
+        checkpoint('Drawing the heatmap...')
+        with phase('figure'):
+            fig = px.density_mapbox(cells, lat='lat', lon='lon', z=col, radius=5,
+                                **NORTH_AMERICA_MAPBOX_SETTINGS,
+                                mapbox_style="open-street-map")
+            # keep the user's view when the figure is re-rendered
+            fig.update_layout(uirevision='heatmap', title=title)
+        return fig
 
     return html.Div([
         html.H3('Heatmap'),
         html.Div([
-            html.H3("Value"),
-            dcc.Dropdown(
-                id='heatmap-value-col',
-                options=HEATMAP_COLUMN_OPTIONS,
-                value='estarea',
-            ),
-        ]),
-        html.Div([
-            html.H3('Date Range'),
-            dcc.RangeSlider(
-                id='heatmap-date-range-slider',
-                min=min_date,
-                max=max_date,
-                step=1,
-                value=[min_date, max_date],
-                marks={
-                    min_date: dataset.min_date.strftime('%Y-%m-%d'),
-                    max_date: dataset.max_date.strftime('%Y-%m-%d'),
-                },
-                tooltip={
-                    "always_visible": True,
-                    "transform": "ordinalToDateStr" # function in assets/utils.js
-                },
-                allowCross=False,
-            ),
-        ]),
-        html.Div([
-            html.H3('Sources'),
-            dcc.Checklist(
-                id='heatmap-source-checklist',
-                options=[{'label': source,'value': source} for source in dataset.source_types],
-                value=dataset.source_types,
-                inline=True,
-                labelStyle={'margin-right': '12px'},
-            ),
-        ]),
+            html.Div([
+                html.H3("Value"),
+                dcc.Dropdown(
+                    id='heatmap-value-col',
+                    options=HEATMAP_COLUMN_OPTIONS,
+                    value='estarea',
+                ),
+            ], style={'flex': '1', 'margin-right': '12px'}),
+            html.Div([
+                html.H3("Aggregate Type"),
+                dcc.Dropdown(
+                    id='heatmap-aggregate-type',
+                    options=AGGREGATE_TYPE_OPTIONS,
+                    value=AGGREGATE_TYPE_OPTIONS[0]['value'],
+                ),
+            ], style={'flex': '1'}),
+        ], style={'display': 'flex'}),
         html.Div([
-            html.H3('Fuels'),
-            dcc.Checklist(
-                id='heatmap-fuel-checklist',
-                options=[{'label': fuel, 'value': fuel} for fuel in dataset.fuel_types],
-                value=dataset.fuel_types,
-                inline=True,
-                labelStyle={'margin-right': '12px'},
-            ),
-        ]),
+            html.Div([
+                html.H3('Playback'),
+                dcc.Dropdown(
+                    id='heatmap-playback-step',
+                    options=PLAYBACK_STEP_OPTIONS,
+                    value=PLAYBACK_STEP_OPTIONS[0]['value'],
+                    clearable=False,
+                ),
+            ], style={'flex': '1', 'margin-right': '12px'}),
+            html.Button('Play', id='heatmap-playback-button', style={'margin-right': '12px'}),
+            html.Div([
+                dcc.Slider(id='heatmap-playback-frame', min=0, max=0, step=1, value=0, marks=None, disabled=True),
+            ], style={'flex': '3'}),
+        ], style={'display': 'flex', 'align-items': 'flex-end'}),
+        dcc.Interval(id='heatmap-playback-interval', interval=PLAYBACK_INTERVAL, disabled=True),
+        dcc.Store(id='heatmap-viewport',
+                  data={'zoom': NORTH_AMERICA_MAPBOX_SETTINGS['zoom'], 'bounds': None}),
+        html.Div(id='heatmap-progress'),
         dcc.Graph(id='heatmap', style={'height': '80vh'})
     ])
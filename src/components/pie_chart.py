@@ -1,7 +1,10 @@
 from dash import Dash, dcc, html, Input, Output
 import plotly.express as px
 
+from CallbackMetrics import callback_metrics, phase, record_rows
 from Dataset import Dataset
+from FigureCache import figure_cache
+from Selection import selection_cache
 
 GROUP_COL_OPTIONS = [
     {'label': 'Fuel', 'value': 'fuel'},
@@ -10,6 +13,7 @@ GROUP_COL_OPTIONS = [
 
 VALUE_COL_OPTIONS = [
     {'label': 'Number of Hotspots', 'value': 'hotspots'},
+    {'label': 'Number of Fire Events', 'value': 'events'},
     {'label': 'Estimated Area', 'value': 'estarea'},
     {'label': 'Fire Weather Index', 'value': 'fwi'},
     {'label': 'Rate of Spread', 'value': 'ros'},
@@ -21,15 +25,21 @@ def pie_chart(app: Dash, dataset: Dataset):
         Output('pie-chart', 'figure'),
         Input('pie-chart-group-col', 'value'),
         Input('pie-chart-value-col', 'value'),
+        Input('filter-state', 'data'),
+        Input('dataset-version', 'data'),
     )
-    def update(group_col: str, value_col: str):
-        if value_col == 'hotspots':
-            df = dataset.df.groupby(group_col).size().reset_index(name='hotspots')
-        else:
-            df = dataset.df
-        fig = px.pie(df, names=group_col, values=value_col)
-        fig.update_layout(height=800, uniformtext_minsize=12, uniformtext_mode='hide')
-        fig.update_traces(textposition='inside', textinfo='percent+label')
+    @callback_metrics.instrument('pie-chart')
+    @figure_cache.memoize('pie-chart', dataset)
+    def update(group_col: str, value_col: str, filter_state: dict, _version: int):
+        # one total per category from the daily cube, the figure does not carry the rows
+        selection = selection_cache.get(dataset, filter_state)
+        record_rows(selection.row_count())
+        with phase('aggregate'):
+            totals = selection.totals(group_col, value_col)
+        with phase('figure'):
+            fig = px.pie(totals.reset_index(), names=group_col, values=value_col)
+            fig.update_layout(height=800, uniformtext_minsize=12, uniformtext_mode='hide')
+            fig.update_traces(textposition='inside', textinfo='percent+label')
         return fig
 
     
@@ -1,8 +1,12 @@
-from datetime import datetime
-from dash import Dash, dcc, html, Input, Output
+from dash import Dash, dcc, html, no_update, Input, Output, State
 import plotly.express as px
 
+from CallbackMetrics import callback_metrics, phase, record_rows
 from Dataset import Dataset
+from FigureCache import figure_cache
+from JobManager import POLL_INTERVAL, checkpoint
+from Selection import Selection, selection_cache
+from spatial_binning import SAMPLE_CELLS_PER_TILE, cell_size, sample_points, viewport
 
 NORTH_AMERICA_MAPBOX_SETTINGS = {
     'center': {"lat": 50, "lon": -100},
@@ -21,24 +25,61 @@ SCATTER_COLOR_OPTIONS = [
     {'label': 'source', 'value': 'source'},
 ]
 
+# above this many points in view, show the smallest and largest point per grid cell and color instead of all of them
+MAX_FULL_RESOLUTION_POINTS = 20_000
+
+
+def scatter_figure(dataset: Dataset, selection: Selection, value_col: str, color_col: str, view: dict):
+    checkpoint('Filtering hotspots...')
+    with phase('filter'):
+        df = selection.within(view['bounds'])
+    record_rows(len(df))
+    if len(df) > MAX_FULL_RESOLUTION_POINTS:
+        checkpoint(f'Sampling {len(df):,} hotspots...')
+        with phase('aggregate'):
+            df = sample_points(df, value_col, color_col, cell_size(view['zoom'], SAMPLE_CELLS_PER_TILE))
+
+    types = dataset.fuel_types if color_col == 'fuel' else dataset.source_types
+    checkpoint(f'Drawing {len(df):,} hotspots...')
+    with phase('figure'):
+        fig = px.scatter_mapbox(df, lat="lat", lon="lon", size=value_col, size_max=20, color=color_col,
+                        # fixed order, so sampling never changes the color of a category
+                        category_orders={color_col: sorted(types)},
+                        **NORTH_AMERICA_MAPBOX_SETTINGS,
+                        mapbox_style="open-street-map")
+        # keep the user's view when the figure is re-rendered
+        fig.update_layout(uirevision='scatter-mapbox')
+    return fig
+
+
 def scatter_mapbox(app: Dash, dataset: Dataset):
+    @app.callback(
+        Output('scatter-mapbox-viewport', 'data'),
+        Input('scatter-mapbox', 'relayoutData'),
+        State('scatter-mapbox-viewport', 'data'),
+    )
+    def update_viewport(relayout_data: dict | None, current_view: dict):
+        view = viewport(relayout_data, NORTH_AMERICA_MAPBOX_SETTINGS['zoom'])
+        return no_update if view is None or view == current_view else view
+
+
     @app.callback(
         Output('scatter-mapbox', 'figure'),
         Input('scatter-mapbox-value-col', 'value'),
         Input('scatter-mapbox-color-col', 'value'),
-        Input('scatter-mapbox-date-range-slider', 'value'),
+        Input('scatter-mapbox-viewport', 'data'),
+        Input('filter-state', 'data'),
+        Input('dataset-version', 'data'),
+        # a background job, the browser cancels it when it sends newer inputs
+        background=True,
+        interval=POLL_INTERVAL,
+        progress=[Output('scatter-mapbox-progress', 'children')],
+        progress_default=[''],
     )
-    def update(value_col: str, color_col: str, date_range: list[int]):
-        [min_date, max_date] = date_range
-        min_date = datetime.fromordinal(min_date)
-        max_date = datetime.fromordinal(max_date)
-        df = dataset.filter(min_date=min_date, max_date=max_date)
-        return px.scatter_mapbox(df, lat="lat", lon="lon", size=value_col, size_max=20, color=color_col,
-                        **NORTH_AMERICA_MAPBOX_SETTINGS,
-                        mapbox_style="open-street-map")
-
-    min_date = dataset.min_date.toordinal()
-    max_date = dataset.max_date.toordinal()
+    @callback_metrics.instrument('scatter-mapbox')
+    @figure_cache.memoize('scatter-mapbox', dataset)
+    def update(value_col: str, color_col: str, view: dict, filter_state: dict, _version: int):
+        return scatter_figure(dataset, selection_cache.get(dataset, filter_state), value_col, color_col, view)
 
     return html.Div([
         html.H3('Scatter Mapbox'),
@@ -60,24 +101,8 @@ def scatter_mapbox(app: Dash, dataset: Dataset):
                 ),
             ], style={'flex': '1'}),
         ], style={'display': 'flex'}),
-        html.Div([
-            html.H3('Date Range'),
-            dcc.RangeSlider(
-                id='scatter-mapbox-date-range-slider',
-                min=min_date,
-                max=max_date,
-                step=1,
-                value=[min_date, max_date],
-                marks={
-                    min_date: dataset.min_date.strftime('%Y-%m-%d'),
-                    max_date: dataset.max_date.strftime('%Y-%m-%d'),
-                },
-                tooltip={
-                    "always_visible": True,
-                    "transform": "ordinalToDateStr" # function in assets/utils.js
-                },
-                allowCross=False,
-            ),
-        ]),
+        dcc.Store(id='scatter-mapbox-viewport',
+                  data={'zoom': NORTH_AMERICA_MAPBOX_SETTINGS['zoom'], 'bounds': None}),
+        html.Div(id='scatter-mapbox-progress'),
         dcc.Graph(id='scatter-mapbox', style={'height': '80vh'})
     ])
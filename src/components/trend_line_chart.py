@@ -1,7 +1,12 @@
-from dash import Dash, dcc, html, Input, Output
+from dash import Dash, dcc, html, Input, Output, State, no_update
+import pandas as pd
 import plotly.graph_objects as go
 
+from CallbackMetrics import callback_metrics, phase, record_rows
 from Dataset import Dataset
+from FigureCache import figure_cache
+from Selection import selection_cache
+from temporal_binning import downsample, time_bucket, visible_range
 
 GROUP_COL_OPTIONS = [
     {'label': 'All', 'value': 'all'},
@@ -11,6 +16,7 @@ GROUP_COL_OPTIONS = [
 
 VALUE_COL_OPTIONS = [
     {'label': 'Number of Hotspots', 'value': 'hotspots'},
+    {'label': 'Number of Fire Events', 'value': 'events'},
     {'label': 'Estimated Area', 'value': 'estarea'},
     {'label': 'Fire Weather Index', 'value': 'fwi'},
     {'label': 'Rate of Spread', 'value': 'ros'},
@@ -23,73 +29,110 @@ AGGREGATE_TYPE_OPTIONS = [
     {'label': 'Median', 'value': 'median'},
 ]
 
+RESOLUTION_OPTIONS = [
+    {'label': 'Auto', 'value': 'auto'},
+    {'label': 'Daily', 'value': 'day'},
+    {'label': 'Weekly', 'value': 'week'},
+    {'label': 'Monthly', 'value': 'month'},
+]
+BUCKET_TITLES = {'day': 'Daily', 'week': 'Weekly', 'month': 'Monthly'}
+# values that count, the aggregate type does not apply to them
+COUNT_TITLES = {'hotspots': 'hotspots', 'events': 'fire events'}
+
 # daily_count = dataset.df.groupby(dataset.df['rep_date'].dt.date).size()
 # fig.add_trace(
 #     go.Scatter(x=list(daily_count.index), y=list(daily_count.values))
 # )
 
 def trend_line_chart(app: Dash, dataset: Dataset):
+    @app.callback(
+        Output('trend-line-view', 'data'),
+        Input('trend-line-chart', 'relayoutData'),
+        State('trend-line-view', 'data'),
+    )
+    def update_view(relayout_data: dict | None, current_view: dict):
+        view = visible_range(relayout_data)
+        return no_update if view is None or view == current_view else view
+
+
     @app.callback(
         Output('trend-line-chart', 'figure'),
         Input('trend-line-group-col', 'value'),
         Input('trend-line-value-col', 'value'),
         Input('trend-line-aggregate-type', 'value'),
+        Input('trend-line-resolution', 'value'),
+        Input('trend-line-view', 'data'),
+        Input('filter-state', 'data'),
+        Input('dataset-version', 'data'),
     )
-    def update_line_chart(group_col: str, value_col: str, aggregate_type: str):
-        if group_col == 'all':
-            grouped = [('all', dataset.df)]
-        else:
-            grouped = dataset.df.groupby(group_col)
-        
-        fig = go.Figure()
-        for group, df in grouped:
-            daily_group = df.groupby(df['rep_date'].dt.date)
-            if value_col == 'hotspots':
-                daily_value = daily_group.size()
-            else:
-                if aggregate_type == 'sum':
-                    daily_value = daily_group[value_col].sum()
-                elif aggregate_type == 'mean':
-                    daily_value = daily_group[value_col].mean()
-                elif aggregate_type == 'median':
-                    daily_value = daily_group[value_col].median()
-                else:
-                    raise ValueError(f'Invalid aggregate type: {aggregate_type}')
-
-            daily_value = daily_value.fillna(0)
-            fig.add_trace(go.Scatter(x=list(daily_value.index), y=list(daily_value.values), name=group))
-
-        # range slider, ref: https://plotly.com/python/range-slider/
-        fig.update_layout(
-            height=800,
-            xaxis=dict(
-                rangeselector=dict(
-                    buttons=list([
-                        dict(count=1,
-                            label="1m",
-                            step="month",
-                            stepmode="backward"),
-                        dict(count=6,
-                            label="6m",
-                            step="month",
-                            stepmode="backward"),
-                        dict(count=1,
-                            label="YTD",
-                            step="year",
-                            stepmode="todate"),
-                        dict(count=1,
-                            label="1y",
-                            step="year",
-                            stepmode="backward"),
-                        dict(step="all")
-                    ])
-                ),
-                rangeslider=dict(
-                    visible=True
-                ),
-                type="date"
+    @callback_metrics.instrument('trend-line-chart')
+    @figure_cache.memoize('trend-line-chart', dataset)
+    def update_line_chart(group_col: str, value_col: str, aggregate_type: str, resolution: str, view: dict,
+                          filter_state: dict, _version: int):
+        selection = selection_cache.get(dataset, filter_state)
+        record_rows(selection.row_count())
+        # the visible part of the selected dates, all of them when the chart is not zoomed in
+        first_day, last_day = pd.Timestamp(selection.min_date), pd.Timestamp(selection.max_date).floor('D')
+        view_range = None
+        if view and view['range']:
+            view_first, view_last = max(pd.Timestamp(view['range'][0]), first_day), \
+                min(pd.Timestamp(view['range'][1]), last_day)
+            if view_first <= view_last:
+                view_range = [view_first, view_last]
+        bucket = time_bucket(*(view_range or [first_day, last_day])) if resolution == 'auto' else resolution
+
+        # series come from the precomputed (day, fuel, source) cube, not from the rows (except fire events)
+        with phase('aggregate'):
+            bucket_values = selection.series(None if group_col == 'all' else group_col, value_col, aggregate_type,
+                                             bucket)
+            bucket_values = {group: downsample(values.fillna(0), view_range)
+                             for group, values in bucket_values.items()}
+
+        title = f'{BUCKET_TITLES[bucket]} {COUNT_TITLES.get(value_col, f"{aggregate_type} of {value_col}")}'
+        if aggregate_type == 'median' and value_col not in COUNT_TITLES and not selection.exact_median():
+            # large selections: estimated from the cube's median sketches
+            title += ' (approximate)'
+
+        with phase('figure'):
+            fig = go.Figure()
+            for group, values in bucket_values.items():
+                # numpy arrays go to plotly as they are, no python lists of every point
+                fig.add_trace(go.Scatter(x=values.index.to_numpy(), y=values.to_numpy(), name=group))
+
+            # range slider, ref: https://plotly.com/python/range-slider/
+            fig.update_layout(
+                height=800,
+                title=title,
+                # keep the user's zoom while the resolution follows it
+                uirevision=str(filter_state['filters']['date_range']),
+                xaxis=dict(
+                    rangeselector=dict(
+                        buttons=list([
+                            dict(count=1,
+                                label="1m",
+                                step="month",
+                                stepmode="backward"),
+                            dict(count=6,
+                                label="6m",
+                                step="month",
+                                stepmode="backward"),
+                            dict(count=1,
+                                label="YTD",
+                                step="year",
+                                stepmode="todate"),
+                            dict(count=1,
+                                label="1y",
+                                step="year",
+                                stepmode="backward"),
+                            dict(step="all")
+                        ])
+                    ),
+                    rangeslider=dict(
+                        visible=True
+                    ),
+                    type="date"
+                )
             )
-        )
         return fig
 
 
@@ -98,8 +141,8 @@ def trend_line_chart(app: Dash, dataset: Dataset):
         Input('trend-line-value-col', 'value'),
     )
     def update_aggregate_type_options(value_col: str):
-        # disable aggregate type dropdown if value_col is 'hotspots'
-        return value_col == 'hotspots'
+        # disable aggregate type dropdown for counts (hotspots, fire events), they are always summed
+        return value_col in COUNT_TITLES
 
 
     return html.Div([
@@ -128,7 +171,16 @@ def trend_line_chart(app: Dash, dataset: Dataset):
                     options=AGGREGATE_TYPE_OPTIONS,
                     value=AGGREGATE_TYPE_OPTIONS[0]['value'],
                 ),
+            ], style={'flex': '1', 'margin-right': '12px'}),
+            html.Div([
+                html.H3("Resolution"),
+                dcc.Dropdown(
+                    id='trend-line-resolution',
+                    options=RESOLUTION_OPTIONS,
+                    value=RESOLUTION_OPTIONS[0]['value'],
+                ),
             ], style={'flex': '1'}),
         ], style={'display': 'flex'}),
+        dcc.Store(id='trend-line-view', data={'range': None}),
         dcc.Graph(id='trend-line-chart')
     ])
@@ -0,0 +1,25 @@
+# gunicorn settings for wsgi.py, see the README
+import multiprocessing
+import os
+
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+bind = os.environ.get('CWFIS_BIND', '127.0.0.1:24804')
+workers = int(os.environ.get('CWFIS_WORKERS', multiprocessing.cpu_count()))
+# requests served at once by each worker, so a long one (e.g. a page of an export) does not hold
+# up the dashboard's callbacks
+threads = int(os.environ.get('CWFIS_THREADS', 4))
+timeout = 120
+
+# Load the app in the master before forking: the workers then share the memory-mapped
+# column store through the page cache, and the derived index/cube arrays copy-on-write,
+# instead of each worker loading its own copy of the dataset.
+preload_app = True
+
+
+def post_fork(server, worker):
+    # threads do not survive fork, every worker polls the watch directory itself. With a column
+    # store the rows are appended to it once and mapped by every worker, otherwise (--compact,
+    # --no-cache) each worker builds a private copy of all rows on the first append.
+    import wsgi
+    if wsgi.watcher is not None:
+        wsgi.watcher.start()
@@ -0,0 +1,115 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# about this many grid cells across one 256px map tile, i.e. one cell every 4 pixels
+CELLS_PER_TILE = 64
+# cells of sample_points across a tile, one every 16 pixels: about the size of a large marker,
+# so the sampled points still cover the map without most of them overlapping
+SAMPLE_CELLS_PER_TILE = 16
+MIN_ZOOM = 0
+MAX_ZOOM = 14
+
+
+def zoom_level(relayout_data: dict | None, default_zoom: float) -> int:
+    """
+    Integer map zoom from a mapbox graph's relayoutData, panning keeps the same level
+    """
+    zoom = default_zoom
+    if relayout_data and 'mapbox.zoom' in relayout_data:
+        zoom = relayout_data['mapbox.zoom']
+    return int(min(max(math.floor(zoom), MIN_ZOOM), MAX_ZOOM))
+
+
+def cell_size(zoom: int, cells_per_tile: int = CELLS_PER_TILE) -> float:
+    """
+    Grid cell size in degrees for a map zoom level
+    """
+    return 360 / 2**zoom / cells_per_tile
+
+
+def bin_points(df: pd.DataFrame, value_col: str, size: float, aggregate: str = 'sum') -> pd.DataFrame:
+    """
+    Aggregate the points of `df` into a regular lat/lon grid of `size` degrees.
+    Returns one row per non-empty cell: its center (lat, lon), the `aggregate` ('sum' or 'mean')
+    of `value_col` over the cell and the number of points in it. Missing values are ignored.
+    """
+    if aggregate not in ('sum', 'mean'):
+        raise ValueError(f'Invalid aggregate type: {aggregate}')
+
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['lon'].to_numpy(dtype=np.float64)
+    values = df[value_col].to_numpy(dtype=np.float64)
+    valid = ~(np.isnan(lat) | np.isnan(lon) | np.isnan(values))
+    lat, lon, values = lat[valid], lon[valid], values[valid]
+
+    n_cols = int(math.ceil(360 / size))
+    row = np.floor((lat + 90) / size).astype(np.int64)
+    col = np.clip(np.floor((lon + 180) / size).astype(np.int64), 0, n_cols - 1)
+    cells, inverse = np.unique(row * n_cols + col, return_inverse=True)
+
+    counts = np.bincount(inverse, minlength=len(cells))
+    z = np.bincount(inverse, weights=values, minlength=len(cells))
+    if aggregate == 'mean':
+        z = z / np.maximum(counts, 1)
+
+    return pd.DataFrame({
+        'lat': (cells // n_cols + 0.5) * size - 90,
+        'lon': (cells % n_cols + 0.5) * size - 180,
+        value_col: z,
+        'count': counts,
+    })
+
+
+def viewport(relayout_data: dict | None, default_zoom: float) -> dict | None:
+    """
+    Zoom level and bounds [min_lat, max_lat, min_lon, max_lon] of a mapbox graph from its
+    relayoutData, None if the event is not a map move (e.g. autosize). Bounds are None until
+    the map reports them. They are snapped outwards to a quarter of a tile plus a quarter tile
+    of margin, so small pans map to the same viewport and stay covered.
+    """
+    if relayout_data and 'mapbox.zoom' not in relayout_data and 'mapbox._derived' not in relayout_data:
+        return None
+    zoom = zoom_level(relayout_data, default_zoom)
+    derived = (relayout_data or {}).get('mapbox._derived')
+    if not derived or 'coordinates' not in derived:
+        return {'zoom': zoom, 'bounds': None}
+
+    lons = [lon for lon, _ in derived['coordinates']]
+    lats = [lat for _, lat in derived['coordinates']]
+    snap = 360 / 2**zoom / 4
+    return {'zoom': zoom, 'bounds': [
+        (math.floor(min(lats) / snap) - 1) * snap, (math.ceil(max(lats) / snap) + 1) * snap,
+        (math.floor(min(lons) / snap) - 1) * snap, (math.ceil(max(lons) / snap) + 1) * snap,
+    ]}
+
+
+def sample_points(df: pd.DataFrame, value_col: str, group_col: str, size: float) -> pd.DataFrame:
+    """
+    Keep at most two points per grid cell of `size` degrees and `group_col` category: the ones
+    with the largest and the smallest `value_col`, so every category and both extremes of the
+    marker sizes stay visible.
+    """
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['lon'].to_numpy(dtype=np.float64)
+    values = df[value_col].to_numpy(dtype=np.float64)
+    groups = df[group_col]
+    codes = groups.array.codes if isinstance(groups.dtype, pd.CategoricalDtype) else pd.factorize(groups)[0]
+
+    n_cols = int(math.ceil(360 / size))
+    row = np.floor((lat + 90) / size).astype(np.int64)
+    col = np.clip(np.floor((lon + 180) / size).astype(np.int64), 0, n_cols - 1)
+    keys = (row * n_cols + col) * (int(codes.max(initial=0)) + 2) + (codes.astype(np.int64) + 1)
+
+    # sort by key, then by value (missing values last): the first of each key is its smallest
+    # value, the last one before its missing values its largest
+    missing = np.isnan(values)
+    order = np.lexsort((values, missing, keys))
+    sorted_keys = keys[order]
+    if not len(order):
+        return df.iloc[:0]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    present = np.add.reduceat(~missing[order], starts)
+    largest = starts + np.maximum(present - 1, 0)
+    return df.iloc[np.unique(order[np.concatenate([starts, largest])])]
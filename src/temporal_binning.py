@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+# largest visible range, in days, shown with daily / weekly buckets, about 180 points across the chart
+MAX_DAILY_DAYS = 180
+MAX_WEEKLY_DAYS = 180 * 7
+# points kept per trace
+MAX_POINTS = 400
+# of which at most this many outside the visible range (for the range slider)
+MAX_OUTSIDE_POINTS = 100
+
+
+def visible_range(relayout_data: dict | None) -> dict | None:
+    """
+    Visible x range of a date axis graph from its relayoutData, as whole days
+    {'range': [first day, last day]} (ISO dates, inclusive), {'range': None} when the axis is
+    reset to show everything, None if the event does not change the x axis (e.g. autosize)
+    """
+    if not relayout_data:
+        return None
+    if relayout_data.get('xaxis.autorange'):
+        return {'range': None}
+    if 'xaxis.range' in relayout_data:
+        start, end = relayout_data['xaxis.range']
+    elif 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        start, end = relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    else:
+        return None
+    # snapped outwards to whole days, so panning by less than a day maps to the same range
+    first, last = pd.Timestamp(start).floor('D'), pd.Timestamp(end).ceil('D')
+    return {'range': [first.date().isoformat(), last.date().isoformat()]}
+
+
+def time_bucket(first_day: pd.Timestamp, last_day: pd.Timestamp) -> str:
+    """
+    Bucket (see DailyCube.BUCKETS) of a series showing `first_day` to `last_day`
+    """
+    days = (last_day - first_day).days + 1
+    if days <= MAX_DAILY_DAYS:
+        return 'day'
+    if days <= MAX_WEEKLY_DAYS:
+        return 'week'
+    return 'month'
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of `n_out` points of the series (x sorted) picked by Largest-Triangle-Three-Buckets:
+    the first and last points, and from each of n_out - 2 equal buckets in between the point
+    forming the largest triangle with the point picked before it and the mean of the next
+    bucket, so peaks and dips are kept. All indices if there are no more than `n_out` points.
+    """
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])[:n_out]
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_start = end if end < next_end else n - 1
+        mean_x, mean_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        # twice the triangle areas, the constant factor does not change the largest
+        areas = np.abs((x[a] - mean_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y - y[a]))
+        a = start + int(np.argmax(areas))
+        picked[i + 1] = a
+    return picked
+
+
+def downsample(series: pd.Series, view_range: list[pd.Timestamp] | None,
+               max_points: int = MAX_POINTS, max_outside_points: int = MAX_OUTSIDE_POINTS) -> pd.Series:
+    """
+    At most `max_points` points of a date indexed series picked by lttb. Points outside the
+    visible `view_range` ([first, last] or None for all) only get `max_outside_points` of them.
+    """
+    if len(series) <= max_points:
+        return series
+    x = series.index.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    y = series.to_numpy(dtype=np.float64)
+    if view_range is None:
+        return series.iloc[lttb(x, y, max_points)]
+
+    lo = np.searchsorted(x, np.datetime64(view_range[0], 'ns').astype(np.int64), side='left')
+    hi = np.searchsorted(x, np.datetime64(view_range[1], 'ns').astype(np.int64), side='right')
+    before, after = lo, len(x) - hi
+    outside_points = min(max_outside_points, before + after)
+    # share the outside points by the number of points on each side
+    before_points = round(outside_points * before / max(before + after, 1))
+    parts = [
+        lttb(x[:lo], y[:lo], before_points),
+        lo + lttb(x[lo:hi], y[lo:hi], max_points - outside_points),
+        hi + lttb(x[hi:], y[hi:], outside_points - before_points),
+    ]
+    return series.iloc[np.concatenate(parts)]
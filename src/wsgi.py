@@ -0,0 +1,16 @@
+"""
+WSGI entry point, for serving the dashboard from several worker processes with gunicorn:
+
+    CWFIS_APP_ARGS='-f ./hotspots.store' gunicorn -c src/gunicorn.conf.py wsgi:server
+
+CWFIS_APP_ARGS takes the same arguments as app.py (--port and --debug are ignored).
+The dataset is loaded and the initial figures are rendered when this module is imported,
+which gunicorn.conf.py makes happen once in the master process before the workers are forked.
+"""
+import os
+import shlex
+
+from app import create_app, parse_args
+
+app, watcher = create_app(parse_args(shlex.split(os.environ.get('CWFIS_APP_ARGS', ''))))
+server = app.server
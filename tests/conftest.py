@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules are imported like app.py and the scripts import them
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
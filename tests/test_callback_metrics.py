@@ -0,0 +1,55 @@
+import os
+import re
+
+from CallbackMetrics import CallbackMetrics, phase, record_rows
+
+
+def _sample(text: str, name: str) -> float:
+    return float(re.search(rf'^{re.escape(name)} (\S+)$', text, re.MULTILINE).group(1))
+
+
+def _call(metrics: CallbackMetrics, component_id: str, rows: int):
+    @metrics.instrument(component_id)
+    def update():
+        with phase('aggregate'):
+            record_rows(rows)
+    update()
+
+
+def test_scrapes_sum_the_workers(tmp_path):
+    metrics = CallbackMetrics()
+    metrics.use_directory(str(tmp_path))
+    _call(metrics, 'pie-chart', 100)
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # a worker forked after the first call counts only its own calls
+        _call(metrics, 'pie-chart', 10)
+        _call(metrics, 'box-plot', 1)
+        os.write(write, metrics.prometheus().encode())
+        os._exit(0)
+    os.close(write)
+    os.waitpid(pid, 0)
+    with os.fdopen(read) as f:
+        worker_text = f.read()
+    text = metrics.prometheus()
+
+    # every process reports the same totals
+    for scrape in (text, worker_text):
+        assert _sample(scrape, 'cwfis_callback_calls_total{component="pie-chart"}') == 2
+        assert _sample(scrape, 'cwfis_callback_rows_total{component="pie-chart"}') == 110
+        assert _sample(scrape, 'cwfis_callback_calls_total{component="box-plot"}') == 1
+        assert _sample(scrape, 'cwfis_callback_duration_seconds_bucket{component="pie-chart",le="+Inf"}') == 2
+
+
+def test_counts_of_earlier_runs_are_dropped(tmp_path):
+    metrics = CallbackMetrics()
+    metrics.use_directory(str(tmp_path))
+    _call(metrics, 'pie-chart', 100)
+
+    restarted = CallbackMetrics()
+    restarted.use_directory(str(tmp_path))
+    _call(restarted, 'pie-chart', 5)
+
+    assert _sample(restarted.prometheus(), 'cwfis_callback_rows_total{component="pie-chart"}') == 5
@@ -0,0 +1,100 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import DailyCube as daily_cube
+from Dataset import Dataset, typed_hotspots
+from Selection import Selection
+from generate_cwfis import DEFAULT_FUEL_WEIGHTS, DEFAULT_SOURCE_WEIGHTS, FireSimulator, parse_weights
+
+VALUE_COLS = ['estarea', 'fwi', 'ros', 'hfi']
+
+
+@pytest.fixture(scope='module')
+def dataset() -> Dataset:
+    # 30 days of 5000 simulated hotspots, clustered like real detections
+    rng = np.random.default_rng(0)
+    fuels, fuel_weights = parse_weights(DEFAULT_FUEL_WEIGHTS)
+    sources, source_weights = parse_weights(DEFAULT_SOURCE_WEIGHTS)
+    simulator = FireSimulator(rng, 200, 12, 8, fuels, fuel_weights)
+    days = []
+    for day in range(30):
+        days.append(simulator.hotspots(datetime.date(2023, 5, 1) + datetime.timedelta(days=day), 5000, 0.05,
+                                       sources, source_weights))
+        simulator.next_day()
+    return Dataset.from_df(typed_hotspots(pd.concat(days, ignore_index=True)))
+
+
+def _pairs(series: dict[str, pd.Series], expected: pd.Series) -> pd.DataFrame:
+    # (computed, expected) of every (fuel, day)
+    frames = []
+    for fuel, values in series.items():
+        frames.append(pd.DataFrame({'computed': values.to_numpy(), 'expected': expected.loc[fuel].to_numpy(),
+                                    'fuel': fuel}, index=values.index))
+    return pd.concat(frames)
+
+
+def _daily_medians(dataset: Dataset, col: str, interpolation: str | None = None) -> pd.Series:
+    df = dataset.df
+    groups = df.groupby([df['fuel'], df['rep_date'].dt.floor('D')], observed=True)[col]
+    if interpolation is not None:
+        # the lower or higher of the two middle values
+        return groups.quantile(0.5, interpolation=interpolation).dropna()
+    return groups.median().dropna()
+
+
+@pytest.mark.parametrize('col', VALUE_COLS)
+def test_exact_and_auto_medians_match_pandas(dataset, col):
+    expected = _daily_medians(dataset, col)
+    for median in ('exact', 'auto'):
+        pairs = _pairs(dataset.cube.series('fuel', col, 'median', median=median), expected)
+        np.testing.assert_allclose(pairs['computed'], pairs['expected'])
+
+
+@pytest.mark.parametrize('col', VALUE_COLS)
+def test_sketch_median_error_is_bounded(dataset, col):
+    cube = dataset.cube
+    pairs = _pairs(cube.series('fuel', col, 'median', median='approx'), _daily_medians(dataset, col))
+    error = (pairs['computed'] - pairs['expected']).abs()
+
+    # never further than the width of the sketch bins holding the middle values
+    edges = cube.sketch_edges[col]
+    lower, higher = (_pairs(cube.series('fuel', col, 'median'), _daily_medians(dataset, col, interpolation))['expected']
+                     for interpolation in ('lower', 'higher'))
+    first_bin = np.clip(np.searchsorted(edges, lower, side='right') - 1, 0, len(edges) - 2)
+    last_bin = np.clip(np.searchsorted(edges, higher, side='right') - 1, 0, len(edges) - 2)
+    assert (error <= edges[last_bin + 1] - edges[first_bin] + 1e-9).all()
+
+    # and close to it for most days: relative errors of ~1%, 5% for 95% of them
+    relative = (error / pairs['expected'].abs())[pairs['expected'] != 0]
+    assert relative.median() < 0.02
+    assert relative.quantile(0.95) < 0.1
+
+
+def test_auto_median_is_approximate_for_large_selections(dataset, monkeypatch):
+    cube = dataset.cube
+    first_days = {'min_date': datetime.datetime(2023, 5, 1), 'max_date': datetime.datetime(2023, 5, 3)}
+    monkeypatch.setattr(daily_cube, 'EXACT_MEDIAN_MAX_ROWS', 20_000)
+
+    assert cube.exact_median(**first_days)
+    assert not cube.exact_median()
+    for key, values in cube.series('fuel', 'fwi', 'median').items():
+        pd.testing.assert_series_equal(values, cube.series('fuel', 'fwi', 'median', median='approx')[key])
+
+
+@pytest.mark.parametrize('value_col', ['hotspots', 'events'])
+def test_count_totals_are_integers(dataset, value_col):
+    days = dataset.days.astype('datetime64[D]').astype(object)
+    filters = {'date_range': [days[0].toordinal(), days[10].toordinal()], 'sources': dataset.source_types,
+               'fuels': dataset.fuel_types[:2], 'bounds': None}
+    selections = [Selection(dataset, {**filters, 'date_range': [days[0].toordinal(), days[-1].toordinal()],
+                                      'fuels': dataset.fuel_types}),
+                  Selection(dataset, filters), Selection(dataset, {**filters, 'bounds': [50, 60, -130, -100]})]
+    for selection in selections:
+        totals = selection.totals('fuel', value_col)
+        assert totals.dtype == np.int64
+        if value_col == 'hotspots':
+            expected = selection.df['fuel'].value_counts()
+            assert totals.to_dict() == expected[expected > 0].to_dict()
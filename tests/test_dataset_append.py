@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ColumnStore import ColumnStore, ColumnStoreWriter
+from Dataset import MEASURE_COLUMNS, Dataset
+
+
+def _hotspots(day: str, n: int, sources: list[str], seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'lat': rng.uniform(45, 60, n),
+        'lon': rng.uniform(-130, -60, n),
+        'rep_date': pd.Timestamp(day) + pd.to_timedelta(np.sort(rng.integers(0, 86_400, n)), unit='s'),
+        'source': rng.choice(sources, n),
+        'fuel': rng.choice(['C2', 'C3', 'D1'], n),
+        'estarea': rng.exponential(1.0, n),
+        'fwi': rng.uniform(0, 40, n),
+        'ros': rng.uniform(0, 20, n),
+        'hfi': rng.uniform(0, 5000, n),
+    })
+
+
+@pytest.fixture
+def store_path(tmp_path) -> str:
+    path = str(tmp_path / 'hotspots.store')
+    ColumnStoreWriter.write(path, _hotspots('2023-05-01', 1000, ['NOAA', 'UMD'], 0), float32_columns=MEASURE_COLUMNS)
+    return path
+
+
+def _is_mapped(dataset: Dataset) -> bool:
+    # the columns are views of the store's memory maps, not copies
+    def mapped(values: np.ndarray) -> bool:
+        while values is not None and not isinstance(values, np.memmap):
+            values = values.base
+        return values is not None
+    return all(mapped(dataset.df[col].to_numpy()) for col in ('lat', 'rep_date'))
+
+
+def _assert_same_rows(dataset: Dataset, expected: Dataset):
+    pd.testing.assert_frame_equal(dataset.df, expected.df)
+    pd.testing.assert_series_equal(dataset.cube.totals('fuel', 'hotspots'), expected.cube.totals('fuel', 'hotspots'))
+
+
+def test_workers_append_the_same_rows_to_the_store_once(store_path):
+    # two processes serving the store, polling the watch directory at different times
+    first, second = Dataset(store_path), Dataset(store_path)
+    day2, day3 = _hotspots('2023-05-02', 500, ['NOAA', 'MODIS'], 1), _hotspots('2023-05-03', 300, ['UMD'], 2)
+
+    first.append(day2)
+    first.append(day3)
+    second.append(pd.concat([day2, day3], ignore_index=True))
+
+    assert ColumnStore(store_path).num_rows == 1800
+    assert _is_mapped(first) and _is_mapped(second)
+    _assert_same_rows(second, first)
+    # a new category is added after the known ones
+    assert ColumnStore(store_path).meta['columns'][3]['categories'][2:] == ['MODIS']
+    assert len(first.filter(sources=['MODIS'])) == (day2['source'] == 'MODIS').sum()
+    # and the rows are loaded with the store from then on
+    _assert_same_rows(Dataset(store_path), first)
+
+
+def test_lagging_worker_maps_only_the_rows_it_appended(store_path):
+    first, second = Dataset(store_path), Dataset(store_path)
+    day2, day3 = _hotspots('2023-05-02', 500, ['NOAA'], 1), _hotspots('2023-05-03', 300, ['UMD'], 2)
+
+    first.append(pd.concat([day2, day3], ignore_index=True))
+    second.append(day2)
+
+    assert len(second.df) == 1500 and _is_mapped(second)
+    second.append(day3)
+    _assert_same_rows(second, first)
+    assert ColumnStore(store_path).num_rows == 1800
+
+
+def test_different_rows_are_kept_in_memory(store_path):
+    first, second = Dataset(store_path), Dataset(store_path)
+    first.append(_hotspots('2023-05-02', 500, ['NOAA'], 1))
+    other = _hotspots('2023-05-02', 400, ['UMD'], 3)
+
+    second.append(other)
+
+    # the store keeps the rows of the first append
+    assert ColumnStore(store_path).num_rows == 1500
+    assert len(second.df) == 1400 and not _is_mapped(second)
+    pd.testing.assert_frame_equal(second.df.iloc[1000:].reset_index(drop=True),
+                                  other.astype(second.df.dtypes.to_dict()), check_categorical=False)
+
+
+def test_earlier_rows_are_kept_in_memory(store_path):
+    dataset = Dataset(store_path)
+    dataset.append(_hotspots('2023-04-30', 200, ['NOAA'], 1))
+
+    assert ColumnStore(store_path).num_rows == 1000
+    assert len(dataset.df) == 1200 and not _is_mapped(dataset)
+    assert dataset.df['rep_date'].is_monotonic_increasing
+
+
+def test_interrupted_append_is_overwritten(store_path):
+    day2 = _hotspots('2023-05-02', 500, ['NOAA'], 1)
+    # rows written past the row count of meta.json by an append that did not finish
+    with open(f'{store_path}/lat.bin', 'ab') as f:
+        np.full(123, 99.0).tofile(f)
+
+    dataset = Dataset(store_path)
+    dataset.append(day2)
+
+    store = ColumnStore(store_path)
+    assert store.num_rows == 1500
+    np.testing.assert_array_equal(store.read()['lat'].to_numpy()[1000:], day2['lat'].to_numpy())
+
+
+def test_codes_are_widened_for_new_categories(tmp_path):
+    path = str(tmp_path / 'hotspots.store')
+    sources = [f'S{i}' for i in range(127)]
+    ColumnStoreWriter.write(path, _hotspots('2023-05-01', 1000, sources, 0), float32_columns=MEASURE_COLUMNS)
+    assert ColumnStore(path).meta['columns'][3]['codes_dtype'] == 'int8'
+
+    dataset = Dataset(path)
+    dataset.append(_hotspots('2023-05-02', 10, ['NEW'], 1))
+
+    assert ColumnStore(path).meta['columns'][3]['codes_dtype'] == 'int16'
+    assert _is_mapped(dataset)
+    assert len(dataset.filter(sources=['NEW'])) == 10
+    assert len(dataset.filter(sources=['S5'])) == len(Dataset(path).filter(sources=['S5']))
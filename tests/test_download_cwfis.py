@@ -0,0 +1,192 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import download_cwfis
+
+DAY_CSV = 'lat, lon, rep_date, source\n52.1,-120.0,2023/05/01 00:00:08,UMD\n53.7,-117.2,2023/05/01 00:01:13,NOAA\n'
+# the header without the extra spaces, as written by download_day
+WRITTEN_CSV = DAY_CSV.replace(', ', ',')
+
+
+class _Server:
+    """
+    Stand-in for the CWFIS download server: `responses` maps a path to the (status, delay in
+    seconds) of its next requests, the last one repeats. Paths without responses get a day's csv.
+    """
+
+    def __init__(self):
+        self.responses: dict[str, list[tuple[int, float]]] = {}
+        self.requests: list[str] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.requests.append(self.path)
+                responses = server.responses.get(self.path, [(200, 0)])
+                status, delay = responses.pop(0) if len(responses) > 1 else responses[0]
+                # not time.sleep, the tests replace it to skip the backoff
+                threading.Event().wait(delay)
+                body = DAY_CSV.encode() if status == 200 else b'error'
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    # the client timed out and closed the connection
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.httpd.server_port}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+
+    def count(self, filename: str) -> int:
+        return self.requests.count(f'/{filename}')
+
+
+@pytest.fixture
+def server():
+    server = _Server()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # backoff delays, without waiting for them
+    delays = []
+    monkeypatch.setattr(download_cwfis.time, 'sleep', delays.append)
+    return delays
+
+
+def _download(server: _Server, output_dir, days: int = 1, **kwargs) -> dict:
+    first = datetime.date(2023, 5, 1)
+    return download_cwfis.download_hotspots(first, first + datetime.timedelta(days=days - 1), str(output_dir),
+                                            base_url=server.base_url, **kwargs)
+
+
+def _entry(content: str) -> dict:
+    data = content.encode()
+    return {'bytes': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+
+
+def test_downloads_days_with_checksums_in_the_manifest(server, tmp_path):
+    manifest = _download(server, tmp_path, days=2, workers=2)
+
+    assert manifest == {'20230501.csv': _entry(WRITTEN_CSV), '20230502.csv': _entry(WRITTEN_CSV)}
+    with open(tmp_path / 'manifest.json') as f:
+        assert json.load(f) == manifest
+    with open(tmp_path / '20230501.csv') as f:
+        assert f.read() == WRITTEN_CSV
+    assert not any(name.endswith('.part') for name in os.listdir(tmp_path))
+
+
+def test_retries_server_errors_with_backoff(server, tmp_path, sleeps):
+    server.responses['/20230501.csv'] = [(503, 0), (500, 0), (200, 0)]
+
+    manifest = _download(server, tmp_path, retries=3)
+
+    assert server.count('20230501.csv') == 3
+    assert '20230501.csv' in manifest
+    # exponential backoff with up to a second of jitter
+    assert len(sleeps) == 2
+    assert 1 <= sleeps[0] < 2 and 2 <= sleeps[1] < 3
+
+
+def test_gives_up_after_the_retries(server, tmp_path, sleeps):
+    server.responses['/20230501.csv'] = [(502, 0)]
+
+    manifest = _download(server, tmp_path, retries=2)
+
+    assert server.count('20230501.csv') == 3
+    assert manifest == {}
+    assert not os.path.exists(tmp_path / '20230501.csv')
+
+
+def test_skips_days_without_data(server, tmp_path, sleeps):
+    server.responses['/20230502.csv'] = [(404, 0)]
+
+    manifest = _download(server, tmp_path, days=2)
+
+    # not retried, not in the manifest
+    assert server.count('20230502.csv') == 1
+    assert sleeps == []
+    assert list(manifest) == ['20230501.csv']
+
+
+def test_retries_slow_responses_after_the_timeout(server, tmp_path, sleeps):
+    server.responses['/20230501.csv'] = [(200, 1.0), (200, 0)]
+
+    start = time.perf_counter()
+    manifest = _download(server, tmp_path, retries=1, timeout=0.2)
+
+    assert time.perf_counter() - start < 1.0
+    assert server.count('20230501.csv') == 2
+    assert manifest == {'20230501.csv': _entry(WRITTEN_CSV)}
+
+
+def test_resumes_from_the_manifest(server, tmp_path):
+    _download(server, tmp_path, days=2)
+    # an interrupted run: a partial file of a day that was never recorded, and a day whose
+    # file does not match its manifest entry
+    with open(tmp_path / '20230503.csv.part', 'w') as f:
+        f.write('lat,lon\n52.1')
+    with open(tmp_path / '20230502.csv', 'w') as f:
+        f.write('truncated')
+    server.requests.clear()
+
+    manifest = _download(server, tmp_path, days=3)
+
+    assert sorted(server.requests) == ['/20230502.csv', '/20230503.csv']
+    assert manifest == {f'2023050{day}.csv': _entry(WRITTEN_CSV) for day in (1, 2, 3)}
+    with open(tmp_path / '20230503.csv') as f:
+        assert f.read() == WRITTEN_CSV
+    assert not os.path.exists(tmp_path / '20230503.csv.part')
+
+
+def test_downloads_again_files_without_a_matching_checksum(server, tmp_path):
+    _download(server, tmp_path, days=2)
+    # a file of the recorded size with other content, and an entry without a checksum
+    with open(tmp_path / '20230501.csv', 'w') as f:
+        f.write('x' * len(WRITTEN_CSV.encode()))
+    with open(tmp_path / 'manifest.json') as f:
+        manifest = json.load(f)
+    del manifest['20230502.csv']['sha256']
+    with open(tmp_path / 'manifest.json', 'w') as f:
+        json.dump(manifest, f)
+    server.requests.clear()
+
+    manifest = _download(server, tmp_path, days=2)
+
+    assert sorted(server.requests) == ['/20230501.csv', '/20230502.csv']
+    assert manifest == {f'2023050{day}.csv': _entry(WRITTEN_CSV) for day in (1, 2)}
+
+
+def test_closes_the_connections_of_the_pool(server, tmp_path, monkeypatch):
+    connections = []
+    connection = download_cwfis._connection
+    monkeypatch.setattr(download_cwfis, '_connection', lambda *args: connections.append(connection(*args)) or
+                        connections[-1])
+
+    _download(server, tmp_path, days=4, workers=2)
+
+    assert connections
+    # keep-alive sockets of the worker threads, closed when the pool is done
+    assert all(conn.sock is None for conn in connections)
+    assert download_cwfis._open_connections == set()
@@ -0,0 +1,79 @@
+import io
+from urllib.parse import parse_qsl, urlparse
+
+import pandas as pd
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from Dataset import Dataset
+from Export import Export, ExportError
+from test_dataset_append import _hotspots
+
+QUERY = {'format': 'csv', 'min_date': '2023-05-01', 'max_date': '2023-05-31', 'sources': 'NOAA,UMD', 'limit': '300'}
+
+
+def _workers(n: int) -> list[Dataset]:
+    # worker processes forked after loading the same data
+    return [Dataset.from_df(_hotspots('2023-05-01', 1000, ['NOAA', 'UMD'], 0)) for _ in range(n)]
+
+
+def _page(dataset: Dataset, args: dict) -> tuple[pd.DataFrame, dict]:
+    export = Export(dataset, MultiDict(args))
+    headers = export.headers('/export', MultiDict(args))
+    return pd.read_csv(io.BytesIO(b''.join(export.chunks()))), headers
+
+
+def _next_args(headers: dict) -> dict:
+    return dict(parse_qsl(urlparse(headers['Link'][1:headers['Link'].index('>')]).query))
+
+
+def test_pages_of_workers_that_appended_in_other_batches_match():
+    first, second = _workers(2)
+    day2, day3 = _hotspots('2023-05-02', 500, ['NOAA'], 1), _hotspots('2023-05-03', 300, ['UMD'], 2)
+    first.append(day2)
+
+    pages, headers = [], None
+    args = QUERY
+    # each page from another worker, the second one appends both days meanwhile
+    for i in range(10):
+        worker = (first, second)[i % 2]
+        if i == 1:
+            second.append(pd.concat([day2, day3], ignore_index=True))
+        page, headers = _page(worker, args)
+        pages.append(page)
+        if 'Link' not in headers:
+            break
+        args = _next_args(headers)
+
+    assert headers['X-Dataset-Rows'] == '1500'
+    exported = pd.concat(pages, ignore_index=True)
+    expected = first.filter(sources=['NOAA', 'UMD'])
+    assert len(exported) == len(expected) == int(headers['X-Total-Rows'])
+    pd.testing.assert_series_equal(exported['lat'], expected['lat'].reset_index(drop=True), check_dtype=False)
+
+
+def test_lagging_worker_asks_to_retry():
+    first, second = _workers(2)
+    first.append(_hotspots('2023-05-02', 500, ['NOAA'], 1))
+    _, headers = _page(first, QUERY)
+
+    with pytest.raises(ExportError) as err:
+        _page(second, _next_args(headers))
+    assert err.value.status == 503
+
+
+def test_rows_of_earlier_days_restart_the_export():
+    [dataset] = _workers(1)
+    _, headers = _page(dataset, QUERY)
+    dataset.append(_hotspots('2023-04-30', 10, ['NOAA'], 1))
+
+    with pytest.raises(ExportError) as err:
+        _page(dataset, _next_args(headers))
+    assert err.value.status == 409
+
+
+def test_empty_pages_are_rejected():
+    [dataset] = _workers(1)
+    with pytest.raises(ExportError) as err:
+        Export(dataset, MultiDict({**QUERY, 'limit': '0'}))
+    assert err.value.status == 400
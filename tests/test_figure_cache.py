@@ -0,0 +1,29 @@
+import numpy as np
+import plotly.graph_objects as go
+from dash._utils import to_json
+
+from FigureCache import FigureCache, payload_size
+
+
+def _figure(n: int) -> go.Figure:
+    rng = np.random.default_rng(0)
+    return go.Figure(go.Scattermapbox(lat=np.round(rng.uniform(40, 70, n), 5), lon=np.round(rng.uniform(-140, -50, n), 5),
+                                      marker={'size': rng.gamma(1, 0.4, n).astype(np.float32)},
+                                      text=[f'hotspot {i}' for i in range(n)]))
+
+
+def test_payload_size_estimates_the_response_size():
+    for n in (10, 100_000):
+        figure = _figure(n)
+        assert abs(payload_size(figure) / len(to_json(figure)) - 1) < 0.02
+
+
+def test_put_evicts_by_payload_size():
+    figure = _figure(1000)
+    size = payload_size(figure)
+    cache = FigureCache(max_bytes=int(size * 2.5))
+    for key in ('a', 'b', 'c'):
+        assert cache.put((key,), figure) == size
+    assert cache.get(('a',)) is None
+    assert cache.get(('c',)) is figure
+    assert cache.stats()['bytes'] == 2 * size
@@ -0,0 +1,103 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from Dataset import Dataset, typed_hotspots
+from FireEvents import NO_EVENT, FireEvents
+from generate_cwfis import DEFAULT_FUEL_WEIGHTS, DEFAULT_SOURCE_WEIGHTS, FireSimulator, parse_weights
+
+
+def _dataset(df: pd.DataFrame) -> Dataset:
+    return Dataset.from_df(df.assign(source='UMD', fuel='C2'))
+
+
+def _brute_force(events: FireEvents, df: pd.DataFrame) -> np.ndarray:
+    """
+    Events of every pair of rows compared with each other: a later row is linked to an earlier
+    one at most max_gap_days before if the earlier one's cell neighbors its cell, rows of a day
+    if either cell neighbors the other. Numbered by first row, like FireEvents.
+    """
+    lat, lon = df['lat'].to_numpy(dtype=np.float64), df['lon'].to_numpy(dtype=np.float64)
+    day = df['rep_date'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    located = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+    keys = np.zeros(len(df), dtype=np.int64)
+    keys[located] = events._cell_keys(lat[located], lon[located])
+    neighbors = {}
+    for key in np.unique(keys[located]):
+        neighbors[key] = {int(k) for _, batch in events._neighbor_keys(np.array([key])) for k in batch}
+
+    parent = list(range(len(df)))
+
+    def root(i: int) -> int:
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for a in located:
+        for b in located[located > a]:
+            if day[b] - day[a] > events.max_gap_days:
+                continue
+            if keys[a] in neighbors[keys[b]] or (day[a] == day[b] and keys[b] in neighbors[keys[a]]):
+                parent[max(root(a), root(b))] = min(root(a), root(b))
+
+    roots = np.array([root(i) for i in range(len(df))])
+    expected = np.full(len(df), NO_EVENT)
+    expected[located] = np.unique(roots[located], return_inverse=True)[1]
+    return expected
+
+
+def test_events_match_a_pairwise_clustering():
+    # 10 days of hotspots around 12 fires a few km wide, some far enough apart to be events of their own
+    rng = np.random.default_rng(0)
+    n = 400
+    centers = np.column_stack([rng.uniform(50, 51, 12), rng.uniform(-121, -119, 12)])[rng.integers(0, 12, n)]
+    df = pd.DataFrame({
+        'lat': centers[:, 0] + rng.normal(0, 0.02, n),
+        'lon': centers[:, 1] + rng.normal(0, 0.03, n),
+        'rep_date': pd.Timestamp('2023-05-01') + pd.to_timedelta(np.sort(rng.integers(0, 10 * 86_400, n)), unit='s'),
+    })
+    df.loc[rng.choice(n, 10, replace=False), 'lat'] = np.nan
+    dataset = _dataset(df)
+
+    events = FireEvents.build(dataset.df, dataset.days, dataset.day_offsets)
+
+    expected = _brute_force(events, dataset.df)
+    # events of single hotspots and of many
+    assert (events.table['hotspots'] == 1).any() and (events.table['hotspots'] >= 20).sum() >= 5
+    np.testing.assert_array_equal(events.row_events, expected)
+    assert events.table['hotspots'].sum() == n - 10
+
+
+@pytest.fixture(scope='module')
+def simulated() -> Dataset:
+    rng = np.random.default_rng(1)
+    fuels, fuel_weights = parse_weights(DEFAULT_FUEL_WEIGHTS)
+    sources, source_weights = parse_weights(DEFAULT_SOURCE_WEIGHTS)
+    simulator = FireSimulator(rng, 100, 12, 8, fuels, fuel_weights)
+    days = []
+    for day in range(20):
+        days.append(simulator.hotspots(datetime.date(2023, 6, 1) + datetime.timedelta(days=day), 3000, 0.05,
+                                       sources, source_weights))
+        simulator.next_day()
+    return Dataset.from_df(typed_hotspots(pd.concat(days, ignore_index=True)))
+
+
+@pytest.mark.parametrize('split', ['day', 'mid-day'])
+def test_extended_events_match_built_events(simulated, split):
+    df, days, day_offsets = simulated.df, simulated.days, simulated.day_offsets
+    k = len(days) // 2
+    start = int(day_offsets[k]) if split == 'day' else int(day_offsets[k] + day_offsets[k + 1]) // 2
+    # the leading rows as the dataset had them before the append
+    first_days = days[:k] if split == 'day' else days[:k + 1]
+    first_offsets = np.append(day_offsets[:len(first_days)], start)
+
+    events = FireEvents.build(df.iloc[:start], first_days, first_offsets)
+    extended = events.extended(df, days, day_offsets, start)
+    built = FireEvents.build(df, days, day_offsets)
+
+    np.testing.assert_array_equal(extended.row_events, built.row_events)
+    pd.testing.assert_frame_equal(extended.table, built.table)
+    # the events of the leading rows are not changed by the extension
+    assert len(events.row_events) == start
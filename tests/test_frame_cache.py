@@ -0,0 +1,64 @@
+import threading
+import time
+
+from FrameCache import FrameCache
+
+
+def _frames(cache_calls: list, release: threading.Event, name: str, n: int) -> list:
+    def build(i):
+        cache_calls.append((name, i))
+        release.wait(5)
+        return f'{name}_{i}'
+    return [((name, i), lambda i=i: build(i)) for i in range(n)]
+
+
+def test_interleaved_playbacks_do_not_cancel_each_other():
+    # one thread: every frame after the first one waits in the queue until the first is released
+    cache = FrameCache(workers=1)
+    calls, release = [], threading.Event()
+    a, b = _frames(calls, release, 'a', 4), _frames(calls, release, 'b', 4)
+
+    cache.prefetch(a, owner='session a')
+    results = {}
+    waiter = threading.Thread(target=lambda: results.update(a=cache.get(*a[2])))
+    waiter.start()
+    # the second session starts playing while the first one waits for its frame
+    cache.prefetch(b, owner='session b')
+    cache.prefetch(b[1:] + b[:1], owner='session b')
+    release.set()
+    waiter.join(5)
+
+    assert results == {'a': 'a_2'}
+    assert [cache.get(*frame) for frame in b] == ['b_0', 'b_1', 'b_2', 'b_3']
+    # the first session's prefetched frames are all built, none was cancelled
+    assert [cache.get(*frame) for frame in a] == ['a_0', 'a_1', 'a_2', 'a_3']
+    assert len(calls) == 8
+
+
+def test_prefetch_replaces_the_previous_prefetch_of_its_owner():
+    cache = FrameCache(workers=1)
+    calls, release = [], threading.Event()
+    a = _frames(calls, release, 'a', 4)
+    cache.prefetch(a, owner='session')
+    cache.prefetch(a[:1], owner='session')
+    release.set()
+    assert cache.get(*a[0]) == 'a_0'
+    cache._executor.shutdown(wait=True)
+    # frames 1 to 3 were still queued behind frame 0 and were cancelled
+    assert calls == [('a', 0)]
+
+
+def test_waited_frame_survives_clear():
+    cache = FrameCache(workers=1)
+    calls, release = [], threading.Event()
+    a = _frames(calls, release, 'a', 2)
+    cache.prefetch(a, owner='session')
+    results = {}
+    waiter = threading.Thread(target=lambda: results.update(a=cache.get(*a[1])))
+    waiter.start()
+    while ('a', 1) not in cache._waiters:
+        time.sleep(0.001)
+    cache.clear()
+    release.set()
+    waiter.join(5)
+    assert results == {'a': 'a_1'}
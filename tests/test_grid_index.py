@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from GridIndex import GridIndex
+
+
+@pytest.fixture(scope='module')
+def points() -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    return rng.uniform(42, 68, 50_000), rng.uniform(-140, -55, 50_000)
+
+
+def _inside(lat: np.ndarray, lon: np.ndarray, bounds: list[float], rows: slice) -> np.ndarray:
+    min_lat, max_lat, min_lon, max_lon = bounds
+    ids = np.arange(len(lat))[rows]
+    return ids[(lat[rows] >= min_lat) & (lat[rows] <= max_lat) & (lon[rows] >= min_lon) & (lon[rows] <= max_lon)]
+
+
+@pytest.mark.parametrize('bounds', [[49.0, 60.0, -120.0, -110.0], [30.0, 75.0, -150.0, -45.0], [50.5, 50.7, -99, -98.9]])
+@pytest.mark.parametrize('rows', [slice(0, 50_000), slice(20_000, 20_100), slice(10_000, 40_000), slice(5, 5)])
+def test_query_matches_a_scan(points, bounds, rows):
+    # a few rows are tested directly, many through the cells under the bounds
+    lat, lon = points
+    ids = GridIndex(lat, lon).query(bounds, rows)
+    np.testing.assert_array_equal(ids, _inside(lat, lon, bounds, rows))
+
+
+def test_extended_index_matches_a_new_one(points):
+    lat, lon = points
+    index = GridIndex(lat[:30_000], lon[:30_000]).extended(lat, lon)
+    np.testing.assert_array_equal(index.row_ids, GridIndex(lat, lon).row_ids)
+    bounds = [49.0, 60.0, -120.0, -110.0]
+    np.testing.assert_array_equal(index.query(bounds), _inside(lat, lon, bounds, slice(None)))
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from spatial_binning import SAMPLE_CELLS_PER_TILE, cell_size, sample_points
+
+
+def test_sample_keeps_the_smallest_and_largest_point_per_cell_and_category():
+    rng = np.random.default_rng(0)
+    n = 20_000
+    df = pd.DataFrame({
+        'lat': rng.uniform(45, 60, n),
+        'lon': rng.uniform(-130, -60, n),
+        'estarea': rng.exponential(1.0, n),
+        'fuel': pd.Categorical(rng.choice(['C2', 'C3', 'D1'], n)),
+    })
+    df.loc[rng.choice(n, 500, replace=False), 'estarea'] = np.nan
+    size = cell_size(3, SAMPLE_CELLS_PER_TILE)
+
+    sample = sample_points(df, 'estarea', 'fuel', size)
+
+    cells = [np.floor((df['lat'] + 90) / size), np.floor((df['lon'] + 180) / size), df['fuel']]
+    expected = set()
+    for _, values in df.groupby(cells, observed=True)['estarea']:
+        present = values.dropna()
+        # a cell with missing values only keeps one of them
+        expected |= {values.index[0]} if present.empty else {present.idxmin(), present.idxmax()}
+    assert set(sample.index) == expected
+    assert sample.index.is_monotonic_increasing
+    assert len(sample) < n / 5